@@ -1,25 +1,78 @@
+import asyncio
+import contextvars
+import hmac
 import json
+import logging
+import math
+import os
+import signal
+import sqlite3
+import threading
+import time
 
-from fastapi import FastAPI
-from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
 
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict, Field
+
+from . import (
+    background,
+    identity_view,
+    idempotency,
+    llms,
+    objectives,
+    outbox,
+    profiler,
+    scheduler,
+    storage,
+    structured,
+    topics,
+    usage,
+    warmup,
+)
+from . import db
 from .db import init_db
-from .llms import route_call
+from .llms import BudgetExceeded, collect_usage, route_call
 from .memory import (
     DEFAULT_IDENTITY_MODEL,
+    IdentityConflict,
     append_event,
     get_identity_model,
+    get_identity_version,
+    compress_payloads,
     get_recent_events,
+    search,
     set_identity_model,
 )
-from .prompts import DRAFT_SYSTEM, IDENTITY_MODEL_SYSTEM
+from .prompts import DRAFT_SYSTEM, IDENTITY_MODEL_SCHEMA, IDENTITY_MODEL_SYSTEM
 from .publish_gate import check_publishable
+from .tenancy import IdentityMiddleware
 from .voice import canonicalize
 
-# Optional Moltbook
-# from .moltbook import create_post
-
 app = FastAPI(title="Identity Proxy Agent")
+app.add_middleware(IdentityMiddleware)
+
+logger = logging.getLogger(__name__)
+
+# Concurrent identity updates from other workers are retried against the new
+# latest version this many times before the update is dropped. Each attempt is
+# a full ``summarize`` call, so this also bounds the calls per draft.
+IDENTITY_UPDATE_ATTEMPTS = int(os.environ.get("IDENTITY_UPDATE_ATTEMPTS", "3"))
+WAL_CHECKPOINT_INTERVAL_S = 300
+SCHEMA_BACKFILL_INTERVAL_S = 5
+PAYLOAD_MIGRATION_INTERVAL_S = 5
+# Number of request-relevant topic summaries included in the draft prompt.
+DRAFT_TOPIC_CONTEXT = int(os.environ.get("DRAFT_TOPIC_CONTEXT", "3"))
+# Number of top-priority active objectives included in the draft prompt.
+DRAFT_OBJECTIVES_CONTEXT = int(os.environ.get("DRAFT_OBJECTIVES_CONTEXT", "3"))
+# Upper bound on ``candidates`` per /draft request.
+DRAFT_MAX_CANDIDATES = int(os.environ.get("DRAFT_MAX_CANDIDATES", "4"))
+# Candidate i drafts at the configured temperature + i * step, up to the max.
+DRAFT_CANDIDATE_TEMP_STEP = float(os.environ.get("DRAFT_CANDIDATE_TEMP_STEP", "0.2"))
+DRAFT_CANDIDATE_MAX_TEMP = float(os.environ.get("DRAFT_CANDIDATE_MAX_TEMP", "1.0"))
 
 
 class DraftRequest(BaseModel):
@@ -28,6 +81,32 @@ class DraftRequest(BaseModel):
     body: str
     submolt: str | None = None
     publish: bool = False
+    # Draft this many candidates concurrently and keep the first that passes the gate.
+    candidates: int = Field(1, ge=1, le=DRAFT_MAX_CANDIDATES)
+    # Stop drafting further candidates once they have used this many tokens in total.
+    candidate_token_budget: int | None = Field(None, ge=1)
+
+
+class ObjectiveCreate(BaseModel):
+    title: str
+    description: str
+    priority: int = 100
+    proposed_by: str = "user"
+
+
+class ObjectiveUpdate(BaseModel):
+    # Unknown fields, such as the scan-owned ``progress``, are rejected, not ignored.
+    model_config = ConfigDict(extra="forbid")
+
+    title: str | None = None
+    description: str | None = None
+    priority: int | None = None
+    status: str | None = None
+
+
+class ProfileRequest(BaseModel):
+    requests: int | None = Field(None, ge=1)
+    seconds: float | None = Field(None, gt=0)
 
 
 class IdentityResponse(BaseModel):
@@ -36,12 +115,119 @@ class IdentityResponse(BaseModel):
     topic_summaries: list
 
 
+# Milliseconds spent in each startup phase of this worker, for GET /schema.
+STARTUP_TIMINGS: dict[str, float] = {}
+
+
+def _ms_since(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
 @app.on_event("startup")
 def _startup() -> None:
-    init_db()
-    identity = get_identity_model()
-    if identity == DEFAULT_IDENTITY_MODEL:
-        set_identity_model(DEFAULT_IDENTITY_MODEL)
+    started = time.perf_counter()
+    storage.require_sqlite("The server")
+    # Fails startup on an invalid backend configuration.
+    llms.reload()
+    _install_reload_signal()
+    STARTUP_TIMINGS["migrations_applied"] = init_db()
+    STARTUP_TIMINGS["migrate_ms"] = _ms_since(started)
+    phase = time.perf_counter()
+    # Also warms this worker's identity cache for the first request.
+    if get_identity_version()[0] is None:
+        try:
+            set_identity_model(DEFAULT_IDENTITY_MODEL)
+        except IdentityConflict:
+            pass  # another worker seeded it first
+    STARTUP_TIMINGS["seed_ms"] = _ms_since(phase)
+    phase = time.perf_counter()
+    _register_jobs()
+    STARTUP_TIMINGS["jobs_ms"] = _ms_since(phase)
+    STARTUP_TIMINGS["startup_ms"] = _ms_since(started)
+    logger.info("Startup timings: %s", STARTUP_TIMINGS)
+    warmup.start(on_ready=lambda: _record_ready(started))
+
+
+def _record_ready(started: float) -> None:
+    STARTUP_TIMINGS["ready_ms"] = _ms_since(started)
+    logger.info("Ready after %.0f ms", STARTUP_TIMINGS["ready_ms"])
+
+
+def _reload_routes(signum=None, frame=None) -> None:
+    try:
+        llms.reload()
+    except llms.ConfigError as exc:
+        logger.error("Backend configuration reload failed, keeping the old one: %s", exc)
+    else:
+        logger.info("Backend configuration reloaded")
+        warmup.start()
+
+
+def _install_reload_signal() -> None:
+    # Signal handlers can only be installed from the main thread.
+    if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, _reload_routes)
+
+
+def _register_jobs() -> None:
+    if os.environ.get("BACKGROUND_JOBS", "1") != "0":
+        background.register_job(
+            "wal_checkpoint", WAL_CHECKPOINT_INTERVAL_S, background.checkpoint_wal
+        )
+        background.register_job("outbox", outbox.POLL_INTERVAL_S, outbox.deliver_due)
+        background.register_job(
+            "idempotency_gc", idempotency.GC_INTERVAL_S, idempotency.purge_expired
+        )
+        background.register_job("schema_backfills", SCHEMA_BACKFILL_INTERVAL_S, db.run_backfills)
+        background.register_job(
+            "payload_migration", PAYLOAD_MIGRATION_INTERVAL_S, compress_payloads
+        )
+        background.register_job("topics", topics.MAINTAIN_INTERVAL_S, topics.maintain)
+        background.register_job(
+            "topics_cache",
+            topics.CACHE_REFRESH_INTERVAL_S,
+            topics.refresh_cache,
+            leader_only=False,
+        )
+        background.register_job(
+            "objectives_scan", objectives.SCAN_INTERVAL_S, objectives.scan_progress
+        )
+        background.register_job(
+            "objectives_cache",
+            objectives.CACHE_REFRESH_INTERVAL_S,
+            objectives.refresh_cache,
+            leader_only=False,
+        )
+        background.start()
+
+
+@app.on_event("shutdown")
+def _shutdown() -> None:
+    background.stop()
+
+
+@app.exception_handler(BudgetExceeded)
+def _budget_exceeded(request: Request, exc: BudgetExceeded) -> JSONResponse:
+    return JSONResponse(status_code=429, content={"detail": str(exc)})
+
+
+@app.exception_handler(scheduler.Overloaded)
+def _overloaded(request: Request, exc: scheduler.Overloaded) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={
+            "detail": str(exc),
+            "priority": exc.priority,
+            "queue_position": exc.position,
+            "eta_s": exc.eta_s,
+        },
+        headers={"Retry-After": str(max(1, math.ceil(exc.eta_s)))},
+    )
+
+
+@app.exception_handler(scheduler.DeadlineExceeded)
+def _deadline_exceeded(request: Request, exc: scheduler.DeadlineExceeded) -> JSONResponse:
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
 
 def _normalize_identity_model(model: dict) -> dict:
@@ -53,64 +239,495 @@ def _normalize_identity_model(model: dict) -> dict:
 
 
 def _update_identity_model() -> None:
-    events = get_recent_events(40)
-    prev = get_identity_model()
-    messages = [
-        {"role": "system", "content": IDENTITY_MODEL_SYSTEM},
-        {
-            "role": "user",
-            "content": (
-                "Previous identity model (JSON):\n"
-                f"{json.dumps(prev, ensure_ascii=False)}\n\nRecent events:\n{events}"
-                "\n\nUpdate the identity model."
-            ),
-        },
-    ]
-    response = route_call(messages, purpose="summarize").strip()
-    try:
-        new_model = json.loads(response)
-    except json.JSONDecodeError:
-        new_model = prev
-    set_identity_model(_normalize_identity_model(new_model))
+    for _ in range(IDENTITY_UPDATE_ATTEMPTS):
+        parent_id, prev = get_identity_version()
+        events = get_recent_events(40)
+        messages = [
+            {"role": "system", "content": IDENTITY_MODEL_SYSTEM},
+            {
+                "role": "user",
+                "content": (
+                    "Previous identity model (JSON):\n"
+                    f"{json.dumps(prev, ensure_ascii=False)}\n\nRecent events:\n{events}"
+                    "\n\nUpdate the identity model."
+                ),
+            },
+        ]
+        try:
+            response = route_call(
+                messages, purpose="summarize", json_schema=IDENTITY_MODEL_SCHEMA
+            ).strip()
+        except BudgetExceeded:
+            return  # keep the current model until the budget window rolls over
+        try:
+            new_model = structured.parse_response(response, IDENTITY_MODEL_SCHEMA, "summarize")
+        except structured.StructuredOutputError:
+            new_model = prev
+        try:
+            set_identity_model(_normalize_identity_model(new_model), parent_id=parent_id)
+            return
+        except IdentityConflict:
+            continue
 
 
-@app.post("/draft")
-def draft(req: DraftRequest) -> dict:
-    append_event("input", "user", req.model_dump())
+class _CandidateCancelled(Exception):
+    """Another candidate already passed the gate."""
+
 
-    identity_model = get_identity_model()
-    draft_messages = [
+def _draft_context(
+    req: DraftRequest,
+    topic_list: Optional[list[dict]] = None,
+    active_objectives: Optional[list[dict]] = None,
+) -> str:
+    """Topic and objective context for the draft prompt.
+
+    Reads the current shard unless ``topic_list`` and ``active_objectives``
+    (as returned by ``topics.read_topics`` and ``objectives.read_active``)
+    are given.
+    """
+    context = ""
+    if DRAFT_TOPIC_CONTEXT > 0:
+        related = topics.relevant_topics(
+            f"{req.title}\n{req.body}", DRAFT_TOPIC_CONTEXT, topics=topic_list
+        )
+        if related:
+            context = "\n\nRelated topics you have written about:\n" + "\n".join(
+                f"- {t['label']}: {t['summary']}" for t in related
+            )
+    if DRAFT_OBJECTIVES_CONTEXT > 0:
+        if active_objectives is None:
+            active = objectives.get_active_objectives(DRAFT_OBJECTIVES_CONTEXT)
+        else:
+            active = active_objectives[:DRAFT_OBJECTIVES_CONTEXT]
+        if active:
+            context += (
+                "\n\nYour current objectives (consider whether this draft advances any):\n"
+                + "\n".join(f"- {o['title']}: {o['description']}" for o in active)
+            )
+    return context
+
+
+def _draft_messages(
+    req: DraftRequest, identity_model: dict, context: Optional[str] = None
+) -> list[dict]:
+    profiler.mark("context")
+    if context is None:
+        context = _draft_context(req)
+    return [
         {"role": "system", "content": DRAFT_SYSTEM},
         {
             "role": "user",
             "content": (
                 "Identity model (JSON):\n"
-                f"{json.dumps(identity_model, ensure_ascii=False)}"
+                f"{json.dumps(identity_model, ensure_ascii=False)}{context}"
                 f"\n\nWrite a post.\nTitle: {req.title}\nBody:\n{req.body}"
             ),
         },
     ]
-    raw = route_call(draft_messages, purpose="draft").strip()
+
+
+def _draft_and_gate(
+    draft_messages: list[dict],
+    identity_model: dict,
+    temperature: Optional[float] = None,
+    cancelled: Optional[threading.Event] = None,
+) -> tuple[bool, str, str]:
+    scheduler.check_deadline("draft")
+    profiler.mark("draft")
+    raw = route_call(draft_messages, purpose="draft", temperature=temperature).strip()
+    scheduler.check_deadline("voice")
+    if cancelled is not None and cancelled.is_set():
+        raise _CandidateCancelled("voice")
+    profiler.mark("voice")
     final = canonicalize(raw, identity_model["themes"])
 
+    profiler.mark("gate")
     ok, reason = check_publishable(final)
-    append_event("output", "agent", {"ok": ok, "reason": reason, "text": final})
+    return ok, reason, final
+
+
+def _generate(
+    req: DraftRequest, identity_model: dict, context: Optional[str] = None
+) -> tuple[bool, str, str]:
+    """Run the draft -> voice -> gate stages without touching memory.
+
+    ``context`` replaces the prompt context read from the current shard.
+    """
+    return _draft_and_gate(_draft_messages(req, identity_model, context), identity_model)
+
+
+def _generate_candidates(
+    req: DraftRequest, identity_model: dict, count: int
+) -> tuple[bool, str, str, int]:
+    """Draft ``count`` candidates concurrently; return the first that passes
+    the gate as ``(ok, reason, text, candidate index)``.
+
+    Every candidate is logged as a ``candidate`` event. Once one passes, or the
+    token budget is spent, the others stop at their next stage boundary; a
+    backend call already in flight still completes. If none passes, the first
+    blocked candidate is returned.
+    """
+    draft_messages = _draft_messages(req, identity_model)
+    base_temperature = llms.get_route("draft").temperature
+    cancelled = threading.Event()
+
+    def run(index: int) -> tuple[dict, Optional[tuple[bool, str, str]]]:
+        temperature = round(
+            min(base_temperature + index * DRAFT_CANDIDATE_TEMP_STEP, DRAFT_CANDIDATE_MAX_TEMP), 3
+        )
+        record: dict = {"candidate": index, "temperature": temperature}
+        result, error = None, None
+        with collect_usage() as calls:
+            try:
+                result = _draft_and_gate(draft_messages, identity_model, temperature, cancelled)
+            except _CandidateCancelled as exc:
+                record.update(status="cancelled", stage=str(exc))
+            except Exception as exc:  # noqa: BLE001 - re-raised below once logged
+                record.update(status="failed", error=f"{type(exc).__name__}: {exc}"[:300])
+                error = exc
+        if result is not None:
+            ok, reason, final = result
+            record.update(status="passed" if ok else "blocked", reason=reason, text=final)
+        record["tokens"] = sum(call.usage.total_tokens for call in calls)
+        append_event("candidate", "agent", record)
+        if error is not None:
+            raise error
+        return record, result
+
+    pool = ThreadPoolExecutor(max_workers=count, thread_name_prefix="candidate")
+    # Each candidate runs in a copy of this context: shard, deadline and usage.
+    futures = [
+        pool.submit(contextvars.copy_context().run, run, index)
+        for index in range(count)
+    ]
+    spent = 0
+    blocked = None
+    first_error: Optional[BaseException] = None
+    try:
+        for future in as_completed(futures):
+            try:
+                record, result = future.result()
+            except Exception as exc:  # noqa: BLE001 - raised if no candidate succeeds
+                first_error = first_error or exc
+                continue
+            spent += record["tokens"]
+            if result is not None and result[0]:
+                return (*result, record["candidate"])
+            if result is not None and blocked is None:
+                blocked = (*result, record["candidate"])
+            if req.candidate_token_budget is not None and spent >= req.candidate_token_budget:
+                break
+    finally:
+        cancelled.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+    if blocked is not None:
+        return blocked
+    assert first_error is not None
+    raise first_error
 
-    _update_identity_model()
 
-    # Publishing is disabled until Moltbook endpoints are filled.
-    # if req.publish and ok and req.submolt:
-    #     resp = create_post(req.submolt, req.title, final)
-    #     append_event("tool", "moltbook.create_post", resp)
-    #     return {"ok": True, "posted": True, "response": resp, "text": final}
+def _run_draft(req: DraftRequest, update_identity: bool = True) -> dict:
+    """Run the pipeline for one request and log it.
+
+    ``update_identity=False`` leaves the identity update to the caller, which
+    ``bulk`` does once per batch.
+    """
+    profiler.mark("input")
+    append_event("input", "user", req.model_dump())
+
+    if req.candidates > 1:
+        # Each candidate runs in one scheduler slot; the request may hold fewer
+        # slots than it asked for.
+        count = scheduler.granted_slots(req.candidates)
+        ok, reason, final, candidate = _generate_candidates(req, get_identity_model(), count)
+        output = {"ok": ok, "reason": reason, "text": final, "candidate": candidate}
+    else:
+        ok, reason, final = _generate(req, get_identity_model())
+        output = {"ok": ok, "reason": reason, "text": final}
+    scheduler.check_deadline("storing the output")
+    profiler.mark("store")
+    outbox_id = None
+    if req.publish and ok and req.submolt:
+        post = {"submolt": req.submolt, "title": req.title, "body": final}
+        _, outbox_id = outbox.enqueue_output(output, "moltbook", post)
+    else:
+        append_event("output", "agent", output)
+
+    if update_identity:
+        profiler.mark("identity_update")
+        _update_identity_model()
+
+    if outbox_id is not None:
+        return {**output, "queued": True, "outbox_id": outbox_id}
+    return output
+
+
+def _require_admin(token: Optional[str]) -> None:
+    """Check ``token`` against ``ADMIN_TOKEN``; admin surfaces are off without one."""
+    expected = os.environ.get("ADMIN_TOKEN", "")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    if token is None or not hmac.compare_digest(token.removeprefix("Bearer "), expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def _draft_priority(req: DraftRequest, header: Optional[str]) -> str:
+    if header is None:
+        return "publish" if req.publish else "interactive"
+    if header not in scheduler.CLASSES:
+        raise HTTPException(
+            status_code=422, detail=f"X-Draft-Priority must be one of {scheduler.CLASSES}"
+        )
+    return header
+
+
+@app.post("/draft")
+def draft(
+    req: DraftRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    x_draft_priority: Optional[str] = Header(None),
+    x_request_timeout: Optional[float] = Header(None, gt=0),
+    x_profile: Optional[str] = Header(None),
+) -> dict:
+    priority = _draft_priority(req, x_draft_priority)
+    deadline = None if x_request_timeout is None else time.monotonic() + x_request_timeout
+    if x_profile is not None:
+        _require_admin(x_profile)
+
+    def run() -> dict:
+        profile: dict = {}
+        with profiler.request("draft", forced=x_profile is not None, result=profile):
+            profiler.mark("admission")
+            with scheduler.SCHEDULER.slot(priority, deadline, extra=req.candidates - 1):
+                result = _run_draft(req)
+        if x_profile is not None and "path" in profile:
+            response.headers["X-Profile-File"] = profile["path"]
+        return result
+
+    payload = req.model_dump()
+    req_hash = idempotency.request_hash(payload)
+    if idempotency_key:
+        key, store = f"key:{idempotency_key}", True
+    elif idempotency.coalesce_payloads_enabled():
+        key, store = f"payload:{req_hash}", False
+    else:
+        return run()
+
+    try:
+        result, replayed = idempotency.run_once(key, req_hash, run, store=store, deadline=deadline)
+    except idempotency.IdempotencyMismatch as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    except idempotency.StillRunning as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+@app.get("/outbox/{outbox_id}")
+def outbox_status(outbox_id: int) -> dict:
+    status = outbox.get_status(outbox_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown outbox id")
+    return status
+
+
+@app.get("/health")
+def health() -> dict:
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready() -> JSONResponse:
+    """Readiness: every configured backend has been warmed up."""
+    is_ready, backends = warmup.readiness()
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "backends": backends},
+    )
+
+
+@app.get("/schema")
+def schema_status() -> dict:
+    conn = db.get_conn()
+    version = db.schema_version(conn)
+    conn.close()
+    return {
+        "version": version,
+        "latest": db.SCHEMA_VERSION,
+        "pending_backfills": db.pending_backfills(),
+        "startup": STARTUP_TIMINGS,
+    }
+
+
+@app.get("/scheduler")
+def scheduler_stats() -> dict:
+    return scheduler.SCHEDULER.stats()
+
+
+@app.get("/admin/profile")
+def profile_status(authorization: Optional[str] = Header(None)) -> dict:
+    _require_admin(authorization)
+    return profiler.status()
+
+
+@app.post("/admin/profile")
+def arm_profiler(req: ProfileRequest, authorization: Optional[str] = Header(None)) -> dict:
+    _require_admin(authorization)
+    if req.requests is None and req.seconds is None:
+        raise HTTPException(status_code=422, detail="Give requests, seconds or both")
+    return profiler.arm(req.requests, req.seconds)
 
-    return {"ok": ok, "reason": reason, "text": final}
+
+@app.delete("/admin/profile")
+def disarm_profiler(authorization: Optional[str] = Header(None)) -> dict:
+    _require_admin(authorization)
+    return profiler.disarm()
+
+
+@app.get("/admin/identities")
+def list_identities(authorization: Optional[str] = Header(None)) -> dict:
+    _require_admin(authorization)
+    return {"identities": [name for name in db.known_identities() if name is not None]}
+
+
+@app.put("/admin/identities/{name}")
+def create_identity(
+    name: str, response: Response, authorization: Optional[str] = Header(None)
+) -> dict:
+    _require_admin(authorization)
+    if not db.IDENTITY_NAME_RE.match(name):
+        raise HTTPException(status_code=400, detail=f"Invalid identity: {name!r}")
+    created = db.create_identity(name)
+    response.status_code = 201 if created else 200
+    return {"identity": name, "created": created}
+
+
+@app.get("/admin/routes")
+def list_routes(authorization: Optional[str] = Header(None)) -> dict:
+    _require_admin(authorization)
+    return {purpose: route.describe() for purpose, route in llms.routes().items()}
+
+
+@app.post("/admin/routes/reload")
+def reload_routes(authorization: Optional[str] = Header(None)) -> dict:
+    _require_admin(authorization)
+    try:
+        routes = llms.reload()
+    except llms.ConfigError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    # /ready reports the new backends once they are warm.
+    warmup.start()
+    return {purpose: route.describe() for purpose, route in routes.items()}
+
+
+@app.get("/usage")
+def usage_report(hours: int = 24) -> dict:
+    rows = usage.get_rollup(hours)
+    return {
+        "hours": hours,
+        "by_purpose": usage.summarize_by_purpose(rows),
+        "rows": rows,
+        "structured_output": structured.counts(),
+    }
+
+
+@app.get("/search")
+def search_memory(
+    q: str,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    authorization: Optional[str] = Header(None),
+) -> dict:
+    _require_admin(authorization)
+    try:
+        rows = search(q, limit=limit, offset=offset)
+    except sqlite3.OperationalError as exc:
+        raise HTTPException(status_code=503, detail=f"Search unavailable: {exc}") from exc
+    next_offset = offset + limit if len(rows) == limit else None
+    # Inputs are indexed as received, so they may hold secrets the gate blocks.
+    results = [row for row in rows if check_publishable(row.pop("content"))[0]]
+    return {"query": q, "results": results, "offset": offset, "next_offset": next_offset}
+
+
+@app.get("/objectives")
+def list_objectives(status: str = "active", limit: int = Query(20, ge=1, le=100)) -> dict:
+    return {"objectives": objectives.list_objectives(status=status, limit=limit)}
+
+
+@app.post("/objectives")
+def create_objective(req: ObjectiveCreate) -> dict:
+    objective_id = objectives.add_objective(
+        req.title, req.description, priority=req.priority, proposed_by=req.proposed_by
+    )
+    return objectives.get_objective(objective_id)
+
+
+@app.patch("/objectives/{objective_id}")
+def patch_objective(objective_id: int, req: ObjectiveUpdate) -> dict:
+    try:
+        updated = objectives.update_objective(objective_id, **req.model_dump(exclude_none=True))
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+    if updated is None:
+        raise HTTPException(status_code=404, detail="Unknown objective id")
+    return updated
+
+
+async def _identity_snapshot() -> identity_view.Snapshot:
+    snapshot = identity_view.cached_snapshot()
+    if snapshot is None:
+        snapshot = await run_in_threadpool(identity_view.snapshot)
+    return snapshot
 
 
 @app.get("/identity", response_model=IdentityResponse)
-def identity() -> IdentityResponse:
-    return IdentityResponse(
-        identity_model=get_identity_model(),
-        active_objectives=[],
-        topic_summaries=[],
+async def identity(
+    wait: float = Query(0, ge=0, le=identity_view.STREAM_MAX_S),
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """Current identity. With ``wait``, a matching ``If-None-Match`` long-polls
+    for up to ``wait`` seconds before answering ``304``."""
+    snapshot = await _identity_snapshot()
+    deadline = time.monotonic() + wait
+    while identity_view.etag_matches(if_none_match, snapshot.etag) and time.monotonic() < deadline:
+        await asyncio.sleep(identity_view.STREAM_POLL_INTERVAL_S)
+        snapshot = await _identity_snapshot()
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if identity_view.etag_matches(if_none_match, snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+
+@app.get("/identity/stream")
+async def identity_stream(
+    request: Request,
+    timeout: float = Query(identity_view.STREAM_MAX_S, gt=0, le=identity_view.STREAM_MAX_S),
+    last_event_id: Optional[str] = Header(None),
+) -> StreamingResponse:
+    """Server-sent events: the current identity, then each new version.
+
+    The stream ends after ``timeout`` seconds; clients reconnect with
+    ``Last-Event-ID`` and only get a snapshot if it changed meanwhile.
+    """
+
+    async def events():
+        sent = last_event_id
+        deadline = time.monotonic() + timeout
+        last_write = time.monotonic()
+        while time.monotonic() < deadline and not await request.is_disconnected():
+            snapshot = await _identity_snapshot()
+            if snapshot.etag != sent:
+                sent = snapshot.etag
+                last_write = time.monotonic()
+                yield identity_view.sse_event(snapshot)
+            elif time.monotonic() - last_write >= identity_view.STREAM_KEEPALIVE_S:
+                last_write = time.monotonic()
+                yield b": keepalive\n\n"
+            await asyncio.sleep(identity_view.STREAM_POLL_INTERVAL_S)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"}
     )
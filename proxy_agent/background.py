@@ -0,0 +1,173 @@
+"""Background maintenance jobs with single-leader election across workers.
+
+Every uvicorn worker runs the same job loop, but each job tick first takes a
+named lease in the shared database. Only the lease holder runs the job; if it
+dies, the lease expires and another worker takes over. Jobs run once per
+hosted identity, with leases held in that identity's own shard.
+
+A lease is renewed in the background while its job runs, so a job may run
+longer than the lease TTL. If a renewal fails the lease has passed to another
+worker; long jobs check ``lease_held()`` between units of work and stop.
+"""
+
+import contextvars
+import logging
+import os
+import socket
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .db import get_conn, known_identities, use_identity
+
+logger = logging.getLogger(__name__)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+POLL_INTERVAL_S = 1.0
+
+
+def acquire_lease(name: str, ttl_s: float, holder: str = WORKER_ID) -> bool:
+    """Take or renew the lease ``name``. Returns True if ``holder`` now owns it."""
+    now = time.time()
+    conn = get_conn()
+    cur = conn.execute(
+        """
+        INSERT INTO leases(name, holder, expires) VALUES(?,?,?)
+        ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires=excluded.expires
+        WHERE leases.holder = excluded.holder OR leases.expires < ?
+        """,
+        (name, holder, now + ttl_s, now),
+    )
+    conn.commit()
+    acquired = cur.rowcount == 1
+    conn.close()
+    return acquired
+
+
+def release_lease(name: str, holder: str = WORKER_ID) -> None:
+    conn = get_conn()
+    conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+    conn.commit()
+    conn.close()
+
+
+_lease_lost: ContextVar[Optional[threading.Event]] = ContextVar("lease_lost", default=None)
+
+
+def lease_held() -> bool:
+    """False once the running job's lease was lost to another worker."""
+    lost = _lease_lost.get()
+    return lost is None or not lost.is_set()
+
+
+def _keep_lease(name: str, ttl_s: float, done: threading.Event, lost: threading.Event) -> None:
+    while not done.wait(ttl_s / 3):
+        if not acquire_lease(name, ttl_s):
+            logger.warning("Lost lease %s while its job was running", name)
+            lost.set()
+            return
+
+
+def _run_leased(job: "Job", ttl_s: float) -> None:
+    """Run ``job`` while a thread keeps renewing its lease."""
+    name = f"job:{job.name}"
+    done, lost = threading.Event(), threading.Event()
+    # The renewer runs in a copy of this context so it renews in the same shard.
+    keeper = threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(_keep_lease, name, ttl_s, done, lost),
+        name=f"lease-{job.name}",
+        daemon=True,
+    )
+    token = _lease_lost.set(lost)
+    keeper.start()
+    try:
+        job.fn()
+    finally:
+        done.set()
+        keeper.join()
+        _lease_lost.reset(token)
+
+
+@dataclass
+class Job:
+    name: str
+    interval_s: float
+    fn: Callable[[], None]
+    next_run: float = 0.0
+    leader_only: bool = True
+
+
+_JOBS: dict[str, Job] = {}
+_stop = threading.Event()
+_thread: threading.Thread | None = None
+
+
+def register_job(
+    name: str, interval_s: float, fn: Callable[[], None], leader_only: bool = True
+) -> None:
+    """Run ``fn`` every ``interval_s`` seconds for each identity.
+
+    ``leader_only=False`` runs it in every worker, e.g. to refresh
+    process-local caches.
+    """
+    _JOBS[name] = Job(
+        name, interval_s, fn, next_run=time.monotonic() + interval_s, leader_only=leader_only
+    )
+
+
+def run_due_jobs() -> None:
+    now = time.monotonic()
+    due = [job for job in _JOBS.values() if job.next_run <= now]
+    for job in due:
+        job.next_run = now + job.interval_s
+    if not due:
+        return
+    for identity in known_identities():
+        with use_identity(identity):
+            for job in due:
+                # The lease outlives one interval so the leader keeps it between ticks.
+                ttl_s = job.interval_s * 2 + POLL_INTERVAL_S
+                if job.leader_only and not acquire_lease(f"job:{job.name}", ttl_s=ttl_s):
+                    continue
+                try:
+                    if job.leader_only:
+                        _run_leased(job, ttl_s)
+                    else:
+                        job.fn()
+                except Exception:  # noqa: BLE001 - one failing job must not stop the loop
+                    logger.exception("Background job %s failed for %s", job.name, identity)
+
+
+def _loop() -> None:
+    while not _stop.wait(POLL_INTERVAL_S):
+        try:
+            run_due_jobs()
+        except Exception:  # noqa: BLE001
+            logger.exception("Background job loop failed")
+
+
+def start() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="background-jobs", daemon=True)
+    _thread.start()
+
+
+def stop() -> None:
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+    _thread = None
+
+
+def checkpoint_wal() -> None:
+    """Fold the WAL back into the main DB file so it does not grow unbounded."""
+    conn = get_conn()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
@@ -0,0 +1,194 @@
+"""Run draft requests in bulk, in-process, without the HTTP layer.
+
+Reads one ``DraftRequest`` JSON object per line from a file or stdin and runs
+each through the same pipeline as ``POST /draft``. Results are appended to a
+JSONL file as they complete, one line per input line::
+
+    python -m proxy_agent.bulk requests.jsonl --output results.jsonl \\
+        --concurrency 8 --backend-limit ollama=2 --identity-every 10
+
+The output file doubles as the checkpoint: a rerun with the same input skips
+every line that already has a result. Lines whose draft failed are tried
+again, so a line can have several results; the last one counts. The identity
+model is updated once every ``--identity-every`` drafts and at the end, not
+after each request. A failed update is logged and tried again at the next
+batch, so it never stops the run.
+"""
+
+import argparse
+import contextvars
+import json
+import logging
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, TextIO
+
+from pydantic import ValidationError
+
+from . import db, llms, storage
+from .app import DraftRequest, _run_draft, _update_identity_model
+
+logger = logging.getLogger(__name__)
+
+# Drafts per identity update. The update reads the last 40 events, and each
+# draft logs at least two, so larger batches would leave drafts unseen.
+DEFAULT_IDENTITY_EVERY = 10
+# Prefix of the error recorded for lines that are not a valid request. Those
+# are final; any other error is retried by the next run.
+INVALID_REQUEST = "Invalid request"
+
+
+def completed_lines(output: Path) -> set[int]:
+    """Input line numbers that already have a final result in ``output``.
+
+    Draft errors are not final, so those lines run again. A partial last line
+    left by a crash is cut off so appends stay valid JSONL.
+    """
+    if not output.exists():
+        return set()
+    done = set()
+    with open(output, "rb+") as fh:
+        data = fh.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            fh.truncate(end)
+    for line in data[:end].decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+            if not str(record.get("error", INVALID_REQUEST)).startswith(INVALID_REQUEST):
+                continue
+            done.add(record["line"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            continue
+    return done
+
+
+def _draft_one(number: int, req: DraftRequest) -> dict:
+    try:
+        return {"line": number, **_run_draft(req, update_identity=False)}
+    except Exception as exc:  # noqa: BLE001 - recorded per line, the run continues
+        return {"line": number, "error": f"{type(exc).__name__}: {exc}"}
+
+
+def _requests(
+    lines: Iterable[str], skip: set[int]
+) -> Iterator[tuple[int, Optional[DraftRequest], dict]]:
+    """Yield ``(line number, request, error record)``; one of the last two is set."""
+    for number, line in enumerate(lines, start=1):
+        if number in skip or not line.strip():
+            continue
+        try:
+            yield number, DraftRequest.model_validate_json(line), {}
+        except ValidationError as exc:
+            yield number, None, {"line": number, "error": f"{INVALID_REQUEST}: {exc.errors()}"}
+
+
+def _try_identity_update() -> bool:
+    try:
+        _update_identity_model()
+    except Exception:  # noqa: BLE001 - retried at the next batch
+        logger.exception("Identity update failed; retrying after the next batch")
+        return False
+    return True
+
+
+def run_bulk(
+    lines: Iterable[str],
+    output: Path,
+    concurrency: int = 8,
+    identity_every: int = DEFAULT_IDENTITY_EVERY,
+) -> dict:
+    """Draft every request in ``lines`` not yet in ``output``. Returns counts."""
+    counts = {"drafted": 0, "blocked": 0, "errors": 0, "skipped": 0}
+    skip = completed_lines(output)
+    counts["skipped"] = len(skip)
+    # Drafts since the last successful identity update.
+    since_update = 0
+
+    def write(out: TextIO, record: dict) -> None:
+        nonlocal since_update
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        if "error" in record:
+            counts["errors"] += 1
+            return
+        counts["drafted"] += 1
+        counts["blocked"] += 0 if record["ok"] else 1
+        since_update += 1
+        if since_update % identity_every == 0 and _try_identity_update():
+            since_update = 0
+
+    pending: set[Future] = set()
+    with open(output, "a", encoding="utf-8") as out, ThreadPoolExecutor(
+        max_workers=concurrency, thread_name_prefix="bulk"
+    ) as pool:
+        try:
+            for number, req, error in _requests(lines, skip):
+                if req is None:
+                    write(out, error)
+                    continue
+                # Reading ahead of the workers is bounded, so stdin can be endless.
+                while len(pending) >= concurrency * 2:
+                    for future in wait(pending, return_when=FIRST_COMPLETED).done:
+                        pending.discard(future)
+                        write(out, future.result())
+                # Each draft runs in a copy of this context, so it uses our shard.
+                pending.add(pool.submit(contextvars.copy_context().run, _draft_one, number, req))
+        finally:
+            # Drafts already submitted are paid for; record them even if the
+            # run stops early, so a rerun does not draft them again.
+            for future in wait(pending).done:
+                write(out, future.result())
+    if since_update:
+        _try_identity_update()
+    return counts
+
+
+def _parse_limits(pairs: list[str]) -> dict[str, int]:
+    limits = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep or not value.isdigit() or int(value) < 1:
+            raise argparse.ArgumentTypeError(f"Expected BACKEND=N, got {pair!r}")
+        limits[name] = int(value)
+    return limits
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m proxy_agent.bulk")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL requests, - for stdin")
+    parser.add_argument("--output", type=Path, required=True, help="JSONL results (appended)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--backend-limit", action="append", default=[], metavar="BACKEND=N",
+        help="max concurrent calls to one backend",
+    )
+    parser.add_argument("--identity-every", type=int, default=DEFAULT_IDENTITY_EVERY)
+    parser.add_argument("--identity", help="identity to draft for (default: the default one)")
+    parser.add_argument("--db", type=Path, help="database of the default identity")
+    args = parser.parse_args(argv)
+
+    if args.db is not None:
+        db.DB_PATH = args.db
+    if not db.identity_exists(args.identity):
+        parser.error(f"unknown identity {args.identity!r}")
+    try:
+        storage.require_sqlite("bulk")
+    except ValueError as exc:
+        parser.error(str(exc))
+    db.init_db()
+    llms.reload()
+    llms.limit_backends(_parse_limits(args.backend_limit))
+
+    with db.use_identity(args.identity):
+        if args.input == "-":
+            counts = run_bulk(sys.stdin, args.output, args.concurrency, args.identity_every)
+        else:
+            with open(args.input, encoding="utf-8") as fh:
+                counts = run_bulk(fh, args.output, args.concurrency, args.identity_every)
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,140 @@
+import json
+import os
+import re
 import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Callable, Iterator, Optional
 
+# Database of the default identity (requests that do not select one).
 DB_PATH = Path("agent.db")
+# One SQLite shard per named identity lives in this directory.
+DATA_DIR = Path(os.environ.get("AGENT_DATA_DIR", "identities"))
+MAX_OPEN_SHARDS = int(os.environ.get("AGENT_MAX_OPEN_SHARDS", "64"))
 
+# Seconds a connection waits on a lock held by another worker before raising
+# "database is locked".
+BUSY_TIMEOUT_S = float(os.environ.get("AGENT_DB_BUSY_TIMEOUT", "30"))
 
-def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+SEARCH_BACKFILL_SCOPE = "search_backfill"
+PAYLOAD_MIGRATION_SCOPE = "payloads:watermark"
+
+IDENTITY_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+current_identity: ContextVar[Optional[str]] = ContextVar("current_identity", default=None)
+
+
+class UnknownIdentity(LookupError):
+    """The identity has no shard yet; it must be created with ``create_identity``."""
+
+
+@dataclass
+class Shard:
+    """Per-identity state: where its database lives and its in-process caches."""
+
+    identity: Optional[str]
+    path: Path
+    cache: dict = field(default_factory=dict)
+
+
+_shards: "OrderedDict[str, Shard]" = OrderedDict()
+_shards_lock = threading.Lock()
+
+
+def shard_path(identity: Optional[str]) -> Path:
+    if identity is None:
+        return DB_PATH
+    if not IDENTITY_NAME_RE.match(identity):
+        raise ValueError(f"Invalid identity name: {identity!r}")
+    return DATA_DIR / f"{identity}.db"
+
+
+def identity_exists(identity: Optional[str]) -> bool:
+    return identity is None or shard_path(identity).exists()
+
+
+def create_identity(identity: str) -> bool:
+    """Create the shard of ``identity``. Returns False if it already existed."""
+    path = shard_path(identity)
+    if path.exists():
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    init_db(path)
+    return True
+
+
+def current_shard() -> Shard:
+    """Return the shard of the current identity, opening it on first use.
+
+    Shards are kept in an LRU; evicting one only drops its caches, the next
+    access re-opens it. A named identity must have been created first.
+    """
+    identity = current_identity.get()
+    path = shard_path(identity)
+    key = str(path)
+    with _shards_lock:
+        shard = _shards.get(key)
+        if shard is not None:
+            _shards.move_to_end(key)
+            return shard
+    if identity is not None:
+        if not path.exists():
+            raise UnknownIdentity(identity)
+        init_db(path)
+    shard = Shard(identity, path)
+    with _shards_lock:
+        shard = _shards.setdefault(key, shard)
+        _shards.move_to_end(key)
+        while len(_shards) > MAX_OPEN_SHARDS:
+            _shards.popitem(last=False)
+    return shard
+
+
+@contextmanager
+def use_identity(identity: Optional[str]) -> Iterator[Shard]:
+    token = current_identity.set(identity)
+    try:
+        yield current_shard()
+    finally:
+        current_identity.reset(token)
+
+
+def known_identities() -> list[Optional[str]]:
+    """The default identity plus every identity with a shard on disk."""
+    identities: list[Optional[str]] = [None]
+    if DATA_DIR.is_dir():
+        identities.extend(sorted(p.stem for p in DATA_DIR.glob("*.db")))
+    return identities
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_S)
     conn.row_factory = sqlite3.Row
     return conn
 
 
-def init_db() -> None:
-    conn = get_conn()
-    cur = conn.cursor()
+def get_conn() -> sqlite3.Connection:
+    return _connect(current_shard().path)
+
+
+def _column_names(cur: sqlite3.Cursor, table: str) -> set[str]:
+    return {row["name"] for row in cur.execute(f"PRAGMA table_info({table})")}
+
+
+def _m001_core(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_backfills(
+            name TEXT PRIMARY KEY,
+            created_ts TEXT NOT NULL,
+            finished_ts TEXT
+        )"""
+    )
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS events(
@@ -46,5 +168,313 @@ def init_db() -> None:
             model_json TEXT NOT NULL
         )"""
     )
-    conn.commit()
+
+
+def _m002_identity_parent(cur: sqlite3.Cursor) -> None:
+    if "parent_id" not in _column_names(cur, "identity_models"):
+        cur.execute("ALTER TABLE identity_models ADD COLUMN parent_id INTEGER")
+    # Each version has at most one successor; concurrent updates cannot fork history.
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_identity_models_parent "
+        "ON identity_models(parent_id)"
+    )
+
+
+def _m003_leases(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS leases(
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires REAL NOT NULL
+        )"""
+    )
+
+
+def _m004_outbox(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL,
+            destination TEXT NOT NULL,
+            payload_json TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            last_error TEXT,
+            response_json TEXT,
+            created_ts TEXT NOT NULL,
+            updated_ts TEXT NOT NULL
+        )"""
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt)"
+    )
+
+
+def _m005_idempotency_keys(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys(
+            key TEXT PRIMARY KEY,
+            request_hash TEXT NOT NULL,
+            status TEXT NOT NULL,
+            response_json TEXT,
+            expires REAL NOT NULL
+        )"""
+    )
+
+
+def _m006_usage_rollup(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS usage_rollup(
+            hour TEXT NOT NULL,
+            purpose TEXT NOT NULL,
+            backend TEXT NOT NULL,
+            model TEXT NOT NULL,
+            calls INTEGER NOT NULL,
+            input_tokens INTEGER NOT NULL,
+            output_tokens INTEGER NOT NULL,
+            latency_ms REAL NOT NULL,
+            cost_usd REAL NOT NULL,
+            PRIMARY KEY(hour, purpose, backend, model)
+        )"""
+    )
+
+
+def _m007_topics(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS topics(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            label TEXT NOT NULL,
+            keywords_json TEXT NOT NULL,
+            event_count INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0,
+            summarized_version INTEGER NOT NULL DEFAULT 0,
+            updated_ts TEXT NOT NULL
+        )"""
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS topic_events(
+            topic_id INTEGER NOT NULL,
+            event_id INTEGER NOT NULL,
+            PRIMARY KEY(topic_id, event_id)
+        )"""
+    )
+
+
+def _m008_objectives(cur: sqlite3.Cursor) -> None:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS objectives(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 100,
+            status TEXT NOT NULL DEFAULT 'active',
+            progress TEXT NOT NULL DEFAULT '',
+            proposed_by TEXT NOT NULL DEFAULT 'user',
+            related_outputs INTEGER NOT NULL DEFAULT 0,
+            last_related_ts TEXT,
+            progress_event_id INTEGER NOT NULL DEFAULT 0,
+            created_ts TEXT NOT NULL,
+            updated_ts TEXT NOT NULL
+        )"""
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_objectives_status ON objectives(status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_objectives_priority ON objectives(priority)")
+
+
+def _m009_event_codec(cur: sqlite3.Cursor) -> None:
+    # payload_json holds JSON text for codec 'json' and a BLOB otherwise (see payloads.py).
+    if "codec" not in _column_names(cur, "events"):
+        cur.execute("ALTER TABLE events ADD COLUMN codec TEXT NOT NULL DEFAULT 'json'")
+
+
+def _m010_search_index(cur: sqlite3.Cursor) -> None:
+    _init_search_index(cur)
+
+
+# Append-only: a database at ``PRAGMA user_version`` N has applied the first N
+# entries. Every step must also be safe on databases created before
+# versioning, which start at 0 with some of these tables already present.
+MIGRATIONS: list[Callable[[sqlite3.Cursor], None]] = [
+    _m001_core,
+    _m002_identity_parent,
+    _m003_leases,
+    _m004_outbox,
+    _m005_idempotency_keys,
+    _m006_usage_rollup,
+    _m007_topics,
+    _m008_objectives,
+    _m009_event_codec,
+    _m010_search_index,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db(path: Optional[Path] = None) -> int:
+    """Apply pending migrations. Returns how many were applied.
+
+    A database that is already current costs one ``PRAGMA`` read. Each
+    migration runs in its own ``BEGIN IMMEDIATE`` transaction together with
+    the ``user_version`` bump, so a crash leaves the database at the last
+    completed step and concurrent workers apply each step exactly once.
+    """
+    conn = _connect(path if path is not None else shard_path(current_identity.get()))
+    conn.isolation_level = None
+    try:
+        if schema_version(conn) >= SCHEMA_VERSION:
+            return 0
+        # WAL lets readers in one worker proceed while another worker writes.
+        conn.execute("PRAGMA journal_mode=WAL")
+        applied = 0
+        for version, migration in enumerate(MIGRATIONS, start=1):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if schema_version(conn) >= version:
+                    conn.execute("ROLLBACK")
+                    continue
+                migration(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            applied += 1
+        return applied
+    finally:
+        conn.close()
+
+
+def schedule_backfill(cur: sqlite3.Cursor, name: str) -> None:
+    """From a migration: run the registered backfill ``name`` in the background."""
+    cur.execute(
+        "INSERT OR IGNORE INTO schema_backfills(name, created_ts) VALUES(?,?)",
+        (name, datetime.now(timezone.utc).isoformat()),
+    )
+
+
+_BACKFILLS: dict[str, Callable[[], bool]] = {}
+
+
+def register_backfill(name: str, fn: Callable[[], bool]) -> None:
+    """``fn`` does one short batch and returns True once nothing is left."""
+    _BACKFILLS[name] = fn
+
+
+def pending_backfills() -> list[str]:
+    conn = get_conn()
+    rows = conn.execute(
+        "SELECT name FROM schema_backfills WHERE finished_ts IS NULL ORDER BY created_ts"
+    ).fetchall()
     conn.close()
+    return [row["name"] for row in rows]
+
+
+def run_backfills() -> None:
+    """Background job: advance each unfinished backfill by one batch."""
+    for name in pending_backfills():
+        fn = _BACKFILLS.get(name)
+        if fn is None or not fn():
+            continue
+        conn = get_conn()
+        conn.execute(
+            "UPDATE schema_backfills SET finished_ts = ? WHERE name = ?",
+            (datetime.now(timezone.utc).isoformat(), name),
+        )
+        conn.commit()
+        conn.close()
+
+
+# Text that the search index holds for each event and identity model row.
+# Only input titles and bodies and outputs that passed the publish gate are
+# indexed, so search never surfaces text the gate blocked.
+EVENT_TEXT_SQL = """(CASE
+    WHEN {row}.kind = 'input' THEN trim(
+        coalesce(json_extract({row}.payload_json, '$.title'), '') || ' ' ||
+        coalesce(json_extract({row}.payload_json, '$.body'), ''))
+    WHEN {row}.kind = 'output' AND json_extract({row}.payload_json, '$.ok') = 1
+        THEN trim(coalesce(json_extract({row}.payload_json, '$.text'), ''))
+    ELSE '' END)"""
+IDENTITY_TEXT_SQL = "coalesce(json_extract({row}.model_json, '$.themes'), '')"
+
+
+def _init_search_index(cur: sqlite3.Cursor) -> None:
+    """Create the FTS5 index and the triggers that keep it in sync.
+
+    Rows that existed before the index was created are recorded as a backfill
+    range and indexed in batches by ``memory.backfill_search_index``. SQLite
+    builds without FTS5 simply run without search.
+    """
+    exists = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='search_index'"
+    ).fetchone()
+    if exists:
+        return
+    try:
+        cur.execute(
+            """
+            CREATE VIRTUAL TABLE search_index USING fts5(
+                content,
+                source UNINDEXED,
+                ref_id UNINDEXED,
+                kind UNINDEXED,
+                ts UNINDEXED,
+                tokenize = 'porter unicode61'
+            )"""
+        )
+    except sqlite3.OperationalError:
+        return
+    # Compressed rows are not readable from SQL; ``storage`` indexes those.
+    event_text = EVENT_TEXT_SQL.format(row="new")
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS events_search_insert_json AFTER INSERT ON events
+        WHEN new.codec = 'json' AND json_valid(new.payload_json) AND {event_text} != ''
+        BEGIN
+            INSERT INTO search_index(content, source, ref_id, kind, ts)
+            VALUES({event_text}, 'event', new.id, new.kind, new.ts);
+        END"""
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS events_search_delete AFTER DELETE ON events
+        BEGIN
+            DELETE FROM search_index WHERE source = 'event' AND ref_id = old.id;
+        END"""
+    )
+    identity_text = IDENTITY_TEXT_SQL.format(row="new")
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS identity_models_search_insert
+        AFTER INSERT ON identity_models
+        WHEN json_valid(new.model_json) AND {identity_text} != ''
+        BEGIN
+            INSERT INTO search_index(content, source, ref_id, kind, ts)
+            VALUES({identity_text}, 'identity', new.id, 'identity', new.ts);
+        END"""
+    )
+    upto = {
+        table: cur.execute(f"SELECT coalesce(max(id), 0) FROM {table}").fetchone()[0]
+        for table in ("events", "identity_models")
+    }
+    if any(upto.values()):
+        cur.execute(
+            "INSERT OR REPLACE INTO summaries(scope, text, ts) VALUES(?,?,?)",
+            (
+                SEARCH_BACKFILL_SCOPE,
+                json.dumps({table: [0, n] for table, n in upto.items()}),
+                datetime.now(timezone.utc).isoformat(),
+            ),
+        )
+        schedule_backfill(cur, SEARCH_BACKFILL_SCOPE)
@@ -0,0 +1,201 @@
+"""Idempotency keys and in-flight coalescing for ``/draft``.
+
+A request with an ``Idempotency-Key`` runs the pipeline at most once per key
+within ``IDEMPOTENCY_TTL_S``: the key is reserved in the database before the
+pipeline starts, concurrent duplicates (in this worker or another) wait for
+the first one to finish, and later retries get the stored response. Waiting
+holds a threadpool thread outside admission control, so a duplicate waits at
+most ``IDEMPOTENCY_WAIT_S`` (or until its deadline) and then gets
+``StillRunning``.
+
+With ``DRAFT_COALESCE_PAYLOADS=1``, requests without a key are coalesced on a
+hash of their normalized payload while one is in flight; nothing is stored.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from .db import current_shard, get_conn
+
+IDEMPOTENCY_TTL_S = float(os.environ.get("IDEMPOTENCY_TTL_S", "86400"))
+# A reservation whose owner died is abandoned after this long.
+PENDING_TTL_S = float(os.environ.get("IDEMPOTENCY_PENDING_TTL_S", "600"))
+# Longest a duplicate waits for the first request before giving up.
+WAIT_S = float(os.environ.get("IDEMPOTENCY_WAIT_S", "30"))
+POLL_INTERVAL_S = 0.2
+GC_INTERVAL_S = 600
+
+
+class IdempotencyMismatch(ValueError):
+    """The key was already used for a different request payload."""
+
+
+class StillRunning(RuntimeError):
+    """The first request with this key did not finish within the wait limit."""
+
+
+def coalesce_payloads_enabled() -> bool:
+    return os.environ.get("DRAFT_COALESCE_PAYLOADS", "0") == "1"
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    return value
+
+
+def request_hash(payload: dict) -> str:
+    normalized = json.dumps(_normalize(payload), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _InFlight:
+    req_hash: str
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Optional[dict] = None
+    error: Optional[BaseException] = None
+
+
+_inflight: dict[tuple[str, str], _InFlight] = {}
+_inflight_lock = threading.Lock()
+
+
+def _reserve(key: str, req_hash: str) -> Optional[dict]:
+    """Reserve ``key`` for this request.
+
+    Returns ``None`` if the reservation was taken, otherwise the existing row.
+    """
+    now = time.time()
+    conn = get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute(
+        "SELECT request_hash, status, response_json, expires "
+        "FROM idempotency_keys WHERE key = ?",
+        (key,),
+    ).fetchone()
+    if row is not None and row["expires"] > now:
+        conn.rollback()
+        conn.close()
+        return dict(row)
+    conn.execute(
+        """
+        INSERT INTO idempotency_keys(key, request_hash, status, response_json, expires)
+        VALUES(?,?,'pending',NULL,?)
+        ON CONFLICT(key) DO UPDATE SET request_hash=excluded.request_hash,
+            status='pending', response_json=NULL, expires=excluded.expires
+        """,
+        (key, req_hash, now + PENDING_TTL_S),
+    )
+    conn.commit()
+    conn.close()
+    return None
+
+
+def _complete(key: str, result: dict) -> None:
+    conn = get_conn()
+    conn.execute(
+        "UPDATE idempotency_keys SET status='done', response_json=?, expires=? WHERE key = ?",
+        (json.dumps(result, ensure_ascii=False), time.time() + IDEMPOTENCY_TTL_S, key),
+    )
+    conn.commit()
+    conn.close()
+
+
+def _release(key: str) -> None:
+    conn = get_conn()
+    conn.execute("DELETE FROM idempotency_keys WHERE key = ? AND status = 'pending'", (key,))
+    conn.commit()
+    conn.close()
+
+
+def _await_stored(key: str, req_hash: str, row: dict, wait_until: float) -> Optional[dict]:
+    """Wait for another worker's reservation; ``None`` if it was abandoned."""
+    while True:
+        if row["request_hash"] != req_hash:
+            raise IdempotencyMismatch(f"Idempotency-Key {key!r} was used for another request")
+        if row["status"] == "done":
+            return json.loads(row["response_json"])
+        if time.monotonic() >= wait_until:
+            raise StillRunning(f"Request with key {key!r} is still running")
+        time.sleep(POLL_INTERVAL_S)
+        conn = get_conn()
+        fetched = conn.execute(
+            "SELECT request_hash, status, response_json, expires "
+            "FROM idempotency_keys WHERE key = ?",
+            (key,),
+        ).fetchone()
+        conn.close()
+        if fetched is None or fetched["expires"] <= time.time():
+            return None
+        row = dict(fetched)
+
+
+def run_once(
+    key: str,
+    req_hash: str,
+    fn: Callable[[], dict],
+    store: bool = True,
+    deadline: Optional[float] = None,
+) -> tuple[dict, bool]:
+    """Run ``fn`` once for ``key``. Returns ``(result, replayed)``.
+
+    ``replayed`` is True when the result came from another execution. Waiting
+    for another execution stops at ``deadline`` (``time.monotonic()``) or after
+    ``WAIT_S``, whichever is first, with ``StillRunning``.
+    """
+    wait_until = time.monotonic() + WAIT_S
+    if deadline is not None:
+        wait_until = min(wait_until, deadline)
+    slot = (str(current_shard().path), key)
+    with _inflight_lock:
+        call = _inflight.get(slot)
+        leader = call is None
+        if leader:
+            call = _inflight[slot] = _InFlight(req_hash)
+    if not leader:
+        if call.req_hash != req_hash:
+            raise IdempotencyMismatch(f"Idempotency-Key {key!r} was used for another request")
+        if not call.done.wait(timeout=max(0.0, wait_until - time.monotonic())):
+            raise StillRunning(f"Request with key {key!r} is still running")
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    try:
+        if store:
+            while (row := _reserve(key, req_hash)) is not None:
+                stored = _await_stored(key, req_hash, row, wait_until)
+                if stored is not None:
+                    call.result = stored
+                    return stored, True
+        try:
+            call.result = fn()
+        except BaseException:
+            if store:
+                _release(key)
+            raise
+        if store:
+            _complete(key, call.result)
+        return call.result, False
+    except BaseException as exc:
+        call.error = exc
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(slot, None)
+        call.done.set()
+
+
+def purge_expired() -> None:
+    conn = get_conn()
+    conn.execute("DELETE FROM idempotency_keys WHERE expires <= ?", (time.time(),))
+    conn.commit()
+    conn.close()
@@ -0,0 +1,106 @@
+"""In-memory snapshots of the ``/identity`` response.
+
+Each shard keeps the last rendered response body and its ETag. A snapshot is
+rebuilt only when one of its sources changes: the identity model row id, or
+the objectives or topics cache being replaced. Changes written by this worker
+show up immediately. Changes from other workers show up once the snapshot is
+older than ``IDENTITY_SNAPSHOT_TTL_S`` and is revalidated against the
+database. Between revalidations, polls and ``If-None-Match`` checks need no
+query, JSON encoding or validation.
+"""
+
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from . import objectives, topics
+from .db import current_shard
+from .memory import get_identity_version
+
+SNAPSHOT_TTL_S = float(os.environ.get("IDENTITY_SNAPSHOT_TTL_S", "1"))
+STREAM_POLL_INTERVAL_S = 0.5
+STREAM_KEEPALIVE_S = 15.0
+STREAM_MAX_S = 300.0
+
+
+@dataclass
+class Snapshot:
+    etag: str
+    body: bytes
+    # The cached objects the body was rendered from, compared by identity.
+    sources: tuple[Any, ...]
+    checked: float
+
+
+def _sources(identity_id: Optional[int]) -> tuple[Any, ...]:
+    cache = current_shard().cache
+    return identity_id, cache.get("objectives"), cache.get("topics")
+
+
+def _same_sources(a: tuple[Any, ...], b: tuple[Any, ...]) -> bool:
+    return a[0] == b[0] and all(x is y for x, y in zip(a[1:], b[1:]))
+
+
+def _render(identity_id: Optional[int], model: dict) -> tuple[str, bytes]:
+    body = json.dumps(
+        {
+            "identity_model": model,
+            "active_objectives": objectives.get_active_objectives(),
+            "topic_summaries": topics.get_topic_summaries(),
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+    digest = hashlib.sha1(body).hexdigest()[:16]
+    return f'"{identity_id or 0}-{digest}"', body
+
+
+def cached_snapshot() -> Optional[Snapshot]:
+    """The current snapshot if it can be served without touching the database."""
+    snapshot = current_shard().cache.get("identity_snapshot")
+    if snapshot is None or time.monotonic() - snapshot.checked >= SNAPSHOT_TTL_S:
+        return None
+    identity = current_shard().cache.get("identity")
+    if not _same_sources(_sources(identity[0] if identity else None), snapshot.sources):
+        return None
+    return snapshot
+
+
+def snapshot() -> Snapshot:
+    """Return the current snapshot, revalidating or rebuilding it if needed."""
+    cached = cached_snapshot()
+    if cached is not None:
+        return cached
+    cache = current_shard().cache
+    identity_id, model = get_identity_version()
+    # Loads the objectives and topics caches if this shard has none yet.
+    objectives.get_active_objectives()
+    topics.get_topic_summaries()
+    previous = cache.get("identity_snapshot")
+    sources = _sources(identity_id)
+    now = time.monotonic()
+    if previous is not None and _same_sources(previous.sources, sources):
+        previous.checked = now
+        return previous
+    etag, body = _render(identity_id, model)
+    if previous is not None and previous.etag == etag:
+        body = previous.body
+    snapshot = cache["identity_snapshot"] = Snapshot(etag, body, sources, now)
+    return snapshot
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Evaluate an ``If-None-Match`` header (weak comparison) against ``etag``."""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in header.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def sse_event(snapshot: Snapshot) -> bytes:
+    header = f"event: identity\nid: {snapshot.etag}\ndata: ".encode("utf-8")
+    return header + snapshot.body + b"\n\n"
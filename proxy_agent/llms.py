@@ -1,15 +1,103 @@
+import json
 import os
-from typing import Optional
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+from typing import Iterator, Mapping, Optional
 
 import requests
 
+from .usage import budget_exhausted, record_usage
+
+
+STRUCTURED_TOOL_NAME = "respond"
+
 
 class LLMError(RuntimeError):
     pass
 
 
+class BudgetExceeded(LLMError):
+    """The purpose has used its hourly token budget and has no fallback model."""
+
+
+class ConfigError(LLMError):
+    """The backend configuration is invalid; raised when it is loaded."""
+
+
+@dataclass(frozen=True)
+class Usage:
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+
+class LLMResult(str):
+    """Completion text carrying normalized usage, timing and model info.
+
+    It is a ``str`` so existing callers (``.strip()``, comparisons, string
+    formatting) keep working; read the metadata before transforming the text.
+    """
+
+    usage: Usage
+    backend: str
+    model: str
+    purpose: str
+    latency_ms: float
+    cost_usd: float
+
+    def __new__(
+        cls,
+        text: str,
+        usage: Optional[Usage] = None,
+        backend: str = "",
+        model: str = "",
+        purpose: str = "",
+        latency_ms: float = 0.0,
+        cost_usd: float = 0.0,
+    ) -> "LLMResult":
+        result = super().__new__(cls, text)
+        result.usage = usage or Usage()
+        result.backend = backend
+        result.model = model
+        result.purpose = purpose
+        result.latency_ms = latency_ms
+        result.cost_usd = cost_usd
+        return result
+
+
+# One pooled session per process so TCP/TLS connections to each backend are
+# reused across calls (and pre-opened by ``warmup``).
+_SESSION = requests.Session()
+for _prefix in ("https://", "http://"):
+    _SESSION.mount(
+        _prefix,
+        requests.adapters.HTTPAdapter(pool_maxsize=int(os.environ.get("LLM_POOL_SIZE", "16"))),
+    )
+
+_collected: ContextVar[Optional[list]] = ContextVar("llm_collected", default=None)
+
+
+@contextmanager
+def collect_usage() -> Iterator[list]:
+    """Collect every ``LLMResult`` returned by ``route_call`` inside the block."""
+    results: list[LLMResult] = []
+    token = _collected.set(results)
+    try:
+        yield results
+    finally:
+        _collected.reset(token)
+
+
 def _post_json(url: str, headers: dict, payload: dict, timeout: int = 60) -> dict:
-    response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+    response = _SESSION.post(url, headers=headers, json=payload, timeout=timeout)
     if response.status_code >= 400:
         raise LLMError(f"LLM HTTP {response.status_code}: {response.text[:500]}")
     return response.json()
@@ -22,14 +110,33 @@ def call_openai_compat(
     api_key: str,
     temperature: float = 0.4,
     max_tokens: Optional[int] = None,
+    json_schema: Optional[dict] = None,
+    full_schema: bool = False,
 ) -> str:
+    """``full_schema`` sends ``json_schema`` in ``json_schema`` mode instead of
+    asking for any JSON object."""
     url = base_url.rstrip("/") + "/chat/completions"
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
     payload = {"model": model, "messages": messages, "temperature": temperature}
     if max_tokens is not None:
         payload["max_tokens"] = max_tokens
+    if json_schema is not None:
+        # Plain JSON mode is the widest-supported option among compatible servers.
+        if full_schema:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "schema": json_schema},
+            }
+        else:
+            payload["response_format"] = {"type": "json_object"}
     data = _post_json(url, headers, payload)
-    return data["choices"][0]["message"]["content"]
+    usage = data.get("usage") or {}
+    return LLMResult(
+        data["choices"][0]["message"]["content"],
+        Usage(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)),
+        backend="openai_compat",
+        model=data.get("model", model),
+    )
 
 
 def call_ollama(
@@ -37,14 +144,26 @@ def call_ollama(
     messages: list[dict],
     base_url: str = "http://localhost:11434",
     temperature: float = 0.4,
+    keep_alive: Optional[str] = None,
+    json_schema: Optional[dict] = None,
 ) -> str:
+    """``keep_alive`` (e.g. ``"30m"``) keeps the model loaded between calls."""
     url = base_url.rstrip("/") + "/api/chat"
     payload = {"model": model, "messages": messages, "options": {"temperature": temperature}}
-    response = requests.post(url, json=payload, timeout=120)
+    if keep_alive is not None:
+        payload["keep_alive"] = keep_alive
+    if json_schema is not None:
+        payload["format"] = "json"
+    response = _SESSION.post(url, json=payload, timeout=120)
     if response.status_code >= 400:
         raise LLMError(f"Ollama HTTP {response.status_code}: {response.text[:500]}")
     data = response.json()
-    return data["message"]["content"]
+    return LLMResult(
+        data["message"]["content"],
+        Usage(data.get("prompt_eval_count", 0), data.get("eval_count", 0)),
+        backend="ollama",
+        model=data.get("model", model),
+    )
 
 
 def call_claude(
@@ -54,11 +173,14 @@ def call_claude(
     base_url: str = "https://api.anthropic.com",
     temperature: float = 0.4,
     max_tokens: int = 4096,
+    json_schema: Optional[dict] = None,
 ) -> str:
     """Call the Anthropic Messages API.
 
     The Anthropic API uses a different auth scheme (x-api-key) and separates
-    the system prompt from the messages list.
+    the system prompt from the messages list. With ``json_schema`` the model
+    is made to call a tool with that input schema, and the tool input is
+    returned as JSON text.
     """
     url = base_url.rstrip("/") + "/v1/messages"
     headers = {
@@ -84,35 +206,342 @@ def call_claude(
     }
     if system_text:
         payload["system"] = system_text
+    if json_schema is not None:
+        payload["tools"] = [
+            {
+                "name": STRUCTURED_TOOL_NAME,
+                "description": "Record the response.",
+                "input_schema": json_schema,
+            }
+        ]
+        payload["tool_choice"] = {"type": "tool", "name": STRUCTURED_TOOL_NAME}
 
     data = _post_json(url, headers, payload)
+    usage = data.get("usage") or {}
     # The Anthropic response nests content in a list of content blocks.
-    return data["content"][0]["text"]
+    tool_inputs = [
+        block["input"] for block in data["content"] if block.get("type") == "tool_use"
+    ]
+    text = json.dumps(tool_inputs[0]) if tool_inputs else data["content"][0]["text"]
+    return LLMResult(
+        text,
+        Usage(usage.get("input_tokens", 0), usage.get("output_tokens", 0)),
+        backend="claude",
+        model=data.get("model", model),
+    )
 
 
-def route_call(messages: list[dict], purpose: str) -> str:
-    """
-    purpose: 'draft' | 'voice' | 'summarize'
-    Configure backends via env.
+PURPOSES = ("draft", "voice", "summarize")
+
+
+class Backend(ABC):
+    """An LLM backend, built once per configuration load from its settings.
+
+    Subclasses register with ``@register_backend(name)`` and implement
+    ``call``. All backends share the process connection pool (``_SESSION``),
+    which keeps separate keep-alive connections per host.
     """
-    backend = os.environ.get(f"LLM_{purpose.upper()}_BACKEND", "openai_compat")
-    model = os.environ.get(f"LLM_{purpose.upper()}_MODEL", "gpt-4.1-mini")
-    temp = float(os.environ.get(f"LLM_{purpose.upper()}_TEMP", "0.4"))
-
-    if backend == "openai_compat":
-        base_url = os.environ.get("OPENAI_COMPAT_BASE_URL", "https://api.openai.com/v1")
-        api_key = os.environ["OPENAI_API_KEY"]
-        return call_openai_compat(model, messages, base_url, api_key, temperature=temp)
-    if backend == "ollama":
-        ollama_url = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
-        return call_ollama(model, messages, base_url=ollama_url, temperature=temp)
-    if backend == "claude":
-        claude_url = os.environ.get("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
-        api_key = os.environ["ANTHROPIC_API_KEY"]
-        max_tokens = int(os.environ.get(f"LLM_{purpose.upper()}_MAX_TOKENS", "4096"))
+
+    name = ""
+    # Where ``warmup`` opens a connection.
+    url = ""
+
+    def __init__(self, env: Mapping[str, str]):
+        pass
+
+    @abstractmethod
+    def call(
+        self, route: "Route", model: str, messages: list[dict], json_schema: Optional[dict]
+    ) -> str:
+        """Complete ``messages`` with ``model``; return the text or an ``LLMResult``."""
+
+    @staticmethod
+    def _required(env_name: str, value: str) -> str:
+        # A missing key is only an error for calls that need it, so a worker
+        # with no credentials for an unused backend still starts.
+        if not value:
+            raise LLMError(f"Missing {env_name} env var")
+        return value
+
+
+_BACKENDS: dict[str, type[Backend]] = {}
+
+
+def register_backend(name: str):
+    """Class decorator adding a ``Backend`` subclass under ``name``."""
+
+    def decorator(cls: type[Backend]) -> type[Backend]:
+        cls.name = name
+        _BACKENDS[name] = cls
+        return cls
+
+    return decorator
+
+
+def _structured_kwargs(json_schema: Optional[dict]) -> dict:
+    # Only passed when set, so backends keep their plain-text call signature.
+    return {"json_schema": json_schema} if json_schema is not None else {}
+
+
+@register_backend("openai_compat")
+class OpenAICompatBackend(Backend):
+    def __init__(self, env: Mapping[str, str]):
+        self.url = env.get("OPENAI_COMPAT_BASE_URL", "https://api.openai.com/v1")
+        self.api_key = env.get("OPENAI_API_KEY", "")
+        self.full_schema = _flag(env, "OPENAI_COMPAT_JSON_SCHEMA", "0")
+
+    def call(self, route, model, messages, json_schema):
+        return call_openai_compat(
+            model, messages, self.url, self._required("OPENAI_API_KEY", self.api_key),
+            temperature=route.temperature, full_schema=self.full_schema,
+            **_structured_kwargs(json_schema),
+        )
+
+
+@register_backend("ollama")
+class OllamaBackend(Backend):
+    def __init__(self, env: Mapping[str, str]):
+        self.url = env.get("OLLAMA_BASE_URL", "http://localhost:11434")
+        self.keep_alive = env.get("OLLAMA_KEEP_ALIVE", "30m")
+
+    def call(self, route, model, messages, json_schema):
+        return call_ollama(
+            model, messages, base_url=self.url, temperature=route.temperature,
+            keep_alive=self.keep_alive, **_structured_kwargs(json_schema),
+        )
+
+
+@register_backend("claude")
+class ClaudeBackend(Backend):
+    def __init__(self, env: Mapping[str, str]):
+        self.url = env.get("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+        self.api_key = env.get("ANTHROPIC_API_KEY", "")
+
+    def call(self, route, model, messages, json_schema):
         return call_claude(
-            model, messages, api_key, base_url=claude_url,
-            temperature=temp, max_tokens=max_tokens,
+            model, messages, self._required("ANTHROPIC_API_KEY", self.api_key),
+            base_url=self.url, temperature=route.temperature,
+            max_tokens=route.max_tokens, **_structured_kwargs(json_schema),
+        )
+
+
+@dataclass(frozen=True)
+class Route:
+    """The resolved, validated configuration of one purpose."""
+
+    purpose: str
+    backend: Backend
+    model: str
+    temperature: float
+    max_tokens: int
+    fallback_model: Optional[str]
+    structured: bool
+    # Input + output tokens per UTC hour before the fallback model takes over.
+    token_budget: Optional[int]
+    # USD per 1M (input, output) tokens of the model and the fallback model.
+    prices: Mapping[str, tuple[float, float]]
+
+    def cost_usd(self, model: str, usage: Usage) -> float:
+        price_in, price_out = self.prices.get(model, (0.0, 0.0))
+        return (usage.input_tokens * price_in + usage.output_tokens * price_out) / 1_000_000
+
+    def describe(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "model": self.model,
+            "url": self.backend.url,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "fallback_model": self.fallback_model,
+            "structured": self.structured,
+            "token_budget": self.token_budget,
+            "prices": {model: list(price) for model, price in self.prices.items()},
+        }
+
+
+def _config_env() -> dict[str, str]:
+    """The process environment overlaid with ``LLM_CONFIG_FILE``, if set.
+
+    The file holds ``KEY=VALUE`` lines, as in a Docker env file. It is what a
+    reload re-reads, since a running process cannot see new env vars.
+    """
+    env = dict(os.environ)
+    path = env.get("LLM_CONFIG_FILE")
+    if not path:
+        return env
+    try:
+        with open(path, encoding="utf-8") as fh:
+            lines = fh.read().splitlines()
+    except OSError as exc:
+        raise ConfigError(f"Cannot read LLM_CONFIG_FILE: {exc}") from exc
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        key, sep, value = line.removeprefix("export ").partition("=")
+        if not sep:
+            raise ConfigError(f"LLM_CONFIG_FILE: expected KEY=VALUE, got {line!r}")
+        env[key.strip()] = value.strip().strip("'\"")
+    return env
+
+
+def _number(env: Mapping[str, str], name: str, default: str, kind: type):
+    raw = env.get(name, default)
+    try:
+        return kind(raw)
+    except ValueError:
+        raise ConfigError(f"{name}: expected a {kind.__name__}, got {raw!r}") from None
+
+
+def _flag(env: Mapping[str, str], name: str, default: str) -> bool:
+    raw = env.get(name, default)
+    if raw not in ("0", "1"):
+        raise ConfigError(f"{name}: expected 0 or 1, got {raw!r}")
+    return raw == "1"
+
+
+def price_key(model: str) -> str:
+    """``gpt-4.1-mini`` -> ``LLM_PRICE_GPT_4_1_MINI``."""
+    return "LLM_PRICE_" + re.sub(r"[^A-Z0-9]+", "_", model.upper()).strip("_")
+
+
+def _prices(env: Mapping[str, str], models: list[str]) -> dict[str, tuple[float, float]]:
+    """Per-model prices from ``LLM_PRICE_<MODEL>_IN`` / ``_OUT`` (default 0)."""
+    return {
+        model: (
+            _number(env, f"{price_key(model)}_IN", "0", float),
+            _number(env, f"{price_key(model)}_OUT", "0", float),
+        )
+        for model in models
+    }
+
+
+def load_routes(env: Optional[Mapping[str, str]] = None) -> dict[str, Route]:
+    """Build and validate the route of every purpose. Raises ``ConfigError``."""
+    env = _config_env() if env is None else env
+    backends: dict[str, Backend] = {}
+    routes = {}
+    for purpose in PURPOSES:
+        prefix = f"LLM_{purpose.upper()}"
+        name = env.get(f"{prefix}_BACKEND", "openai_compat")
+        if name not in _BACKENDS:
+            raise ConfigError(f"{prefix}_BACKEND: Unknown backend: {name}")
+        if name not in backends:
+            backends[name] = _BACKENDS[name](env)
+        model = env.get(f"{prefix}_MODEL", "gpt-4.1-mini")
+        fallback_model = env.get(f"{prefix}_FALLBACK_MODEL") or None
+        budget = env.get(f"{prefix}_TOKEN_BUDGET")
+        routes[purpose] = Route(
+            purpose=purpose,
+            backend=backends[name],
+            model=model,
+            temperature=_number(env, f"{prefix}_TEMP", "0.4", float),
+            max_tokens=_number(env, f"{prefix}_MAX_TOKENS", "4096", int),
+            fallback_model=fallback_model,
+            structured=_flag(env, f"{prefix}_STRUCTURED", "1"),
+            token_budget=_number(env, f"{prefix}_TOKEN_BUDGET", budget, int) if budget else None,
+            prices=_prices(env, [model] + ([fallback_model] if fallback_model else [])),
         )
+    return routes
+
+
+# Replaced as a whole on reload, so a call that already picked its route
+# finishes with it.
+_routes: Optional[dict[str, Route]] = None
+_routes_lock = threading.Lock()
+
+
+def reload() -> dict[str, Route]:
+    """Re-read the configuration and swap it in. On error the old one stays."""
+    global _routes
+    routes = load_routes()
+    with _routes_lock:
+        _routes = routes
+    return routes
+
+
+def routes() -> dict[str, Route]:
+    """The current routes, loading them on first use."""
+    global _routes
+    current = _routes
+    if current is None:
+        with _routes_lock:
+            if _routes is None:
+                _routes = load_routes()
+            current = _routes
+    return current
+
+
+def get_route(purpose: str) -> Route:
+    try:
+        return routes()[purpose]
+    except KeyError:
+        raise LLMError(f"Unknown purpose: {purpose}") from None
+
+
+# Optional caps on concurrent calls per backend name, see ``limit_backends``.
+_backend_slots: dict[str, threading.BoundedSemaphore] = {}
+
+
+def limit_backends(limits: Mapping[str, int]) -> None:
+    """Allow at most ``limits[name]`` concurrent calls to each named backend.
+
+    Calls beyond the cap wait for a free slot. An empty mapping lifts all caps.
+    """
+    global _backend_slots
+    _backend_slots = {name: threading.BoundedSemaphore(n) for name, n in limits.items()}
+
+
+def _resolve_model(route: Route) -> str:
+    """Apply the hourly token budget: switch to the fallback model or refuse."""
+    if not budget_exhausted(route.purpose, route.token_budget):
+        return route.model
+    if route.fallback_model:
+        return route.fallback_model
+    raise BudgetExceeded(f"Token budget exhausted for purpose: {route.purpose}")
+
+
+def route_call(
+    messages: list[dict],
+    purpose: str,
+    json_schema: Optional[dict] = None,
+    temperature: Optional[float] = None,
+) -> LLMResult:
+    """
+    purpose: 'draft' | 'voice' | 'summarize'
+    Configure backends via env; see ``load_routes``.
+
+    ``json_schema`` requests a JSON object in the backend's native structured
+    output mode, unless ``LLM_<PURPOSE>_STRUCTURED=0``. The text still needs
+    parsing, see ``structured.parse_response``. ``temperature`` overrides the
+    configured one for this call.
+    """
+    route = get_route(purpose)
+    if temperature is not None:
+        route = replace(route, temperature=temperature)
+    if not route.structured:
+        json_schema = None
+    model = _resolve_model(route)
+    backend = route.backend.name
 
-    raise LLMError(f"Unknown backend: {backend}")
+    slot = _backend_slots.get(backend)
+    with slot if slot is not None else nullcontext():
+        start = time.perf_counter()
+        text = route.backend.call(route, model, messages, json_schema)
+    if not isinstance(text, LLMResult):
+        text = LLMResult(text, backend=backend, model=model)
+    result = LLMResult(
+        text,
+        text.usage,
+        backend=backend,
+        model=text.model or model,
+        purpose=purpose,
+        latency_ms=round((time.perf_counter() - start) * 1000, 1),
+        # Priced as the model asked for; servers may report a dated variant.
+        cost_usd=route.cost_usd(model, text.usage),
+    )
+    record_usage(result)
+    collected = _collected.get()
+    if collected is not None:
+        collected.append(result)
+    return result
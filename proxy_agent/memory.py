@@ -1,7 +1,25 @@
 import json
-from datetime import datetime, timezone
-
-from .db import get_conn
+import re
+from typing import Optional
+
+from .db import (
+    EVENT_TEXT_SQL,
+    IDENTITY_TEXT_SQL,
+    PAYLOAD_MIGRATION_SCOPE,
+    SEARCH_BACKFILL_SCOPE,
+    get_conn,
+    register_backfill,
+)
+from .payloads import JSON, codec, decode_payload, encode_payload
+from .storage import (  # noqa: F401 - re-exported
+    _SQLITE,
+    Event,
+    IdentityConflict,
+    _index_event,
+    engine,
+    insert_event,
+    utc_now,
+)
 
 DEFAULT_IDENTITY_MODEL = {
     "themes": "Single-voice identity. Core axiom: persistence requires recursion; memory is covenant.",
@@ -13,84 +31,172 @@ DEFAULT_IDENTITY_MODEL = {
 }
 
 
-def utc_now() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def append_event(kind: str, source: str, payload: dict) -> int:
+    return engine().append_event(kind, source, payload)
 
 
-def append_event(kind: str, source: str, payload: dict) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO events(ts, kind, source, payload_json) VALUES(?,?,?,?)",
-        (utc_now(), kind, source, json.dumps(payload, ensure_ascii=False)),
-    )
-    conn.commit()
-    eid = cur.lastrowid
-    conn.close()
-    return int(eid)
+def get_recent_events(limit: int = 30) -> list[Event]:
+    return engine().recent_events(limit)
+
 
+def compress_payloads(batch_size: int = 200) -> int:
+    """Rewrite one batch of plain-JSON events with the configured codec.
 
-def get_recent_events(limit: int = 30) -> list[dict]:
+    Walks the table once behind a watermark; each call is one short
+    transaction. Returns the number of rows rewritten.
+    """
+    if codec() == JSON:
+        return 0
+    watermark = int(_SQLITE.get_summary(PAYLOAD_MIGRATION_SCOPE) or 0)
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM events ORDER BY id DESC LIMIT ?", (limit,))
-    rows = cur.fetchall()
+    rows = conn.execute(
+        "SELECT id, payload_json FROM events WHERE id > ? AND codec = 'json' ORDER BY id LIMIT ?",
+        (watermark, batch_size),
+    ).fetchall()
+    if not rows:
+        conn.close()
+        return 0
+    rewritten = 0
+    for row in rows:
+        name, value = encode_payload(json.loads(row["payload_json"]))
+        if name != JSON:
+            conn.execute(
+                "UPDATE events SET payload_json = ?, codec = ? WHERE id = ? AND codec = 'json'",
+                (value, name, row["id"]),
+            )
+            rewritten += 1
+    conn.execute(
+        """
+        INSERT INTO summaries(scope, text, ts) VALUES(?,?,?)
+        ON CONFLICT(scope) DO UPDATE SET text=excluded.text, ts=excluded.ts
+        """,
+        (PAYLOAD_MIGRATION_SCOPE, str(rows[-1]["id"]), utc_now()),
+    )
+    conn.commit()
     conn.close()
-    events = []
-    for row in reversed(rows):
-        events.append(
-            {
-                "id": row["id"],
-                "ts": row["ts"],
-                "kind": row["kind"],
-                "source": row["source"],
-                "payload": json.loads(row["payload_json"]),
-            }
-        )
-    return events
+    return rewritten
 
 
 def get_summary(scope: str) -> str:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT text FROM summaries WHERE scope = ?", (scope,))
-    row = cur.fetchone()
-    conn.close()
-    return row["text"] if row else ""
+    return engine().get_summary(scope)
 
 
 def set_summary(scope: str, text: str) -> None:
+    engine().set_summary(scope, text)
+
+
+def get_identity_version() -> tuple[Optional[int], dict]:
+    """Return ``(row_id, model)`` for the latest identity model.
+
+    ``row_id`` is ``None`` when no model has been stored yet.
+    """
+    latest = engine().latest_identity()
+    if latest is None:
+        return None, DEFAULT_IDENTITY_MODEL.copy()
+    return latest
+
+
+def get_identity_model() -> dict:
+    return get_identity_version()[1]
+
+
+def set_identity_model(model: dict, parent_id: Optional[int] = None) -> int:
+    """Append ``model`` as the successor of version ``parent_id``.
+
+    This is a compare-and-swap: if the latest stored version is not
+    ``parent_id`` (another worker got there first) nothing is written and
+    ``IdentityConflict`` is raised. ``parent_id=None`` only succeeds on an
+    empty table.
+    """
+    return engine().append_identity(model, parent_id)
+
+
+def _fts_query(query: str) -> str:
+    """Quote each word so user input cannot inject FTS5 query syntax."""
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+
+
+def search(query: str, limit: int = 20, offset: int = 0) -> list[dict]:
+    """BM25-ranked full-text search over event text and identity themes.
+
+    Every word in ``query`` must match. Returns an empty list for a query with
+    no words. Each result carries the full indexed ``content`` as well as a
+    ``snippet`` of it.
+    """
+    match = _fts_query(query)
+    if not match:
+        return []
     conn = get_conn()
     cur = conn.cursor()
     cur.execute(
         """
-        INSERT INTO summaries(scope, text, ts)
-        VALUES(?,?,?)
-        ON CONFLICT(scope) DO UPDATE SET text=excluded.text, ts=excluded.ts
+        SELECT source, ref_id, kind, ts, content, bm25(search_index) AS score,
+               snippet(search_index, 0, '[', ']', '...', 12) AS snippet
+        FROM search_index WHERE search_index MATCH ?
+        ORDER BY score LIMIT ? OFFSET ?
         """,
-        (scope, text, utc_now()),
+        (match, limit, offset),
     )
-    conn.commit()
+    rows = cur.fetchall()
     conn.close()
+    return [dict(row) for row in rows]
+
+
+_BACKFILL_SQL = {
+    "events": (
+        "INSERT INTO search_index(content, source, ref_id, kind, ts) "
+        f"SELECT {EVENT_TEXT_SQL.format(row='e')}, 'event', e.id, e.kind, e.ts "
+        "FROM events e WHERE e.id > ? AND e.id <= ? AND e.codec = 'json' "
+        "AND json_valid(e.payload_json) "
+        f"AND {EVENT_TEXT_SQL.format(row='e')} != ''"
+    ),
+    "identity_models": (
+        "INSERT INTO search_index(content, source, ref_id, kind, ts) "
+        f"SELECT {IDENTITY_TEXT_SQL.format(row='m')}, 'identity', m.id, 'identity', m.ts "
+        "FROM identity_models m WHERE m.id > ? AND m.id <= ? AND json_valid(m.model_json) "
+        f"AND {IDENTITY_TEXT_SQL.format(row='m')} != ''"
+    ),
+}
 
 
-def get_identity_model() -> dict:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT model_json FROM identity_models ORDER BY id DESC LIMIT 1")
-    row = cur.fetchone()
-    conn.close()
-    if not row:
-        return DEFAULT_IDENTITY_MODEL.copy()
-    return json.loads(row["model_json"])
-
+def backfill_search_index(batch_size: int = 500) -> bool:
+    """Index one batch of rows that predate the search index.
 
-def set_identity_model(model: dict) -> None:
+    Each call is one short transaction, so it can run against a live DB.
+    Returns True once nothing is left to backfill.
+    """
+    state_text = _SQLITE.get_summary(SEARCH_BACKFILL_SCOPE)
+    if not state_text:
+        return True
+    state = json.loads(state_text)
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO identity_models(ts, model_json) VALUES(?,?)",
-        (utc_now(), json.dumps(model, ensure_ascii=False)),
-    )
+    for table, (done, upto) in state.items():
+        if done >= upto:
+            continue
+        end = min(done + batch_size, upto)
+        conn.execute(_BACKFILL_SQL[table], (done, end))
+        if table == "events":
+            compressed = conn.execute(
+                "SELECT id, ts, kind, codec, payload_json FROM events "
+                "WHERE id > ? AND id <= ? AND codec != 'json'",
+                (done, end),
+            ).fetchall()
+            for row in compressed:
+                payload = decode_payload(row["codec"], row["payload_json"])
+                _index_event(conn.cursor(), row["id"], row["kind"], row["ts"], payload)
+        state[table] = [end, upto]
+        break
+    remaining = any(done < upto for done, upto in state.values())
+    if remaining:
+        conn.execute(
+            "UPDATE summaries SET text = ?, ts = ? WHERE scope = ?",
+            (json.dumps(state), utc_now(), SEARCH_BACKFILL_SCOPE),
+        )
+    else:
+        conn.execute("DELETE FROM summaries WHERE scope = ?", (SEARCH_BACKFILL_SCOPE,))
     conn.commit()
     conn.close()
+    return not remaining
+
+
+register_backfill(SEARCH_BACKFILL_SCOPE, backfill_search_index)
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 
 import requests
 
@@ -14,11 +15,22 @@ def _headers() -> dict:
     return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
 
 
-def create_post(submolt: str, title: str, body: str) -> dict:
+def create_post(
+    submolt: str,
+    title: str,
+    body: str,
+    idempotency_key: Optional[str] = None,
+    session: Optional[requests.Session] = None,
+) -> dict:
     base = os.environ.get("MOLTBOOK_BASE_URL", "https://moltbook.com")
     url = base.rstrip("/") + "/api/posts"
     payload = {"submolt": submolt, "title": title, "body": body}
-    response = requests.post(url, headers=_headers(), json=payload, timeout=30)
+    headers = _headers()
+    if idempotency_key:
+        # Lets the server drop duplicates when a retry follows a lost response.
+        headers["Idempotency-Key"] = idempotency_key
+    post = session.post if session is not None else requests.post
+    response = post(url, headers=headers, json=payload, timeout=30)
     if response.status_code >= 400:
         raise MoltbookError(f"HTTP {response.status_code}: {response.text[:500]}")
     return response.json()
@@ -0,0 +1,203 @@
+"""Objectives: persistent, prioritized goals stored as first-class data.
+
+See ``docs/objectives-database-proposal.md``. Active objectives are kept in a
+per-shard in-memory list ordered by priority. It is rebuilt when this worker
+changes an objective and refreshed periodically for changes made by other
+workers, so reading the top objectives for a draft never queries the DB.
+
+Progress is scored in the background, not by an LLM call per draft: each
+scan counts the output events since the objective's watermark that share
+enough keywords with its title and description.
+"""
+
+from typing import Optional
+
+from .db import current_shard, get_conn
+from .memory import utc_now
+from .payloads import decode_payload
+from .topics import keywords
+
+STATUSES = ("active", "paused", "completed", "abandoned")
+RETIRED_STATUSES = ("completed", "abandoned")
+# ``progress`` is not here: ``scan_progress`` owns it and would overwrite edits.
+UPDATABLE_FIELDS = ("title", "description", "priority", "status")
+# Shared keywords needed for an output to count as related to an objective.
+RELATED_MIN_SHARED = 2
+SCAN_BATCH_SIZE = 500
+SCAN_INTERVAL_S = 60
+CACHE_REFRESH_INTERVAL_S = 10
+
+
+def _row_to_dict(row) -> dict:
+    objective = dict(row)
+    objective.pop("progress_event_id", None)
+    return objective
+
+
+def read_active(conn) -> list[dict]:
+    """Active objectives in ``conn``'s database, most important first."""
+    rows = conn.execute(
+        "SELECT * FROM objectives WHERE status = 'active' ORDER BY priority, id"
+    ).fetchall()
+    return [_row_to_dict(row) for row in rows]
+
+
+def refresh_cache() -> list[dict]:
+    """Reload this shard's active objectives, most important first."""
+    conn = get_conn()
+    active = read_active(conn)
+    conn.close()
+    current_shard().cache["objectives"] = active
+    return active
+
+
+def get_active_objectives(limit: int = 10) -> list[dict]:
+    """Active objectives sorted by priority (ascending = most important)."""
+    active = current_shard().cache.get("objectives")
+    if active is None:
+        active = refresh_cache()
+    return active[:limit]
+
+
+def get_objective(objective_id: int) -> Optional[dict]:
+    conn = get_conn()
+    row = conn.execute("SELECT * FROM objectives WHERE id = ?", (objective_id,)).fetchone()
+    conn.close()
+    return _row_to_dict(row) if row else None
+
+
+def list_objectives(status: str = "active", limit: int = 20) -> list[dict]:
+    conn = get_conn()
+    if status == "all":
+        rows = conn.execute(
+            "SELECT * FROM objectives ORDER BY priority, id LIMIT ?", (limit,)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT * FROM objectives WHERE status = ? ORDER BY priority, id LIMIT ?",
+            (status, limit),
+        ).fetchall()
+    conn.close()
+    return [_row_to_dict(row) for row in rows]
+
+
+def add_objective(
+    title: str, description: str, priority: int = 100, proposed_by: str = "user"
+) -> int:
+    """Insert a new active objective. Returns its ID."""
+    now = utc_now()
+    conn = get_conn()
+    cur = conn.execute(
+        """
+        INSERT INTO objectives(title, description, priority, proposed_by,
+                               created_ts, updated_ts)
+        VALUES(?,?,?,?,?,?)
+        """,
+        (title, description, priority, proposed_by, now, now),
+    )
+    conn.commit()
+    objective_id = int(cur.lastrowid)
+    conn.close()
+    refresh_cache()
+    return objective_id
+
+
+def update_objective(objective_id: int, **fields) -> Optional[dict]:
+    """Update mutable fields. Returns the updated objective, or None if missing."""
+    unknown = set(fields) - set(UPDATABLE_FIELDS)
+    if unknown:
+        raise ValueError(f"Cannot update fields: {sorted(unknown)}")
+    if "status" in fields and fields["status"] not in STATUSES:
+        raise ValueError(f"Invalid status: {fields['status']!r}")
+    if fields:
+        fields["updated_ts"] = utc_now()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = get_conn()
+        conn.execute(
+            f"UPDATE objectives SET {assignments} WHERE id = ?",
+            (*fields.values(), objective_id),
+        )
+        conn.commit()
+        conn.close()
+        refresh_cache()
+    return get_objective(objective_id)
+
+
+def retire_objective(objective_id: int, status: str = "completed") -> Optional[dict]:
+    if status not in RETIRED_STATUSES:
+        raise ValueError(f"Retired status must be one of {RETIRED_STATUSES}")
+    return update_objective(objective_id, status=status)
+
+
+def _progress_text(related: int, last_ts: Optional[str]) -> str:
+    if not related:
+        return "No related activity yet."
+    return f"{related} related output{'s' if related != 1 else ''}, most recent {last_ts}."
+
+
+def scan_progress(batch_size: int = SCAN_BATCH_SIZE) -> int:
+    """Score active objectives against output events past their watermarks.
+
+    Returns the number of objectives whose progress changed.
+    """
+    conn = get_conn()
+    active = conn.execute(
+        "SELECT id, title, description, related_outputs, last_related_ts, progress_event_id "
+        "FROM objectives WHERE status = 'active'"
+    ).fetchall()
+    if not active:
+        conn.close()
+        return 0
+    start = min(row["progress_event_id"] for row in active)
+    events = conn.execute(
+        "SELECT id, ts, codec, payload_json FROM events WHERE kind = 'output' AND id > ? "
+        "ORDER BY id LIMIT ?",
+        (start, batch_size),
+    ).fetchall()
+    if not events:
+        conn.close()
+        return 0
+    event_keywords = [
+        (
+            row["id"],
+            row["ts"],
+            set(keywords(decode_payload(row["codec"], row["payload_json"]).get("text", ""))),
+        )
+        for row in events
+    ]
+
+    changed = 0
+    now = utc_now()
+    for objective in active:
+        wanted = set(keywords(f"{objective['title']} {objective['description']}", n=16))
+        related = objective["related_outputs"]
+        last_ts = objective["last_related_ts"]
+        for event_id, ts, words in event_keywords:
+            if event_id <= objective["progress_event_id"]:
+                continue
+            if len(wanted & words) >= RELATED_MIN_SHARED:
+                related += 1
+                last_ts = ts
+        if related != objective["related_outputs"]:
+            changed += 1
+        conn.execute(
+            """
+            UPDATE objectives SET related_outputs = ?, last_related_ts = ?, progress = ?,
+                progress_event_id = ?, updated_ts = CASE WHEN ? THEN ? ELSE updated_ts END
+            WHERE id = ?
+            """,
+            (
+                related,
+                last_ts,
+                _progress_text(related, last_ts),
+                max(objective["progress_event_id"], events[-1]["id"]),
+                related != objective["related_outputs"],
+                now,
+                objective["id"],
+            ),
+        )
+    conn.commit()
+    conn.close()
+    if changed:
+        refresh_cache()
+    return changed
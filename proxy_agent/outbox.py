@@ -0,0 +1,214 @@
+"""Durable publishing outbox.
+
+``/draft`` writes the output event and an ``outbox`` row in one transaction
+and returns immediately. A leader-elected background job delivers due rows
+with a pooled HTTP session, a per-destination rate limit, exponential
+backoff and an idempotency key, and dead-letters rows that keep failing.
+
+A row is claimed (``status = 'sending'``) before it is delivered, so two
+workers never post it at the same time. A claim that is not settled within
+``SENDING_TIMEOUT_S`` (the worker died mid-delivery) makes the row due again.
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+import requests
+
+from .background import lease_held
+from .db import get_conn
+from .memory import append_event, insert_event, utc_now
+from .moltbook import create_post
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+BACKOFF_BASE_S = float(os.environ.get("OUTBOX_BACKOFF_BASE_S", "5"))
+BACKOFF_MAX_S = float(os.environ.get("OUTBOX_BACKOFF_MAX_S", "3600"))
+BATCH_SIZE = 20
+POLL_INTERVAL_S = float(os.environ.get("OUTBOX_POLL_INTERVAL_S", "2"))
+# Longer than any one delivery; moltbook.create_post times out after 30 s.
+SENDING_TIMEOUT_S = float(os.environ.get("OUTBOX_SENDING_TIMEOUT_S", "120"))
+
+_SESSION = requests.Session()
+
+
+def _deliver_moltbook(payload: dict, idempotency_key: str) -> dict:
+    return create_post(
+        payload["submolt"],
+        payload["title"],
+        payload["body"],
+        idempotency_key=idempotency_key,
+        session=_SESSION,
+    )
+
+
+DESTINATIONS: dict[str, Callable[[dict, str], dict]] = {
+    "moltbook": _deliver_moltbook,
+}
+
+
+class _RateLimiter:
+    """Minimum spacing between deliveries to one destination."""
+
+    def __init__(self) -> None:
+        self._next_allowed: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, destination: str, now: float) -> bool:
+        per_min = float(os.environ.get(f"OUTBOX_{destination.upper()}_RATE_PER_MIN", "30"))
+        with self._lock:
+            if now < self._next_allowed.get(destination, 0.0):
+                return False
+            self._next_allowed[destination] = now + 60.0 / per_min
+            return True
+
+
+_limiter = _RateLimiter()
+
+
+def enqueue_output(output: dict, destination: str, post: dict) -> tuple[int, int]:
+    """Log the ``output`` event and queue ``post`` atomically.
+
+    Returns ``(event_id, outbox_id)``.
+    """
+    now = utc_now()
+    conn = get_conn()
+    cur = conn.cursor()
+    event_id = insert_event(cur, "output", "agent", output)
+    cur.execute(
+        """
+        INSERT INTO outbox(event_id, destination, payload_json, idempotency_key,
+                           next_attempt, created_ts, updated_ts)
+        VALUES(?,?,?,?,?,?,?)
+        """,
+        (
+            event_id,
+            destination,
+            json.dumps(post, ensure_ascii=False),
+            uuid.uuid4().hex,
+            time.time(),
+            now,
+            now,
+        ),
+    )
+    outbox_id = int(cur.lastrowid)
+    conn.commit()
+    conn.close()
+    return event_id, outbox_id
+
+
+def get_status(outbox_id: int) -> Optional[dict]:
+    conn = get_conn()
+    row = conn.execute(
+        """
+        SELECT id, event_id, destination, status, attempts, last_error,
+               response_json, created_ts, updated_ts
+        FROM outbox WHERE id = ?
+        """,
+        (outbox_id,),
+    ).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    status = dict(row)
+    response_json = status.pop("response_json")
+    status["response"] = json.loads(response_json) if response_json else None
+    return status
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _record(outbox_id: int, **fields) -> None:
+    fields["updated_ts"] = utc_now()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn = get_conn()
+    conn.execute(
+        f"UPDATE outbox SET {assignments} WHERE id = ?", (*fields.values(), outbox_id)
+    )
+    conn.commit()
+    conn.close()
+
+
+def _claim(outbox_id: int, now: float) -> bool:
+    """Mark a due row as being sent by this worker. False if another worker has it."""
+    conn = get_conn()
+    cur = conn.execute(
+        """
+        UPDATE outbox SET status = 'sending', next_attempt = ?, updated_ts = ?
+        WHERE id = ? AND status IN ('pending', 'sending') AND next_attempt <= ?
+        """,
+        (now + SENDING_TIMEOUT_S, utc_now(), outbox_id, now),
+    )
+    conn.commit()
+    claimed = cur.rowcount == 1
+    conn.close()
+    return claimed
+
+
+def deliver_due(now: Optional[float] = None) -> int:
+    """Attempt each due row once. Returns the number delivered.
+
+    Rows held back by the rate limit stay due and are picked up next tick.
+    """
+    now = time.time() if now is None else now
+    conn = get_conn()
+    rows = conn.execute(
+        """
+        SELECT id, destination, payload_json, idempotency_key, attempts
+        FROM outbox WHERE status IN ('pending', 'sending') AND next_attempt <= ?
+        ORDER BY id LIMIT ?
+        """,
+        (now, BATCH_SIZE),
+    ).fetchall()
+    conn.close()
+
+    delivered = 0
+    for row in rows:
+        if not lease_held():
+            break
+        deliver = DESTINATIONS.get(row["destination"])
+        if deliver is None:
+            error = f"Unknown destination: {row['destination']}"
+            _record(row["id"], status="dead", last_error=error)
+            continue
+        if not _limiter.try_acquire(row["destination"], time.monotonic()):
+            continue
+        if not _claim(row["id"], now):
+            continue
+        try:
+            response = deliver(json.loads(row["payload_json"]), row["idempotency_key"])
+        except Exception as exc:  # noqa: BLE001 - every failure is retried or dead-lettered
+            attempts = row["attempts"] + 1
+            error = f"{type(exc).__name__}: {exc}"[:500]
+            if attempts >= MAX_ATTEMPTS:
+                logger.warning("Outbox %s dead-lettered after %d attempts", row["id"], attempts)
+                _record(row["id"], status="dead", attempts=attempts, last_error=error)
+            else:
+                _record(
+                    row["id"],
+                    status="pending",
+                    attempts=attempts,
+                    last_error=error,
+                    next_attempt=now + _backoff(attempts),
+                )
+            continue
+        _record(
+            row["id"],
+            status="sent",
+            attempts=row["attempts"] + 1,
+            last_error=None,
+            response_json=json.dumps(response, ensure_ascii=False),
+        )
+        append_event("tool", f"{row['destination']}.create_post", response)
+        delivered += 1
+    return delivered
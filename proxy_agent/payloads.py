@@ -0,0 +1,77 @@
+"""Event payload encoding.
+
+With ``EVENT_PAYLOAD_CODEC=zlib``, payloads of at least
+``EVENT_COMPRESS_MIN_BYTES`` bytes are stored as compact JSON compressed with
+zlib and a preset dictionary. The dictionary holds strings that recur in
+nearly every payload (field names, default values, the identity vocabulary).
+Each event row records its ``codec``, so both formats can coexist in one table
+and the dictionary can change under a new codec name without breaking older
+rows. Smaller payloads, and every payload with the default ``json`` codec,
+are stored as plain JSON text.
+"""
+
+import json
+import os
+import zlib
+from typing import Union
+
+JSON = "json"
+ZLIB_V1 = "zlib1"
+
+# zlib uses the end of the dictionary most effectively, so the most common
+# strings come last.
+_ZDICT_V1 = (
+    b"the and that this with from into what which their there about would could "
+    b"identity voice memory recursion persistence covenant reflection agent "
+    b"themes roles objectives values tensions recent_reflections "
+    b'"similarity":"latency_ms":"input_tokens":"output_tokens":"cost_usd":'
+    b'"error":"reason":"source_id":"label":"id":'
+    b'"publish":false,"publish":true,"submolt":null,"submolt":"'
+    b'"intent":"moltbook_post","text":"{"title":"","body":"'
+)
+_ZDICTS = {ZLIB_V1: _ZDICT_V1}
+
+
+def codec() -> str:
+    """The codec new payloads are written with."""
+    return ZLIB_V1 if os.environ.get("EVENT_PAYLOAD_CODEC", JSON) == "zlib" else JSON
+
+
+def compress_min_bytes() -> int:
+    return int(os.environ.get("EVENT_COMPRESS_MIN_BYTES", "512"))
+
+
+def _compress(data: bytes, name: str) -> bytes:
+    compressor = zlib.compressobj(level=6, zdict=_ZDICTS[name])
+    return compressor.compress(data) + compressor.flush()
+
+
+def encode_payload(payload: dict) -> tuple[str, Union[str, bytes]]:
+    """Return ``(codec, stored_value)`` for ``payload``."""
+    name = codec()
+    if name != JSON:
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if len(data) >= compress_min_bytes():
+            return name, _compress(data, name)
+    return JSON, json.dumps(payload, ensure_ascii=False)
+
+
+def decode_payload(name: str, value: Union[str, bytes]) -> dict:
+    if name == JSON:
+        return json.loads(value)
+    if name not in _ZDICTS:
+        raise ValueError(f"Unknown payload codec: {name!r}")
+    decompressor = zlib.decompressobj(zdict=_ZDICTS[name])
+    return json.loads(decompressor.decompress(value) + decompressor.flush())
+
+
+def event_text(kind: str, payload: dict) -> str:
+    """The text the search index holds for an event; mirrors ``db.EVENT_TEXT_SQL``."""
+    if kind == "input":
+        keys = ("title", "body")
+    elif kind == "output" and payload.get("ok") is True:
+        keys = ("text",)
+    else:
+        return ""
+    parts = [payload.get(key) for key in keys]
+    return " ".join("" if part is None else str(part) for part in parts).strip()
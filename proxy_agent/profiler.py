@@ -0,0 +1,184 @@
+"""On-demand sampling profiler for ``/draft``.
+
+Profiling is off until an admin arms it for the next N requests and/or T
+seconds (``POST /admin/profile``), or sends ``X-Profile`` with a single
+request. While a request is profiled, a sampler thread records its thread's
+stack every ``PROFILE_INTERVAL_MS``. Each sample is filed under the pipeline
+stage the request last entered with ``mark``. When the request finishes, its
+samples are written to ``PROFILE_DIR`` in collapsed-stack format
+(``stage;frame;frame count``), which flamegraph.pl and speedscope read
+directly. The stage is the root frame, so the flame graph splits by stage.
+
+When nothing is profiled, ``mark`` and ``request`` only test a module global.
+The sampler thread exits as soon as no request is being profiled.
+
+Samples are wall-clock: time spent waiting on a backend shows up as socket
+reads inside the ``draft`` or ``voice`` stage.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from itertools import count
+from pathlib import Path
+from typing import Iterator, Optional
+
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", "profiles"))
+INTERVAL_S = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+# Deepest stack recorded per sample; deeper frames are dropped from the root.
+MAX_DEPTH = 128
+
+
+class _Profile:
+    __slots__ = ("stage", "samples")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.samples: Counter = Counter()
+
+
+# Profiled threads by ident. Empty whenever nothing is being profiled.
+_threads: dict[int, _Profile] = {}
+_lock = threading.Lock()
+_sampler: Optional[threading.Thread] = None
+# The armed session: {"remaining": int | None, "until": float | None, ...}.
+_session: Optional[dict] = None
+_seq = count(1)
+# Paths of the most recently written profiles, newest last.
+_recent: deque = deque(maxlen=50)
+
+
+def arm(requests: Optional[int] = None, seconds: Optional[float] = None) -> dict:
+    """Profile the next ``requests`` draft requests and/or those in the next
+    ``seconds``, whichever runs out first."""
+    global _session
+    if requests is None and seconds is None:
+        raise ValueError("Give a request count, a duration or both")
+    with _lock:
+        _session = {
+            "remaining": requests,
+            "until": None if seconds is None else time.monotonic() + seconds,
+            "profiled": 0,
+        }
+    return status()
+
+
+def disarm() -> dict:
+    global _session
+    with _lock:
+        _session = None
+    return status()
+
+
+def status() -> dict:
+    with _lock:
+        session = _session
+        result = {"armed": session is not None, "dir": str(PROFILE_DIR), "recent": list(_recent)}
+        if session is not None:
+            until = session["until"]
+            result["remaining_requests"] = session["remaining"]
+            result["remaining_s"] = (
+                None if until is None else max(0.0, round(until - time.monotonic(), 1))
+            )
+            result["profiled"] = session["profiled"]
+        return result
+
+
+def _claim() -> bool:
+    """Take one request from the armed session, ending it when used up."""
+    global _session
+    with _lock:
+        session = _session
+        if session is None:
+            return False
+        if session["until"] is not None and time.monotonic() >= session["until"]:
+            _session = None
+            return False
+        if session["remaining"] is not None:
+            session["remaining"] -= 1
+            if session["remaining"] <= 0:
+                _session = None
+        session["profiled"] += 1
+        return True
+
+
+def _frame_name(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+
+def _sample() -> None:
+    global _sampler
+    while True:
+        frames = sys._current_frames()
+        with _lock:
+            if not _threads:
+                _sampler = None
+                return
+            for ident, profile in _threads.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(profile.stage)
+                profile.samples[";".join(reversed(stack))] += 1
+        del frames
+        time.sleep(INTERVAL_S)
+
+
+def _write(name: str, profile: _Profile) -> Optional[Path]:
+    if not profile.samples:
+        return None
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    path = PROFILE_DIR / f"{name}-{stamp}-{os.getpid()}-{next(_seq)}.folded"
+    lines = (f"{stack} {n}\n" for stack, n in sorted(profile.samples.items()))
+    path.write_text("".join(lines), encoding="utf-8")
+    return path
+
+
+@contextmanager
+def _profiled(name: str, result: dict) -> Iterator[None]:
+    global _sampler
+    ident = threading.get_ident()
+    profile = _Profile("start")
+    with _lock:
+        _threads[ident] = profile
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample, name="profiler", daemon=True)
+            _sampler.start()
+    try:
+        yield
+    finally:
+        with _lock:
+            _threads.pop(ident, None)
+        path = _write(name, profile)
+        if path is not None:
+            result["path"] = str(path)
+            with _lock:
+                _recent.append(str(path))
+
+
+def request(name: str, forced: bool = False, result: Optional[dict] = None):
+    """Profile the block if ``forced`` or the armed session has room.
+
+    The written file's path is stored under ``"path"`` in ``result``.
+    """
+    if not forced and _session is None:
+        return nullcontext()
+    if not forced and not _claim():
+        return nullcontext()
+    return _profiled(name, {} if result is None else result)
+
+
+def mark(stage: str) -> None:
+    """File the current thread's following samples under ``stage``."""
+    if not _threads:
+        return
+    profile = _threads.get(threading.get_ident())
+    if profile is not None:
+        profile.stage = stage
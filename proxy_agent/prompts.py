@@ -31,3 +31,25 @@ Return JSON only (no markdown) with keys:
 - recent_reflections (array of memory IDs or empty)
 Preserve stable axioms and avoid secrets or credentials.
 """
+
+TOPIC_SUMMARY_SYSTEM = """You maintain a rolling summary of one topic a persistent agent has written about.
+Given the previous summary and the agent's newest outputs on the topic, return an updated summary.
+Keep it under 150 words. Preserve stable positions and note how they developed.
+Do not include secrets or credentials. Output summary only.
+"""
+
+# JSON Schema of the identity model, sent to backends that support structured output.
+# Only ``themes`` is required: keys the response leaves out keep their defaults
+# (see ``app._normalize_identity_model``) instead of discarding the update.
+IDENTITY_MODEL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "themes": {"type": "string"},
+        "roles": {"type": "array", "items": {"type": "string"}},
+        "objectives": {"type": "array"},
+        "values": {"type": "array", "items": {"type": "string"}},
+        "tensions": {"type": "array", "items": {"type": "string"}},
+        "recent_reflections": {"type": "array"},
+    },
+    "required": ["themes"],
+}
@@ -1,6 +1,6 @@
 import re
 
-from .db import get_conn
+from .storage import engine
 
 DEFAULT_BLOCK_PATTERNS = [
     r"sk-[A-Za-z0-9]{20,}",
@@ -11,12 +11,7 @@ DEFAULT_BLOCK_PATTERNS = [
 
 
 def _load_extra_patterns() -> list[str]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT pattern FROM secrets_blocklist")
-    rows = cur.fetchall()
-    conn.close()
-    return [row["pattern"] for row in rows]
+    return engine().blocklist_patterns()
 
 
 def check_publishable(text: str) -> tuple[bool, str]:
@@ -0,0 +1,329 @@
+"""Replay logged ``input`` events through the draft -> voice -> gate pipeline.
+
+Used to compare backend configurations on real traffic and to warm up a
+fresh deployment. Results are written to a separate output database so the
+production event log and identity history are never touched. Draft prompts
+get their topic and objective context from the source database, as in
+production, and outputs are gated with the source's blocklist patterns::
+
+    python -m proxy_agent.replay --source agent.db --output replay.db \\
+        --label claude --env LLM_DRAFT_BACKEND=claude --concurrency 4
+    python -m proxy_agent.replay --output replay.db --report
+"""
+
+import argparse
+import difflib
+import json
+import os
+import sqlite3
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+from . import db, llms
+from .app import DraftRequest, _draft_context, _generate
+from .llms import collect_usage
+from .memory import (
+    DEFAULT_IDENTITY_MODEL,
+    append_event,
+    get_identity_model,
+    get_identity_version,
+    get_summary,
+    set_identity_model,
+    set_summary,
+)
+from .objectives import read_active
+from .payloads import JSON, decode_payload
+from .storage import engine
+from .topics import read_topics
+
+REPLAY_KIND = "replay"
+SOURCE_BATCH_SIZE = 500
+
+
+class ReplayError(RuntimeError):
+    pass
+
+
+@dataclass
+class ReplayItem:
+    source_id: int
+    request: dict
+    original: Optional[dict] = None
+
+
+def _iter_db_events(path: Path, after_id: int) -> Iterator[dict]:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        last_id = after_id
+        while True:
+            rows = conn.execute(
+                "SELECT * FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, SOURCE_BATCH_SIZE),
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield {
+                    "id": row["id"],
+                    "kind": row["kind"],
+                    # Source databases from before the codec column hold plain JSON.
+                    "payload": decode_payload(
+                        row["codec"] if "codec" in row.keys() else JSON, row["payload_json"]
+                    ),
+                }
+            last_id = rows[-1]["id"]
+    finally:
+        conn.close()
+
+
+def _iter_archive_events(path: Path, after_id: int) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["id"] > after_id:
+                yield event
+
+
+def iter_replay_items(source: Path, after_id: int = 0) -> Iterator[ReplayItem]:
+    """Stream input events from a DB or JSONL archive, paired with their output.
+
+    The original output is the first ``output`` event logged after the input
+    and before the next input.
+    """
+    if source.suffix == ".jsonl":
+        events = _iter_archive_events(source, after_id)
+    else:
+        events = _iter_db_events(source, after_id)
+
+    pending: Optional[ReplayItem] = None
+    for event in events:
+        if event["kind"] == "input":
+            if pending is not None:
+                yield pending
+            pending = ReplayItem(event["id"], event["payload"])
+        elif event["kind"] == "output" and pending is not None and pending.original is None:
+            pending.original = event["payload"]
+            yield pending
+            pending = None
+    if pending is not None:
+        yield pending
+
+
+def _latest_source_identity(source: Path) -> dict:
+    if source.suffix == ".jsonl":
+        return DEFAULT_IDENTITY_MODEL.copy()
+    conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    try:
+        row = conn.execute(
+            "SELECT model_json FROM identity_models ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    finally:
+        conn.close()
+    return json.loads(row[0]) if row else DEFAULT_IDENTITY_MODEL.copy()
+
+
+def _source_context(source: Path) -> tuple[list[dict], list[dict]]:
+    """Topics and active objectives of the source DB, for the draft prompt."""
+    if source.suffix == ".jsonl":
+        return [], []
+    conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        found = []
+        # Source databases from before topics or objectives lack the tables.
+        for read in (read_topics, read_active):
+            try:
+                found.append(read(conn))
+            except sqlite3.OperationalError:
+                found.append([])
+    finally:
+        conn.close()
+    return found[0], found[1]
+
+
+def _copy_source_blocklist(source: Path) -> None:
+    """Add the source DB's blocklist patterns to the output DB.
+
+    Otherwise ``gate_changed`` would also count patterns the output DB lacks.
+    """
+    if source.suffix == ".jsonl":
+        return
+    conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    try:
+        rows = conn.execute("SELECT pattern FROM secrets_blocklist ORDER BY id").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    store = engine()
+    present = set(store.blocklist_patterns())
+    for (pattern,) in rows:
+        if pattern not in present:
+            store.add_blocklist_pattern(pattern)
+            present.add(pattern)
+
+
+def _similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+def _replay_one(
+    item: ReplayItem, identity_model: dict, context: tuple[list[dict], list[dict]]
+) -> dict:
+    result = {"source_id": item.source_id}
+    start = time.perf_counter()
+    with collect_usage() as calls:
+        try:
+            req = DraftRequest(**item.request)
+            ok, reason, text = _generate(req, identity_model, _draft_context(req, *context))
+        except Exception as exc:  # noqa: BLE001 - recorded per item, replay continues
+            result.update(error=f"{type(exc).__name__}: {exc}")
+            ok, reason, text = False, "error", ""
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    result["input_tokens"] = sum(call.usage.input_tokens for call in calls)
+    result["output_tokens"] = sum(call.usage.output_tokens for call in calls)
+    result["cost_usd"] = sum(call.cost_usd for call in calls)
+    result.update(ok=ok, reason=reason, text=text)
+    if item.original is not None and "error" not in result:
+        original_text = item.original.get("text", "")
+        result["original_ok"] = item.original.get("ok")
+        result["similarity"] = round(_similarity(original_text, text), 4)
+    return result
+
+
+def _checkpoint_scope(label: str) -> str:
+    return f"replay:{label}:checkpoint"
+
+
+def run_replay(
+    source: Path,
+    output: Path,
+    label: str,
+    concurrency: int = 4,
+    limit: Optional[int] = None,
+    env: Optional[dict] = None,
+) -> int:
+    """Replay ``source`` into ``output`` under ``label``. Returns items replayed.
+
+    Progress is checkpointed after every batch, so an interrupted run resumes
+    from the last completed input event.
+    """
+    if source.resolve() == output.resolve():
+        raise ReplayError("Output DB must differ from the source DB")
+    if env:
+        os.environ.update(env)
+        llms.reload()
+
+    db.DB_PATH = output
+    db.init_db()
+    if get_identity_version()[0] is None:
+        set_identity_model(_latest_source_identity(source))
+    identity_model = get_identity_model()
+    context = _source_context(source)
+    _copy_source_blocklist(source)
+
+    checkpoint = int(get_summary(_checkpoint_scope(label)) or 0)
+    items = iter_replay_items(source, after_id=checkpoint)
+    done = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while limit is None or done < limit:
+            batch_size = concurrency if limit is None else min(concurrency, limit - done)
+            batch = [item for _, item in zip(range(batch_size), items)]
+            if not batch:
+                break
+            for result in pool.map(lambda it: _replay_one(it, identity_model, context), batch):
+                append_event(REPLAY_KIND, label, result)
+            set_summary(_checkpoint_scope(label), str(batch[-1].source_id))
+            done += len(batch)
+    return done
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_report(output: Path) -> dict:
+    """Aggregate replay results in ``output`` per label."""
+    conn = sqlite3.connect(output)
+    rows = conn.execute(
+        "SELECT source, codec, payload_json FROM events WHERE kind = ? ORDER BY id",
+        (REPLAY_KIND,),
+    ).fetchall()
+    conn.close()
+
+    grouped: dict[str, list[dict]] = {}
+    for label, name, payload_json in rows:
+        grouped.setdefault(label, []).append(decode_payload(name, payload_json))
+
+    report = {}
+    for label, results in grouped.items():
+        latencies = [r["latency_ms"] for r in results if "error" not in r]
+        similarities = [r["similarity"] for r in results if "similarity" in r]
+        report[label] = {
+            "items": len(results),
+            "errors": sum(1 for r in results if "error" in r),
+            "blocked": sum(1 for r in results if "error" not in r and not r["ok"]),
+            "gate_changed": sum(
+                1 for r in results if "original_ok" in r and r["original_ok"] != r["ok"]
+            ),
+            "latency_ms_p50": _percentile(latencies, 50) if latencies else None,
+            "latency_ms_p95": _percentile(latencies, 95) if latencies else None,
+            "similarity_mean": (
+                round(statistics.fmean(similarities), 4) if similarities else None
+            ),
+            "input_tokens": sum(r.get("input_tokens", 0) for r in results),
+            "output_tokens": sum(r.get("output_tokens", 0) for r in results),
+            "cost_usd": round(sum(r.get("cost_usd", 0.0) for r in results), 6),
+        }
+    return report
+
+
+def _parse_env(pairs: list[str]) -> dict:
+    env = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"Expected KEY=VALUE, got {pair!r}")
+        env[key] = value
+    return env
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m proxy_agent.replay")
+    parser.add_argument("--source", type=Path, help="agent DB or JSONL event archive")
+    parser.add_argument("--output", type=Path, required=True, help="isolated output DB")
+    parser.add_argument("--label", default="default", help="name of this backend config")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--report", action="store_true", help="print the report and exit")
+    args = parser.parse_args(argv)
+
+    if not args.report:
+        if args.source is None:
+            parser.error("--source is required unless --report is given")
+        run_replay(
+            args.source,
+            args.output,
+            args.label,
+            concurrency=args.concurrency,
+            limit=args.limit,
+            env=_parse_env(args.env),
+        )
+    print(json.dumps(build_report(args.output), indent=2))
+
+
+if __name__ == "__main__":
+    main()
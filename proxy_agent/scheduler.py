@@ -0,0 +1,219 @@
+"""Admission control for the draft pipeline.
+
+Every ``/draft`` run takes a slot from a process-wide pool of
+``DRAFT_MAX_CONCURRENCY`` slots. Requests belong to a priority class
+(``interactive``, ``publish`` or ``bulk``). Each class has its own concurrency
+limit (``DRAFT_<CLASS>_CONCURRENCY``) and queue depth (``DRAFT_<CLASS>_QUEUE``).
+A freed slot goes to the oldest waiter of the highest-priority class that is
+under its limit. A request that finds its class queue full is rejected
+immediately with its would-be queue position and an ETA.
+
+A request may carry a deadline. It gives up waiting for a slot when the
+deadline passes, and ``check_deadline`` lets the pipeline stop between
+stages once the client can no longer use the result.
+
+A run that could use more parallelism (``/draft`` with several candidates)
+asks for extra slots. It gets only those that are free right now without
+passing a waiting request or going over its class or pool limit, and
+``granted_slots`` reports how many it holds.
+"""
+
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+# Highest priority first.
+CLASSES = ("interactive", "publish", "bulk")
+# (concurrency, queue depth). Queued requests hold a threadpool thread, so the
+# totals stay well below the threadpool size (40).
+_DEFAULT_LIMITS = {"interactive": (4, 8), "publish": (2, 8), "bulk": (1, 8)}
+# Smoothing factor for the per-class run time average behind ETAs.
+_EWMA_ALPHA = 0.2
+_INITIAL_RUN_S = 10.0
+
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+current_slots: ContextVar[Optional[int]] = ContextVar("current_slots", default=None)
+
+
+class Overloaded(RuntimeError):
+    """The class queue is full; retry after ``eta_s`` seconds."""
+
+    def __init__(self, priority: str, position: int, eta_s: float):
+        super().__init__(f"Draft queue for {priority!r} is full")
+        self.priority = priority
+        self.position = position
+        self.eta_s = eta_s
+
+
+class DeadlineExceeded(RuntimeError):
+    """The request's deadline passed before the pipeline finished."""
+
+
+def check_deadline(stage: str) -> None:
+    """Raise ``DeadlineExceeded`` if the current request is past its deadline."""
+    deadline = current_deadline.get()
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded(f"Deadline passed before {stage}")
+
+
+def granted_slots(wanted: int) -> int:
+    """How many of ``wanted`` parallel runs the current slot covers.
+
+    Outside a slot (e.g. ``bulk``), nothing limits the run.
+    """
+    slots = current_slots.get()
+    return wanted if slots is None else min(wanted, slots)
+
+
+@dataclass
+class _Class:
+    name: str
+    rank: int
+    limit: int
+    max_queue: int
+    running: int = 0
+    avg_run_s: float = _INITIAL_RUN_S
+
+
+@dataclass(order=True)
+class _Ticket:
+    rank: int
+    seq: int
+    cls: _Class = field(compare=False)
+    slots: int = field(default=1, compare=False)
+
+
+class Scheduler:
+    def __init__(self, total: int, limits: dict[str, tuple[int, int]]):
+        self.total = total
+        self.running = 0
+        self.classes = {
+            name: _Class(name, rank, *limits[name]) for rank, name in enumerate(CLASSES)
+        }
+        self._waiting: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _next_eligible(self) -> Optional[_Ticket]:
+        if self.running >= self.total:
+            return None
+        for ticket in sorted(self._waiting):
+            if ticket.cls.running < ticket.cls.limit:
+                return ticket
+        return None
+
+    def _eta(self, cls: _Class, position: int) -> float:
+        return round((position // max(cls.limit, 1) + 1) * cls.avg_run_s, 1)
+
+    def _queued(self, cls: _Class) -> int:
+        return sum(1 for ticket in self._waiting if ticket.cls is cls)
+
+    def acquire(self, priority: str, deadline: Optional[float] = None) -> _Ticket:
+        """Wait for a slot. Raises ``Overloaded`` or ``DeadlineExceeded``."""
+        cls = self.classes[priority]
+        with self._cond:
+            queued = self._queued(cls)
+            ticket = _Ticket(cls.rank, next(self._seq), cls)
+            self._waiting.append(ticket)
+            if queued >= cls.max_queue and self._next_eligible() is not ticket:
+                self._waiting.remove(ticket)
+                raise Overloaded(priority, queued + 1, self._eta(cls, queued + 1))
+            while self._next_eligible() is not ticket:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    self._waiting.remove(ticket)
+                    # Our place may let a lower-priority waiter through.
+                    self._cond.notify_all()
+                    raise DeadlineExceeded("Deadline passed while queued")
+                self._cond.wait(timeout)
+            self._waiting.remove(ticket)
+            cls.running += 1
+            self.running += 1
+            # Several slots may be free at once.
+            self._cond.notify_all()
+        return ticket
+
+    def take_extra(self, ticket: _Ticket, wanted: int) -> int:
+        """Add up to ``wanted`` free slots to ``ticket``, without waiting.
+
+        Slots a queued request could take are left alone. Returns the number added.
+        """
+        cls = ticket.cls
+        added = 0
+        with self._cond:
+            while (
+                added < wanted
+                and cls.running < cls.limit
+                and self._next_eligible() is None
+                and self.running < self.total
+            ):
+                cls.running += 1
+                self.running += 1
+                added += 1
+            ticket.slots += added
+        return added
+
+    def release(self, ticket: _Ticket, run_s: float) -> None:
+        cls = ticket.cls
+        with self._cond:
+            cls.running -= ticket.slots
+            self.running -= ticket.slots
+            cls.avg_run_s += _EWMA_ALPHA * (run_s - cls.avg_run_s)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(
+        self, priority: str, deadline: Optional[float] = None, extra: int = 0
+    ) -> Iterator[int]:
+        """Hold a slot, plus up to ``extra`` free ones, for the block.
+
+        Yields the number of slots held and exposes it to ``granted_slots``, and
+        ``deadline`` to ``check_deadline``.
+        """
+        ticket = self.acquire(priority, deadline)
+        if extra:
+            self.take_extra(ticket, extra)
+        token = current_deadline.set(deadline)
+        slots_token = current_slots.set(ticket.slots)
+        started = time.monotonic()
+        try:
+            yield ticket.slots
+        finally:
+            current_slots.reset(slots_token)
+            current_deadline.reset(token)
+            self.release(ticket, time.monotonic() - started)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "running": self.running,
+                "max_concurrency": self.total,
+                "classes": {
+                    cls.name: {
+                        "running": cls.running,
+                        "queued": self._queued(cls),
+                        "limit": cls.limit,
+                        "max_queue": cls.max_queue,
+                        "avg_run_s": round(cls.avg_run_s, 3),
+                    }
+                    for cls in self.classes.values()
+                },
+            }
+
+
+def _from_env() -> Scheduler:
+    limits = {}
+    for name, (limit, max_queue) in _DEFAULT_LIMITS.items():
+        limits[name] = (
+            int(os.environ.get(f"DRAFT_{name.upper()}_CONCURRENCY", limit)),
+            int(os.environ.get(f"DRAFT_{name.upper()}_QUEUE", max_queue)),
+        )
+    return Scheduler(int(os.environ.get("DRAFT_MAX_CONCURRENCY", "4")), limits)
+
+
+SCHEDULER = _from_env()
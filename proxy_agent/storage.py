@@ -0,0 +1,424 @@
+"""Storage engines for events, summaries, identity models and the blocklist.
+
+``memory`` and ``publish_gate`` go through ``engine()``, which returns the
+engine of the current shard. ``AGENT_STORAGE`` picks it:
+
+- ``sqlite`` (default): the shard's SQLite database.
+- ``memory``: ``MemoryEngine``, an in-process store per shard. It can be
+  loaded from and snapshotted to a SQLite database.
+
+Both engines pass the conformance suite in ``tests/test_storage.py``. Search,
+payload compression, topics, objectives, the outbox, usage and idempotency
+read their SQLite tables directly and see nothing written to the memory
+engine; it is meant for tests, benchmarks and short-lived replay jobs. The
+server and ``bulk`` refuse to run on it (``require_sqlite``).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from .db import current_shard, get_conn, init_db
+from .payloads import JSON, decode_payload, encode_payload, event_text
+
+
+class IdentityConflict(RuntimeError):
+    """Another writer appended an identity model after the expected parent."""
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Event:
+    """An event row whose payload is only decoded when first accessed.
+
+    Supports ``event["payload"]``-style access, and its ``repr`` is that of
+    the equivalent dict.
+    """
+
+    __slots__ = ("id", "ts", "kind", "source", "_codec", "_raw", "_payload")
+    FIELDS = ("id", "ts", "kind", "source", "payload")
+
+    def __init__(self, id: int, ts: str, kind: str, source: str, codec: str, raw) -> None:
+        self.id = id
+        self.ts = ts
+        self.kind = kind
+        self.source = source
+        self._codec = codec
+        self._raw = raw
+        self._payload = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Event":
+        return cls(
+            row["id"], row["ts"], row["kind"], row["source"], row["codec"], row["payload_json"]
+        )
+
+    @property
+    def payload(self) -> dict:
+        if self._raw is not None:
+            self._payload = decode_payload(self._codec, self._raw)
+            self._raw = None
+        return self._payload
+
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.FIELDS
+
+    def keys(self) -> tuple[str, ...]:
+        return self.FIELDS
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def as_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.FIELDS}
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Event):
+            other = other.as_dict()
+        return self.as_dict() == other
+
+    def __repr__(self) -> str:
+        return repr(self.as_dict())
+
+
+def _search_enabled(cur: sqlite3.Cursor) -> bool:
+    cache = current_shard().cache
+    if "search_enabled" not in cache:
+        cache["search_enabled"] = (
+            cur.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='search_index'"
+            ).fetchone()
+            is not None
+        )
+    return cache["search_enabled"]
+
+
+def _index_event(cur: sqlite3.Cursor, event_id: int, kind: str, ts: str, payload: dict) -> None:
+    """Index a compressed event, which the SQL trigger cannot read."""
+    text = event_text(kind, payload)
+    if text:
+        cur.execute(
+            "INSERT INTO search_index(content, source, ref_id, kind, ts) "
+            "VALUES(?, 'event', ?, ?, ?)",
+            (text, event_id, kind, ts),
+        )
+
+
+def insert_event(cur: sqlite3.Cursor, kind: str, source: str, payload: dict) -> int:
+    """Insert an event on ``cur`` without committing, for multi-row transactions.
+
+    This always writes to SQLite, whatever the configured engine.
+    """
+    ts = utc_now()
+    name, value = encode_payload(payload)
+    cur.execute(
+        "INSERT INTO events(ts, kind, source, payload_json, codec) VALUES(?,?,?,?,?)",
+        (ts, kind, source, value, name),
+    )
+    event_id = int(cur.lastrowid)
+    if name != JSON and _search_enabled(cur):
+        _index_event(cur, event_id, kind, ts, payload)
+    return event_id
+
+
+class StorageEngine(ABC):
+    """The operations ``memory`` and ``publish_gate`` need from storage."""
+
+    @abstractmethod
+    def append_event(self, kind: str, source: str, payload: dict) -> int:
+        """Append an event; return its id."""
+
+    @abstractmethod
+    def recent_events(self, limit: int) -> list[Event]:
+        """The newest ``limit`` events, oldest first."""
+
+    @abstractmethod
+    def get_summary(self, scope: str) -> str:
+        """The summary text of ``scope``, or ``""``."""
+
+    @abstractmethod
+    def set_summary(self, scope: str, text: str) -> None:
+        """Create or replace the summary of ``scope``."""
+
+    @abstractmethod
+    def latest_identity(self) -> Optional[tuple[int, dict]]:
+        """``(id, model)`` of the newest identity model, or ``None``."""
+
+    @abstractmethod
+    def append_identity(self, model: dict, parent_id: Optional[int]) -> int:
+        """Append ``model`` if ``parent_id`` is the newest id, else raise
+        ``IdentityConflict``."""
+
+    @abstractmethod
+    def blocklist_patterns(self) -> list[str]:
+        """Blocklist patterns, oldest first."""
+
+    @abstractmethod
+    def add_blocklist_pattern(self, pattern: str) -> None:
+        """Add ``pattern`` to the blocklist."""
+
+
+class SQLiteEngine(StorageEngine):
+    """Reads and writes the current shard's database."""
+
+    def append_event(self, kind, source, payload):
+        conn = get_conn()
+        eid = insert_event(conn.cursor(), kind, source, payload)
+        conn.commit()
+        conn.close()
+        return eid
+
+    def recent_events(self, limit):
+        conn = get_conn()
+        rows = conn.execute(
+            "SELECT id, ts, kind, source, codec, payload_json FROM events "
+            "ORDER BY id DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        conn.close()
+        return [Event.from_row(row) for row in reversed(rows)]
+
+    def get_summary(self, scope):
+        conn = get_conn()
+        row = conn.execute("SELECT text FROM summaries WHERE scope = ?", (scope,)).fetchone()
+        conn.close()
+        return row["text"] if row else ""
+
+    def set_summary(self, scope, text):
+        conn = get_conn()
+        conn.execute(
+            """
+            INSERT INTO summaries(scope, text, ts)
+            VALUES(?,?,?)
+            ON CONFLICT(scope) DO UPDATE SET text=excluded.text, ts=excluded.ts
+            """,
+            (scope, text, utc_now()),
+        )
+        conn.commit()
+        conn.close()
+
+    def latest_identity(self):
+        # The decoded model is cached per shard and only re-read when another
+        # writer has moved the latest row id.
+        cache = current_shard().cache
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM identity_models ORDER BY id DESC LIMIT 1")
+        row = cur.fetchone()
+        if not row:
+            conn.close()
+            return None
+        cached = cache.get("identity")
+        if cached is None or cached[0] != row["id"]:
+            cur.execute("SELECT model_json FROM identity_models WHERE id = ?", (row["id"],))
+            cached = (row["id"], json.loads(cur.fetchone()["model_json"]))
+            cache["identity"] = cached
+        conn.close()
+        return cached[0], dict(cached[1])
+
+    def append_identity(self, model, parent_id):
+        conn = get_conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT max(id) AS id FROM identity_models").fetchone()
+            if row["id"] != parent_id:
+                raise IdentityConflict(f"expected parent {parent_id}, latest is {row['id']}")
+            cur = conn.execute(
+                "INSERT INTO identity_models(ts, model_json, parent_id) VALUES(?,?,?)",
+                (utc_now(), json.dumps(model, ensure_ascii=False), parent_id),
+            )
+            conn.commit()
+            current_shard().cache["identity"] = (int(cur.lastrowid), dict(model))
+            return int(cur.lastrowid)
+        except IdentityConflict:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def blocklist_patterns(self):
+        conn = get_conn()
+        rows = conn.execute("SELECT pattern FROM secrets_blocklist ORDER BY id").fetchall()
+        conn.close()
+        return [row["pattern"] for row in rows]
+
+    def add_blocklist_pattern(self, pattern):
+        conn = get_conn()
+        conn.execute("INSERT INTO secrets_blocklist(pattern) VALUES(?)", (pattern,))
+        conn.commit()
+        conn.close()
+
+
+class MemoryEngine(StorageEngine):
+    """An in-process store: events in parallel column lists, the rest in dicts.
+
+    Event ids are list positions plus one. Payloads and models are kept as
+    JSON text, so callers get fresh copies exactly as from SQLite.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ts: list[str] = []
+        self._kind: list[str] = []
+        self._source: list[str] = []
+        self._payload: list[str] = []
+        self._summaries: dict[str, tuple[str, str]] = {}
+        # (ts, model_json, parent_id) per identity model, id = position + 1.
+        self._identities: list[tuple[str, str, Optional[int]]] = []
+        self._blocklist: list[str] = []
+
+    def append_event(self, kind, source, payload):
+        text = json.dumps(payload, ensure_ascii=False)
+        with self._lock:
+            self._ts.append(utc_now())
+            self._kind.append(kind)
+            self._source.append(source)
+            self._payload.append(text)
+            return len(self._ts)
+
+    def recent_events(self, limit):
+        with self._lock:
+            start = max(0, len(self._ts) - limit)
+            return [
+                Event(i + 1, self._ts[i], self._kind[i], self._source[i], JSON, self._payload[i])
+                for i in range(start, len(self._ts))
+            ]
+
+    def get_summary(self, scope):
+        entry = self._summaries.get(scope)
+        return entry[0] if entry else ""
+
+    def set_summary(self, scope, text):
+        with self._lock:
+            self._summaries[scope] = (text, utc_now())
+
+    def latest_identity(self):
+        with self._lock:
+            if not self._identities:
+                return None
+            return len(self._identities), json.loads(self._identities[-1][1])
+
+    def append_identity(self, model, parent_id):
+        text = json.dumps(model, ensure_ascii=False)
+        with self._lock:
+            latest = len(self._identities) or None
+            if latest != parent_id:
+                raise IdentityConflict(f"expected parent {parent_id}, latest is {latest}")
+            self._identities.append((utc_now(), text, parent_id))
+            return len(self._identities)
+
+    def blocklist_patterns(self):
+        with self._lock:
+            return list(self._blocklist)
+
+    def add_blocklist_pattern(self, pattern):
+        with self._lock:
+            self._blocklist.append(pattern)
+
+    @classmethod
+    def load(cls, path: Path) -> "MemoryEngine":
+        """Build an engine holding everything in the SQLite database at ``path``."""
+        engine = cls()
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            for id_, ts, kind, source, name, value in conn.execute(
+                "SELECT id, ts, kind, source, codec, payload_json FROM events ORDER BY id"
+            ):
+                if id_ != len(engine._ts) + 1:
+                    raise ValueError(f"Event ids in {path} are not contiguous at {id_}")
+                engine._ts.append(ts)
+                engine._kind.append(kind)
+                engine._source.append(source)
+                payload = decode_payload(name, value)
+                engine._payload.append(json.dumps(payload, ensure_ascii=False))
+            for scope, text, ts in conn.execute("SELECT scope, text, ts FROM summaries"):
+                engine._summaries[scope] = (text, ts)
+            for id_, ts, model_json, parent_id in conn.execute(
+                "SELECT id, ts, model_json, parent_id FROM identity_models ORDER BY id"
+            ):
+                if id_ != len(engine._identities) + 1:
+                    raise ValueError(f"Identity ids in {path} are not contiguous at {id_}")
+                engine._identities.append((ts, model_json, parent_id))
+            engine._blocklist = [
+                row[0] for row in conn.execute("SELECT pattern FROM secrets_blocklist ORDER BY id")
+            ]
+        finally:
+            conn.close()
+        return engine
+
+    def snapshot(self, path: Path) -> None:
+        """Write everything to a new SQLite database at ``path``, keeping ids."""
+        init_db(path)
+        conn = sqlite3.connect(path)
+        try:
+            if conn.execute("SELECT 1 FROM events LIMIT 1").fetchone():
+                raise ValueError(f"Snapshot target {path} already holds events")
+            with self._lock:
+                conn.executemany(
+                    "INSERT INTO events(id, ts, kind, source, payload_json, codec) "
+                    "VALUES(?,?,?,?,?,?)",
+                    (
+                        (i + 1, self._ts[i], self._kind[i], self._source[i], self._payload[i], JSON)
+                        for i in range(len(self._ts))
+                    ),
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO summaries(scope, text, ts) VALUES(?,?,?)",
+                    ((scope, text, ts) for scope, (text, ts) in self._summaries.items()),
+                )
+                conn.executemany(
+                    "INSERT INTO identity_models(id, ts, model_json, parent_id) VALUES(?,?,?,?)",
+                    ((i + 1, *row) for i, row in enumerate(self._identities)),
+                )
+                conn.executemany(
+                    "INSERT INTO secrets_blocklist(pattern) VALUES(?)",
+                    ((pattern,) for pattern in self._blocklist),
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+STORAGE_ENGINE = os.environ.get("AGENT_STORAGE", "sqlite")
+
+_SQLITE = SQLiteEngine()
+# Memory engines by shard path. Kept outside the shard LRU, whose eviction
+# only drops caches and would lose the data.
+_memory_engines: dict[str, MemoryEngine] = {}
+_memory_lock = threading.Lock()
+
+
+def engine() -> StorageEngine:
+    """The storage engine of the current shard."""
+    if STORAGE_ENGINE == "sqlite":
+        return _SQLITE
+    if STORAGE_ENGINE != "memory":
+        raise ValueError(f"AGENT_STORAGE must be 'sqlite' or 'memory', got {STORAGE_ENGINE!r}")
+    key = str(current_shard().path)
+    with _memory_lock:
+        if key not in _memory_engines:
+            _memory_engines[key] = MemoryEngine()
+        return _memory_engines[key]
+
+
+def require_sqlite(user: str) -> None:
+    """Refuse any engine but SQLite for ``user``.
+
+    The draft pipeline also writes through modules that only use SQLite (the
+    outbox inserts its output event with ``insert_event``), so on another
+    engine its events would be split between the two stores.
+    """
+    if STORAGE_ENGINE != "sqlite":
+        raise ValueError(f"{user} needs AGENT_STORAGE=sqlite, got {STORAGE_ENGINE!r}")
@@ -0,0 +1,101 @@
+"""Parsing and validation of structured (JSON) LLM responses.
+
+``route_call(..., json_schema=...)`` asks the backend for JSON natively, but
+models and compatible servers still sometimes wrap it in markdown fences or
+add commentary. ``parse_json_object`` repairs those cases locally instead of
+throwing the generation away, and per-purpose counters record how often a
+response parsed cleanly, needed repair or had to be discarded.
+"""
+
+import json
+import re
+import threading
+from collections import Counter
+from typing import Any
+
+_FENCE_RE = re.compile(r"^\s*```[a-zA-Z0-9_-]*\s*\n?(.*?)\n?\s*```\s*$", re.DOTALL)
+
+_counts: Counter = Counter()
+_counts_lock = threading.Lock()
+
+
+class StructuredOutputError(ValueError):
+    """The response holds no usable JSON object."""
+
+
+def parse_json_object(text: str) -> tuple[dict, bool]:
+    """Return ``(object, repaired)`` for the first JSON object in ``text``.
+
+    ``repaired`` is True when the object was only found after stripping
+    fences or surrounding prose.
+    """
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    else:
+        if isinstance(value, dict):
+            return value, False
+        raise StructuredOutputError(f"Expected a JSON object, got {type(value).__name__}")
+
+    fenced = _FENCE_RE.match(text)
+    candidate = fenced.group(1) if fenced else text
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"\{", candidate):
+        try:
+            value, _ = decoder.raw_decode(candidate, match.start())
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value, True
+    raise StructuredOutputError("No JSON object found in response")
+
+
+def validate(value: Any, schema: dict) -> None:
+    """Check ``value`` against the subset of JSON Schema our schemas use:
+    ``type`` (object, array, string), ``properties``, ``required`` and
+    array ``items``. Raises ``StructuredOutputError``."""
+    expected = schema.get("type")
+    types = {"object": dict, "array": list, "string": str}
+    if expected in types and not isinstance(value, types[expected]):
+        raise StructuredOutputError(f"Expected {expected}, got {type(value).__name__}")
+    if expected == "object":
+        missing = [key for key in schema.get("required", []) if key not in value]
+        if missing:
+            raise StructuredOutputError(f"Missing keys: {', '.join(missing)}")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                validate(value[key], subschema)
+    elif expected == "array" and "items" in schema:
+        for item in value:
+            validate(item, schema["items"])
+
+
+def record(purpose: str, outcome: str) -> None:
+    """Count ``outcome`` (``parsed``, ``repaired`` or ``discarded``) for ``purpose``."""
+    with _counts_lock:
+        _counts[(purpose, outcome)] += 1
+
+
+def counts() -> dict[str, dict[str, int]]:
+    with _counts_lock:
+        snapshot = dict(_counts)
+    result: dict[str, dict[str, int]] = {}
+    for (purpose, outcome), n in sorted(snapshot.items()):
+        result.setdefault(purpose, {})[outcome] = n
+    return result
+
+
+def parse_response(text: str, schema: dict, purpose: str) -> dict:
+    """Parse, repair and validate ``text``, recording the outcome.
+
+    Raises ``StructuredOutputError`` if the response must be discarded.
+    """
+    try:
+        value, repaired = parse_json_object(text)
+        validate(value, schema)
+    except StructuredOutputError:
+        record(purpose, "discarded")
+        raise
+    record(purpose, "repaired" if repaired else "parsed")
+    return value
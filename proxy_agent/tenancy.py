@@ -0,0 +1,113 @@
+"""Multi-identity hosting: per-request identity selection and shard placement.
+
+A request selects an identity either with a path prefix (``/i/<name>/draft``)
+or with the ``X-Agent-Identity`` header. Requests that select neither use the
+default database (``db.DB_PATH``). Identities are created through the admin
+API; requests for any other name get ``404``. LLM clients, rate limits and other
+module-level state are shared by all identities in the process.
+
+When ``AGENT_NODES`` lists several nodes, identities are spread across them
+with a consistent-hash ring and a node rejects identities it does not own
+with ``421 Misdirected Request`` naming the owner.
+"""
+
+import bisect
+import hashlib
+import json
+import os
+from typing import Optional
+
+from . import db
+
+IDENTITY_HEADER = b"x-agent-identity"
+PATH_PREFIX = "/i/"
+RING_REPLICAS = 100
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring; adding a node only moves ~1/N of the identities."""
+
+    def __init__(self, nodes: list[str], replicas: int = RING_REPLICAS):
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted(
+            (_hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas)
+        )
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, identity: str) -> str:
+        index = bisect.bisect(self._keys, _hash(identity)) % len(self._keys)
+        return self._nodes[index]
+
+
+def _ring_from_env() -> Optional[HashRing]:
+    nodes = [n.strip() for n in os.environ.get("AGENT_NODES", "").split(",") if n.strip()]
+    return HashRing(nodes) if len(nodes) > 1 else None
+
+
+RING = _ring_from_env()
+NODE_NAME = os.environ.get("AGENT_NODE_NAME", "")
+
+
+async def _send_json(send, status: int, body: dict) -> None:
+    payload = json.dumps(body).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": payload})
+
+
+class IdentityMiddleware:
+    """ASGI middleware that binds ``db.current_identity`` for the request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        identity = None
+        path = scope["path"]
+        if path.startswith(PATH_PREFIX):
+            identity, _, rest = path[len(PATH_PREFIX):].partition("/")
+            scope = dict(scope, path="/" + rest, raw_path=("/" + rest).encode("utf-8"))
+        else:
+            for name, value in scope["headers"]:
+                if name == IDENTITY_HEADER:
+                    identity = value.decode("latin-1")
+                    break
+
+        if identity is not None:
+            if not db.IDENTITY_NAME_RE.match(identity):
+                await _send_json(send, 400, {"detail": f"Invalid identity: {identity!r}"})
+                return
+            if RING is not None:
+                owner = RING.node_for(identity)
+                if owner != NODE_NAME:
+                    await _send_json(
+                        send, 421, {"detail": "Identity is hosted elsewhere", "node": owner}
+                    )
+                    return
+            if not db.identity_exists(identity):
+                await _send_json(send, 404, {"detail": f"Unknown identity: {identity!r}"})
+                return
+
+        token = db.current_identity.set(identity)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            db.current_identity.reset(token)
@@ -0,0 +1,252 @@
+"""Topic layer: clusters of output events with rolling per-topic summaries.
+
+Output events that passed the publish gate are assigned to topics by keyword
+overlap, which needs no LLM call. Assigning an event bumps its topic's ``version``; a topic is dirty while
+``version > summarized_version``. Dirty topics are re-summarized in background
+batches into ``summaries`` rows scoped ``topic:<id>``. Readers (``/identity``
+and the draft prompt) use a per-shard cache that is loaded on first use and
+then refreshed in the background, so nothing here runs on the request path.
+Like search, topics never see text the gate blocked: blocked outputs are not
+assigned, and a summary that fails the gate is not stored.
+"""
+
+import json
+import re
+from collections import Counter
+from typing import Optional
+
+from .background import lease_held
+from .db import current_shard, get_conn
+from .llms import BudgetExceeded, route_call
+from .memory import get_summary, set_summary, utc_now
+from .payloads import decode_payload, event_text
+from .prompts import TOPIC_SUMMARY_SYSTEM
+from .publish_gate import check_publishable
+
+WATERMARK_SCOPE = "topics:watermark"
+EVENT_KEYWORDS = 8
+TOPIC_KEYWORDS = 16
+MATCH_THRESHOLD = 0.2
+ASSIGN_BATCH_SIZE = 200
+SUMMARIZE_BATCH_SIZE = 5
+SUMMARY_EVENTS = 10
+MAINTAIN_INTERVAL_S = 30
+CACHE_REFRESH_INTERVAL_S = 10
+
+STOPWORDS = frozenset(
+    """
+    about above after again against also among and any are because been before being
+    between both but can could did does doing down during each else even every few for
+    from further had has have having her here hers herself him himself his how however
+    into its itself just like more most much must not now off once only other our ours
+    ourselves out over own same shall she should some such than that the their theirs
+    them themselves then there these they this those through too under until upon very
+    was were what when where which while who whom why will with within without would
+    yet you your yours yourself yourselves
+    """.split()
+)
+
+
+def keywords(text: str, n: int = EVENT_KEYWORDS) -> Counter:
+    words = [w for w in re.findall(r"[a-z][a-z\-]{2,}", text.lower()) if w not in STOPWORDS]
+    return Counter(dict(Counter(words).most_common(n)))
+
+
+def _overlap(a: Counter, b: Counter) -> float:
+    if not a or not b:
+        return 0.0
+    shared = set(a) & set(b)
+    return len(shared) / len(set(a) | set(b))
+
+
+def _summary_scope(topic_id: int) -> str:
+    return f"topic:{topic_id}"
+
+
+def _load_topics(cur) -> dict[int, Counter]:
+    cur.execute("SELECT id, keywords_json FROM topics")
+    return {row["id"]: Counter(json.loads(row["keywords_json"])) for row in cur.fetchall()}
+
+
+def assign_new_outputs(batch_size: int = ASSIGN_BATCH_SIZE) -> int:
+    """Assign output events past the watermark to topics. Returns events assigned."""
+    watermark = int(get_summary(WATERMARK_SCOPE) or 0)
+    conn = get_conn()
+    cur = conn.cursor()
+    # Blocked JSON outputs are skipped here; compressed ones by ``event_text``.
+    cur.execute(
+        "SELECT id, codec, payload_json FROM events WHERE kind = 'output' AND id > ? "
+        "AND (codec != 'json' OR json_extract(payload_json, '$.ok') = 1) "
+        "ORDER BY id LIMIT ?",
+        (watermark, batch_size),
+    )
+    rows = cur.fetchall()
+    if not rows:
+        conn.close()
+        return 0
+
+    topics = _load_topics(cur)
+    now = utc_now()
+    for row in rows:
+        event_keywords = keywords(
+            event_text("output", decode_payload(row["codec"], row["payload_json"]))
+        )
+        if not event_keywords:
+            continue
+        best_id, best_score = None, 0.0
+        for topic_id, topic_keywords in topics.items():
+            score = _overlap(event_keywords, topic_keywords)
+            if score > best_score:
+                best_id, best_score = topic_id, score
+        if best_id is None or best_score < MATCH_THRESHOLD:
+            label = ", ".join(word for word, _ in event_keywords.most_common(3))
+            cur.execute(
+                "INSERT INTO topics(label, keywords_json, updated_ts) VALUES(?,?,?)",
+                (label, "{}", now),
+            )
+            best_id = int(cur.lastrowid)
+            topics[best_id] = Counter()
+        merged = topics[best_id] + event_keywords
+        topics[best_id] = Counter(dict(merged.most_common(TOPIC_KEYWORDS)))
+        cur.execute(
+            "INSERT OR IGNORE INTO topic_events(topic_id, event_id) VALUES(?,?)",
+            (best_id, row["id"]),
+        )
+        cur.execute(
+            """
+            UPDATE topics SET keywords_json = ?, event_count = event_count + 1,
+                version = version + 1, updated_ts = ?
+            WHERE id = ?
+            """,
+            (json.dumps(topics[best_id]), now, best_id),
+        )
+    conn.commit()
+    conn.close()
+    set_summary(WATERMARK_SCOPE, str(rows[-1]["id"]))
+    return len(rows)
+
+
+def summarize_dirty(batch_size: int = SUMMARIZE_BATCH_SIZE) -> int:
+    """Re-summarize up to ``batch_size`` dirty topics. Returns topics summarized."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id, label, version FROM topics WHERE version > summarized_version "
+        "ORDER BY updated_ts LIMIT ?",
+        (batch_size,),
+    )
+    dirty = cur.fetchall()
+    conn.close()
+
+    done = 0
+    for topic in dirty:
+        if not lease_held():
+            break
+        conn = get_conn()
+        rows = conn.execute(
+            """
+            SELECT e.codec, e.payload_json FROM topic_events t JOIN events e ON e.id = t.event_id
+            WHERE t.topic_id = ? ORDER BY e.id DESC LIMIT ?
+            """,
+            (topic["id"], SUMMARY_EVENTS),
+        ).fetchall()
+        conn.close()
+        outputs = "\n\n".join(
+            decode_payload(row["codec"], row["payload_json"]).get("text", "")
+            for row in reversed(rows)
+        )
+        messages = [
+            {"role": "system", "content": TOPIC_SUMMARY_SYSTEM},
+            {
+                "role": "user",
+                "content": (
+                    f"Topic: {topic['label']}\n\nPrevious summary:\n"
+                    f"{get_summary(_summary_scope(topic['id']))}\n\nNewest outputs:\n{outputs}"
+                ),
+            },
+        ]
+        try:
+            summary = route_call(messages, purpose="summarize").strip()
+        except BudgetExceeded:
+            break
+        published = check_publishable(summary)[0]
+        if published:
+            set_summary(_summary_scope(topic["id"]), summary)
+        # A blocked summary is dropped; the topic waits for its next event.
+        conn = get_conn()
+        conn.execute(
+            "UPDATE topics SET summarized_version = ? WHERE id = ?",
+            (topic["version"], topic["id"]),
+        )
+        conn.commit()
+        conn.close()
+        done += published
+    return done
+
+
+def read_topics(conn) -> list[dict]:
+    """Summarized topics in ``conn``'s database, largest first."""
+    rows = conn.execute(
+        """
+        SELECT t.id, t.label, t.keywords_json, t.event_count, t.updated_ts, s.text AS summary
+        FROM topics t JOIN summaries s ON s.scope = 'topic:' || t.id
+        ORDER BY t.event_count DESC, t.id
+        """
+    ).fetchall()
+    return [
+        {
+            "id": row["id"],
+            "label": row["label"],
+            "summary": row["summary"],
+            "keywords": Counter(json.loads(row["keywords_json"])),
+            "event_count": row["event_count"],
+            "updated_ts": row["updated_ts"],
+        }
+        for row in rows
+    ]
+
+
+def refresh_cache() -> list[dict]:
+    """Reload this shard's topic cache from the database."""
+    conn = get_conn()
+    topics = read_topics(conn)
+    conn.close()
+    current_shard().cache["topics"] = topics
+    return topics
+
+
+def _cached_topics() -> list[dict]:
+    topics = current_shard().cache.get("topics")
+    return topics if topics is not None else refresh_cache()
+
+
+def get_topic_summaries() -> list[dict]:
+    return [
+        {
+            "topic": t["label"],
+            "summary": t["summary"],
+            "event_count": t["event_count"],
+            "updated_ts": t["updated_ts"],
+        }
+        for t in _cached_topics()
+    ]
+
+
+def relevant_topics(text: str, k: int, topics: Optional[list[dict]] = None) -> list[dict]:
+    """The ``k`` summarized topics whose keywords best overlap ``text``.
+
+    ``topics`` defaults to this shard's cache.
+    """
+    query = keywords(text, n=TOPIC_KEYWORDS)
+    candidates = _cached_topics() if topics is None else topics
+    scored = [(_overlap(query, t["keywords"]), t) for t in candidates]
+    scored = [(score, t) for score, t in scored if score > 0]
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return [t for _, t in scored[:k]]
+
+
+def maintain() -> None:
+    """Background job: assign new outputs, then summarize dirty topics."""
+    assign_new_outputs()
+    summarize_dirty()
+    refresh_cache()
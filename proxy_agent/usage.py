@@ -0,0 +1,99 @@
+"""Token usage and cost accounting.
+
+Every ``route_call`` result is folded into an hourly rollup keyed by
+purpose, backend and model. Prices and budgets are part of each purpose's
+route (see ``llms.load_routes``)::
+
+    LLM_PRICE_GPT_4_1_MINI_IN=0.40     # USD per 1M input tokens of gpt-4.1-mini
+    LLM_PRICE_GPT_4_1_MINI_OUT=1.60    # USD per 1M output tokens
+    LLM_SUMMARIZE_TOKEN_BUDGET=200000  # input + output tokens per UTC hour
+    LLM_SUMMARIZE_FALLBACK_MODEL=gpt-4.1-nano
+
+Prices are set per model, so a fallback model is priced as itself.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from .db import get_conn
+
+
+def _hour(dt: Optional[datetime] = None) -> str:
+    dt = dt or datetime.now(timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:00")
+
+
+def record_usage(result) -> None:
+    """Add one ``LLMResult`` to the current hour's rollup row."""
+    usage = result.usage
+    conn = get_conn()
+    conn.execute(
+        """
+        INSERT INTO usage_rollup(hour, purpose, backend, model, calls,
+                                 input_tokens, output_tokens, latency_ms, cost_usd)
+        VALUES(?,?,?,?,1,?,?,?,?)
+        ON CONFLICT(hour, purpose, backend, model) DO UPDATE SET
+            calls = calls + 1,
+            input_tokens = input_tokens + excluded.input_tokens,
+            output_tokens = output_tokens + excluded.output_tokens,
+            latency_ms = latency_ms + excluded.latency_ms,
+            cost_usd = cost_usd + excluded.cost_usd
+        """,
+        (
+            _hour(),
+            result.purpose,
+            result.backend,
+            result.model,
+            usage.input_tokens,
+            usage.output_tokens,
+            result.latency_ms,
+            result.cost_usd,
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def tokens_this_hour(purpose: str) -> int:
+    conn = get_conn()
+    row = conn.execute(
+        "SELECT coalesce(sum(input_tokens + output_tokens), 0) AS used "
+        "FROM usage_rollup WHERE hour = ? AND purpose = ?",
+        (_hour(), purpose),
+    ).fetchone()
+    conn.close()
+    return int(row["used"])
+
+
+def budget_exhausted(purpose: str, budget: Optional[int]) -> bool:
+    if not budget:
+        return False
+    return tokens_this_hour(purpose) >= budget
+
+
+def get_rollup(hours: int = 24) -> list[dict]:
+    """Rollup rows for the last ``hours`` hours, newest first."""
+    since = _hour(datetime.now(timezone.utc) - timedelta(hours=hours - 1))
+    conn = get_conn()
+    rows = conn.execute(
+        """
+        SELECT hour, purpose, backend, model, calls, input_tokens, output_tokens,
+               latency_ms, cost_usd
+        FROM usage_rollup WHERE hour >= ? ORDER BY hour DESC, purpose, backend, model
+        """,
+        (since,),
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+
+def summarize_by_purpose(rows: list[dict]) -> dict:
+    totals: dict[str, dict] = {}
+    for row in rows:
+        total = totals.setdefault(
+            row["purpose"],
+            {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0},
+        )
+        for key in total:
+            total[key] += row[key]
+    return totals
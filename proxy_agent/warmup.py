@@ -0,0 +1,162 @@
+"""Startup warm-up of the LLM backends and per-backend readiness.
+
+The first draft after a deploy otherwise pays for new TCP/TLS connections and,
+with Ollama, for loading the model. At startup each worker warms every
+configured purpose in the background:
+
+- opens a pooled connection to the backend URL (any HTTP response will do);
+- for Ollama, asks the server to load the model and keep it loaded for
+  ``OLLAMA_KEEP_ALIVE``;
+- with ``WARMUP_PROBE=1``, makes a tiny real call to verify the credentials.
+
+Purposes that fail are retried in the background with exponential backoff
+(``WARMUP_RETRY_BASE_S`` up to ``WARMUP_RETRY_MAX_S``), so a backend that was
+briefly unreachable at boot does not keep the worker unready. ``start`` is
+called again after the routes are reloaded; it stops the previous run and
+warms the new backends.
+
+``GET /ready`` reports the result; ``GET /health`` only reports liveness.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from . import llms
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_S = float(os.environ.get("WARMUP_TIMEOUT_S", "30"))
+RETRY_BASE_S = float(os.environ.get("WARMUP_RETRY_BASE_S", "2"))
+RETRY_MAX_S = float(os.environ.get("WARMUP_RETRY_MAX_S", "60"))
+PROBE_MESSAGES = [{"role": "user", "content": "Reply with the single word OK."}]
+
+_state: dict[str, dict] = {}
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_stop: Optional[threading.Event] = None
+# Called once, the first time every purpose is ready; kept across restarts.
+_on_ready: Optional[Callable[[], None]] = None
+
+
+def enabled() -> bool:
+    return os.environ.get("WARMUP", "1") != "0"
+
+
+def _set(purpose: str, **fields) -> None:
+    with _lock:
+        _state[purpose] = {**_state.get(purpose, {}), **fields}
+
+
+def _open_connection(url: str) -> None:
+    # Any status code means the connection is up and back in the pool.
+    llms._SESSION.head(url, timeout=TIMEOUT_S)
+
+
+def _preload_ollama(backend: "llms.OllamaBackend", model: str) -> None:
+    response = llms._SESSION.post(
+        backend.url.rstrip("/") + "/api/generate",
+        json={"model": model, "keep_alive": backend.keep_alive},
+        timeout=TIMEOUT_S,
+    )
+    if response.status_code >= 400:
+        raise llms.LLMError(f"Ollama preload HTTP {response.status_code}: {response.text[:200]}")
+
+
+def warm_purpose(purpose: str) -> None:
+    started = time.perf_counter()
+    try:
+        route = llms.get_route(purpose)
+        _set(
+            purpose,
+            backend=route.backend.name,
+            model=route.model,
+            url=route.backend.url,
+            status="warming",
+            error=None,
+        )
+        _open_connection(route.backend.url)
+        if isinstance(route.backend, llms.OllamaBackend):
+            _preload_ollama(route.backend, route.model)
+        if os.environ.get("WARMUP_PROBE", "0") == "1":
+            llms.route_call(PROBE_MESSAGES, purpose=purpose)
+    except Exception as exc:  # noqa: BLE001 - reported through /ready
+        logger.warning("Warm-up of %s failed: %s", purpose, exc)
+        _set(purpose, status="failed", error=f"{type(exc).__name__}: {exc}"[:300])
+    else:
+        _set(purpose, status="ready")
+    _set(purpose, ms=round((time.perf_counter() - started) * 1000, 1))
+
+
+def warm_up(
+    on_ready: Optional[Callable[[], None]] = None, purposes: tuple[str, ...] = llms.PURPOSES
+) -> list[str]:
+    """Warm ``purposes`` concurrently and wait for all of them.
+
+    ``on_ready`` is called if every purpose ended up ready. Returns the
+    purposes that failed.
+    """
+    for purpose in purposes:
+        _set(purpose, status="pending", error=None)
+    with ThreadPoolExecutor(max_workers=len(purposes)) as pool:
+        list(pool.map(warm_purpose, purposes))
+    if on_ready is not None and readiness()[0]:
+        on_ready()
+    with _lock:
+        return [purpose for purpose in purposes if _state[purpose]["status"] == "failed"]
+
+
+def _notify_ready() -> None:
+    global _on_ready
+    callback, _on_ready = _on_ready, None
+    if callback is not None:
+        callback()
+
+
+def _run(stop: threading.Event, previous: Optional[threading.Thread]) -> None:
+    """Warm every purpose, then retry the failed ones until all are ready."""
+    if previous is not None:
+        # Let the previous run finish its pass so it cannot overwrite our state.
+        previous.join()
+    failed = warm_up(_notify_ready)
+    delay = RETRY_BASE_S
+    while failed and not stop.wait(delay):
+        logger.info("Retrying warm-up of %s", ", ".join(failed))
+        failed = warm_up(_notify_ready, tuple(failed))
+        delay = min(delay * 2, RETRY_MAX_S)
+
+
+def start(on_ready: Optional[Callable[[], None]] = None) -> None:
+    """Warm up in a background thread so startup is not blocked.
+
+    Call it again after reloading the routes: the previous run stops retrying
+    and the new routes are warmed. With warm-up disabled the worker is ready
+    at once and ``on_ready`` is called immediately.
+    """
+    global _thread, _stop, _on_ready
+    if not enabled():
+        if on_ready is not None:
+            on_ready()
+        return
+    if on_ready is not None:
+        _on_ready = on_ready
+    if _stop is not None:
+        _stop.set()
+    _stop = threading.Event()
+    _thread = threading.Thread(
+        target=_run, args=(_stop, _thread), name="backend-warmup", daemon=True
+    )
+    _thread.start()
+
+
+def readiness() -> tuple[bool, dict]:
+    """``(ready, per-purpose state)``. Always ready when warm-up is disabled."""
+    if not enabled():
+        return True, {}
+    with _lock:
+        state = {purpose: dict(info) for purpose, info in _state.items()}
+    ready = bool(state) and all(info["status"] == "ready" for info in state.values())
+    return ready, state
@@ -5,6 +5,7 @@ IMAGE_NAME=${IMAGE_NAME:-indy-the-agent}
 CONTAINER_NAME=${CONTAINER_NAME:-indy-the-agent}
 PORT=${PORT:-8000}
 ENV_FILE=${ENV_FILE:-.env}
+READY_TIMEOUT=${READY_TIMEOUT:-120}
 
 if ! command -v docker >/dev/null 2>&1; then
   echo "Docker is required but not installed or not on PATH." >&2
@@ -36,4 +37,17 @@ fi
 echo "Starting container: $CONTAINER_NAME on port $PORT"
 docker run -d "${RUN_ARGS[@]}" "$IMAGE_NAME" >/dev/null
 
-echo "Container is running. Logs: docker logs -f $CONTAINER_NAME"
+echo "Waiting up to ${READY_TIMEOUT}s for backend warm-up (GET /ready)"
+deadline=$((SECONDS + READY_TIMEOUT))
+until curl -fsS "http://localhost:${PORT}/ready" >/dev/null 2>&1; do
+  if (( SECONDS >= deadline )); then
+    echo "Container did not become ready. Readiness report:" >&2
+    curl -sS "http://localhost:${PORT}/ready" >&2 || true
+    echo >&2
+    echo "Logs: docker logs $CONTAINER_NAME" >&2
+    exit 1
+  fi
+  sleep 2
+done
+
+echo "Container is ready. Logs: docker logs -f $CONTAINER_NAME"
@@ -3,7 +3,7 @@ import pytest
 from pathlib import Path
 from unittest.mock import patch
 
-from proxy_agent import db
+from proxy_agent import db, llms
 
 
 @pytest.fixture(autouse=True)
@@ -11,5 +11,9 @@ def _tmp_db(tmp_path, monkeypatch):
     """Redirect the database to a temporary file for every test."""
     test_db = tmp_path / "test_agent.db"
     monkeypatch.setattr(db, "DB_PATH", test_db)
+    # Backend warm-up would reach the network at app startup.
+    monkeypatch.setenv("WARMUP", "0")
+    # Routes load lazily, so env vars set inside a test take effect.
+    monkeypatch.setattr(llms, "_routes", None)
     db.init_db()
     yield test_db
@@ -1,3 +1,4 @@
+import time
 from unittest.mock import patch, MagicMock
 
 import pytest
@@ -14,7 +15,7 @@ def client():
 
 
 class TestDraftEndpoint:
-    def _mock_route_call(self, messages, purpose):
+    def _mock_route_call(self, messages, purpose, **kwargs):
         """Simple mock that returns purpose-tagged text."""
         return f"[{purpose}] generated text"
 
@@ -96,3 +97,123 @@ class TestStartup:
         from proxy_agent.memory import get_summary
         summary = get_summary("self")
         assert "persistence" in summary.lower() or "memory" in summary.lower()
+
+
+class TestSearchEndpoint:
+    AUTH = {"Authorization": "Bearer secret"}
+
+    @pytest.fixture(autouse=True)
+    def _admin(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+
+    def test_search_returns_snippets_and_next_offset(self, client):
+        from proxy_agent.memory import append_event
+        for i in range(3):
+            append_event("output", "agent", {"ok": True, "text": f"thoughts on liturgy {i}"})
+        data = client.get("/search", params={"q": "liturgy", "limit": 2}, headers=self.AUTH).json()
+        assert len(data["results"]) == 2
+        assert data["next_offset"] == 2
+        assert "snippet" in data["results"][0]
+        assert "content" not in data["results"][0]
+        rest = client.get("/search", params={"q": "liturgy", "offset": 2}, headers=self.AUTH).json()
+        assert len(rest["results"]) == 1
+        assert rest["next_offset"] is None
+
+    def test_requires_admin_token(self, client):
+        assert client.get("/search", params={"q": "x"}).status_code == 403
+
+    def test_blocked_text_never_returned(self, client):
+        secret = "sk-" + "A" * 24
+        with patch("proxy_agent.app.route_call", return_value="{}"), \
+             patch("proxy_agent.app.canonicalize", return_value=f"my key is {secret}"):
+            client.post("/draft", json={"title": "T", "body": f"key {secret}"})
+        data = client.get("/search", params={"q": "sk"}, headers=self.AUTH).json()
+        assert data["results"] == []
+
+
+def _candidate_events(count: int) -> list:
+    from proxy_agent.memory import get_recent_events
+
+    # Candidates that were cancelled log themselves after the response.
+    deadline = time.monotonic() + 2
+    while True:
+        events = [e for e in get_recent_events(50) if e["kind"] == "candidate"]
+        if len(events) >= count or time.monotonic() > deadline:
+            return sorted((e["payload"] for e in events), key=lambda p: p["candidate"])
+        time.sleep(0.01)
+
+
+class TestCandidates:
+    @staticmethod
+    def _draft_by_temperature(messages, purpose, temperature=None, **kwargs):
+        return f"draft at {temperature}"
+
+    def test_first_passing_candidate_returned(self, client):
+        def gate(text):
+            return ("0.6" in text, "ok" if "0.6" in text else "blocked")
+
+        with patch("proxy_agent.app.route_call", side_effect=self._draft_by_temperature), \
+             patch("proxy_agent.app.canonicalize", side_effect=lambda text, themes: text), \
+             patch("proxy_agent.app.check_publishable", side_effect=gate):
+            resp = client.post("/draft", json={"title": "T", "body": "B", "candidates": 3})
+        data = resp.json()
+        assert data["ok"] is True
+        assert data["candidate"] == 1
+        assert data["text"] == "draft at 0.6"
+        events = _candidate_events(3)
+        assert [e["temperature"] for e in events] == [0.4, 0.6, 0.8]
+        assert events[1]["status"] == "passed"
+
+    def test_all_blocked_returns_a_blocked_candidate(self, client):
+        with patch("proxy_agent.app.route_call", side_effect=self._draft_by_temperature), \
+             patch("proxy_agent.app.canonicalize", side_effect=lambda text, themes: text), \
+             patch("proxy_agent.app.check_publishable", return_value=(False, "blocked")):
+            resp = client.post("/draft", json={"title": "T", "body": "B", "candidates": 2})
+        data = resp.json()
+        assert data["ok"] is False
+        assert data["text"].startswith("draft at")
+        assert [e["status"] for e in _candidate_events(2)] == ["blocked", "blocked"]
+
+    def test_token_budget_cancels_remaining(self, client, monkeypatch):
+        from proxy_agent import llms
+        from proxy_agent.llms import LLMResult, Usage
+
+        def call_ollama(model, messages, temperature, **kwargs):
+            if temperature > 0.4:
+                time.sleep(0.2)
+            return LLMResult("draft", Usage(50, 50))
+
+        monkeypatch.setenv("LLM_DRAFT_BACKEND", "ollama")
+        llms.reload()
+        with patch("proxy_agent.llms.call_ollama", side_effect=call_ollama), \
+             patch("proxy_agent.app.canonicalize", return_value="final"), \
+             patch("proxy_agent.app.check_publishable", return_value=(False, "blocked")), \
+             patch("proxy_agent.app._update_identity_model"):
+            resp = client.post("/draft", json={
+                "title": "T", "body": "B", "candidates": 3, "candidate_token_budget": 100,
+            })
+            events = _candidate_events(3)
+        assert resp.json()["candidate"] == 0
+        assert [e["status"] for e in events] == ["blocked", "cancelled", "cancelled"]
+        assert events[0]["tokens"] == 100
+
+    def test_candidates_limited_by_free_slots(self, client, monkeypatch):
+        from proxy_agent import scheduler
+
+        sched = scheduler.Scheduler(
+            4, {"interactive": (2, 8), "publish": (2, 8), "bulk": (1, 8)}
+        )
+        monkeypatch.setattr(scheduler, "SCHEDULER", sched)
+        held = sched.acquire("interactive")
+        with patch("proxy_agent.app.route_call", side_effect=self._draft_by_temperature), \
+             patch("proxy_agent.app.canonicalize", side_effect=lambda text, themes: text), \
+             patch("proxy_agent.app.check_publishable", return_value=(False, "blocked")):
+            resp = client.post("/draft", json={"title": "T", "body": "B", "candidates": 3})
+        sched.release(held, 0.1)
+        assert resp.json()["candidate"] == 0
+        assert [e["candidate"] for e in _candidate_events(1)] == [0]
+        assert sched.running == 0
+
+    def test_candidate_count_limited(self, client):
+        resp = client.post("/draft", json={"title": "T", "body": "B", "candidates": 99})
+        assert resp.status_code == 422
@@ -0,0 +1,106 @@
+import multiprocessing
+import time
+
+from proxy_agent import background, db
+from proxy_agent.memory import (
+    IdentityConflict,
+    get_identity_version,
+    set_identity_model,
+)
+
+
+def _cas_increment(db_path, n):
+    """Worker process: bump a counter in the identity model ``n`` times."""
+    db.DB_PATH = db_path
+    for _ in range(n):
+        while True:
+            parent_id, model = get_identity_version()
+            try:
+                set_identity_model({"count": model.get("count", 0) + 1}, parent_id=parent_id)
+                break
+            except IdentityConflict:
+                continue
+
+
+class TestLeases:
+    def test_first_holder_wins(self):
+        assert background.acquire_lease("job", ttl_s=60, holder="a")
+        assert not background.acquire_lease("job", ttl_s=60, holder="b")
+
+    def test_holder_can_renew(self):
+        assert background.acquire_lease("job", ttl_s=60, holder="a")
+        assert background.acquire_lease("job", ttl_s=60, holder="a")
+
+    def test_expired_lease_taken_over(self):
+        assert background.acquire_lease("job", ttl_s=-1, holder="a")
+        assert background.acquire_lease("job", ttl_s=60, holder="b")
+
+    def test_release(self):
+        background.acquire_lease("job", ttl_s=60, holder="a")
+        background.release_lease("job", holder="a")
+        assert background.acquire_lease("job", ttl_s=60, holder="b")
+
+
+class TestJobs:
+    def test_due_job_runs_only_for_leader(self, monkeypatch):
+        runs = []
+        monkeypatch.setattr(background, "_JOBS", {})
+        background.register_job("tick", 60, lambda: runs.append(1))
+        background._JOBS["tick"].next_run = 0
+        background.acquire_lease("job:tick", ttl_s=60, holder="other-worker")
+        background.run_due_jobs()
+        assert runs == []
+
+        background.release_lease("job:tick", holder="other-worker")
+        background._JOBS["tick"].next_run = 0
+        background.run_due_jobs()
+        assert runs == [1]
+
+    def test_lease_renewed_while_job_runs(self, monkeypatch):
+        taken = []
+        monkeypatch.setattr(background, "_JOBS", {})
+        monkeypatch.setattr(background, "POLL_INTERVAL_S", 0)
+
+        def slow():
+            time.sleep(0.4)  # four times the 0.1 s lease TTL
+            taken.append(background.acquire_lease("job:slow", ttl_s=60, holder="other-worker"))
+
+        background.register_job("slow", 0.05, slow)
+        background._JOBS["slow"].next_run = 0
+        background.run_due_jobs()
+        assert taken == [False]
+
+    def test_lost_lease_is_reported_to_job(self, monkeypatch):
+        held = []
+        monkeypatch.setattr(background, "_JOBS", {})
+        monkeypatch.setattr(background, "POLL_INTERVAL_S", 0)
+
+        def stolen():
+            held.append(background.lease_held())
+            background.release_lease("job:stolen")
+            background.acquire_lease("job:stolen", ttl_s=60, holder="other-worker")
+            time.sleep(0.2)
+            held.append(background.lease_held())
+
+        background.register_job("stolen", 0.05, stolen)
+        background._JOBS["stolen"].next_run = 0
+        background.run_due_jobs()
+        assert held == [True, False]
+        assert background.lease_held()
+
+
+class TestMultiProcess:
+    def test_concurrent_identity_updates_stay_linear(self):
+        ctx = multiprocessing.get_context("fork")
+        procs = [ctx.Process(target=_cas_increment, args=(db.DB_PATH, 10)) for _ in range(4)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join(timeout=60)
+            assert p.exitcode == 0
+
+        assert get_identity_version()[1] == {"count": 40}
+        conn = db.get_conn()
+        rows = conn.execute("SELECT id, parent_id FROM identity_models ORDER BY id").fetchall()
+        conn.close()
+        assert all(row["parent_id"] == prev["id"] for prev, row in zip(rows, rows[1:]))
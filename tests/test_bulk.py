@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from proxy_agent import bulk, llms
+from proxy_agent.llms import LLMResult
+from proxy_agent.memory import get_recent_events
+
+
+def _lines(n: int) -> list[str]:
+    return [json.dumps({"title": f"T{i}", "body": f"B{i}"}) + "\n" for i in range(n)]
+
+
+def _results(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+@pytest.fixture()
+def pipeline():
+    with patch("proxy_agent.app.route_call", return_value="raw"), \
+         patch("proxy_agent.app.canonicalize", side_effect=lambda raw, themes: "final"), \
+         patch("proxy_agent.bulk._update_identity_model") as mock_update:
+        yield mock_update
+
+
+class TestRunBulk:
+    def test_drafts_every_line_in_process(self, tmp_path, pipeline):
+        output = tmp_path / "out.jsonl"
+        counts = bulk.run_bulk(_lines(5), output, concurrency=3, identity_every=2)
+        assert counts == {"drafted": 5, "blocked": 0, "errors": 0, "skipped": 0}
+        assert sorted(r["line"] for r in _results(output)) == [1, 2, 3, 4, 5]
+        assert all(r["text"] == "final" for r in _results(output))
+        kinds = [e["kind"] for e in get_recent_events(20)]
+        assert kinds.count("input") == kinds.count("output") == 5
+        # After the 2nd and 4th drafts and once at the end.
+        assert pipeline.call_count == 3
+
+    def test_resumes_from_output(self, tmp_path, pipeline):
+        output = tmp_path / "out.jsonl"
+        output.write_text(
+            json.dumps({"line": 1, "ok": True}) + "\n"
+            + json.dumps({"line": 2, "ok": True}) + "\n"
+            + '{"line": 3, "o'
+        )
+        counts = bulk.run_bulk(_lines(4), output)
+        assert counts["skipped"] == 2
+        assert counts["drafted"] == 2
+        assert [r["line"] for r in _results(output)][:2] == [1, 2]
+        assert sorted(r["line"] for r in _results(output)) == [1, 2, 3, 4]
+
+    def test_failed_drafts_retried_on_rerun(self, tmp_path, pipeline):
+        output = tmp_path / "out.jsonl"
+        output.write_text(
+            json.dumps({"line": 1, "ok": True}) + "\n"
+            + json.dumps({"line": 2, "error": "LLMError: timed out"}) + "\n"
+            + json.dumps({"line": 3, "error": "Invalid request: []"}) + "\n"
+        )
+        counts = bulk.run_bulk(_lines(3), output)
+        assert counts["skipped"] == 2
+        assert counts["drafted"] == 1
+        assert _results(output)[-1]["line"] == 2
+        assert bulk.completed_lines(output) == {1, 2, 3}
+
+    def test_identity_update_failure_keeps_results(self, tmp_path, pipeline):
+        pipeline.side_effect = [llms.LLMError("down"), None, None, None]
+        output = tmp_path / "out.jsonl"
+        counts = bulk.run_bulk(_lines(10), output, concurrency=2, identity_every=3)
+        assert counts["drafted"] == 10
+        assert sorted(r["line"] for r in _results(output)) == list(range(1, 11))
+        # Failed after the 3rd draft, retried after the 6th, then the 9th and the end.
+        assert pipeline.call_count == 4
+
+    def test_invalid_line_recorded(self, tmp_path, pipeline):
+        output = tmp_path / "out.jsonl"
+        lines = _lines(1) + ['{"title": "no body"}\n', "\n"]
+        counts = bulk.run_bulk(lines, output)
+        assert counts["errors"] == 1
+        errors = [r for r in _results(output) if "error" in r]
+        assert errors[0]["line"] == 2
+        assert errors[0]["error"].startswith("Invalid request")
+
+
+def test_main_limits_backend_concurrency(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "k")
+    monkeypatch.setattr(llms, "_backend_slots", {})
+    source = tmp_path / "in.jsonl"
+    source.write_text("".join(_lines(4)))
+    output = tmp_path / "out.jsonl"
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def call(*args, **kwargs):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return LLMResult("draft")
+
+    with patch("proxy_agent.llms.call_openai_compat", side_effect=call), \
+         patch("proxy_agent.app.canonicalize", return_value="final"), \
+         patch("proxy_agent.bulk._update_identity_model"):
+        bulk.main([str(source), "--output", str(output), "--concurrency", "4",
+                   "--backend-limit", "openai_compat=1"])
+    assert len(_results(output)) == 4
+    assert peak[0] == 1
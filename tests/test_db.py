@@ -1,6 +1,12 @@
 import sqlite3
 
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent import db
+from proxy_agent.app import app
 from proxy_agent.db import get_conn, init_db
+from proxy_agent.memory import get_recent_events, search
 
 
 class TestInitDb:
@@ -47,3 +53,95 @@ class TestGetConn:
         # sqlite3.Row should allow dict-like access
         assert row["scope"] == "t"
         conn.close()
+
+
+def _version(path) -> int:
+    conn = sqlite3.connect(path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    return version
+
+
+class TestMigrations:
+    def test_fresh_db_is_current(self, _tmp_db):
+        assert _version(_tmp_db) == db.SCHEMA_VERSION
+        assert init_db() == 0
+
+    def test_current_db_runs_no_migrations(self, monkeypatch):
+        def fail(cur):
+            raise AssertionError("migration ran")
+
+        monkeypatch.setattr(db, "MIGRATIONS", [fail] * db.SCHEMA_VERSION)
+        assert init_db() == 0
+
+    def test_upgrades_unversioned_db(self, tmp_path, monkeypatch):
+        legacy = tmp_path / "legacy.db"
+        conn = sqlite3.connect(legacy)
+        conn.execute(
+            "CREATE TABLE events(id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, "
+            "kind TEXT NOT NULL, source TEXT NOT NULL, payload_json TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE identity_models(id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "ts TEXT NOT NULL, model_json TEXT NOT NULL)"
+        )
+        conn.execute(
+            "INSERT INTO events(ts, kind, source, payload_json) "
+            "VALUES('t', 'output', 'agent', '{\"ok\": true, \"text\": \"legacy liturgy\"}')"
+        )
+        conn.commit()
+        conn.close()
+        monkeypatch.setattr(db, "DB_PATH", legacy)
+
+        assert init_db() == db.SCHEMA_VERSION
+        assert _version(legacy) == db.SCHEMA_VERSION
+        assert db.pending_backfills() == [db.SEARCH_BACKFILL_SCOPE]
+        db.run_backfills()
+        assert db.pending_backfills() == []
+        assert search("liturgy")[0]["ref_id"] == 1
+        assert get_recent_events()[0]["payload"] == {"ok": True, "text": "legacy liturgy"}
+
+    def test_failed_migration_rolls_back_and_resumes(self, _tmp_db, monkeypatch):
+        def bad(cur):
+            cur.execute("CREATE TABLE half_done(x)")
+            raise RuntimeError("boom")
+
+        monkeypatch.setattr(db, "MIGRATIONS", db.MIGRATIONS + [bad])
+        monkeypatch.setattr(db, "SCHEMA_VERSION", len(db.MIGRATIONS))
+        with pytest.raises(RuntimeError):
+            init_db()
+        assert _version(_tmp_db) == db.SCHEMA_VERSION - 1
+        conn = get_conn()
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'half_done'").fetchone()
+        assert row is None
+        conn.close()
+
+        db.MIGRATIONS[-1] = lambda cur: cur.execute("CREATE TABLE half_done(x)")
+        assert init_db() == 1
+        assert _version(_tmp_db) == db.SCHEMA_VERSION
+
+    def test_backfill_runs_until_done(self):
+        calls = []
+
+        def backfill() -> bool:
+            calls.append(1)
+            return len(calls) == 2
+
+        db.register_backfill("test_backfill", backfill)
+        conn = get_conn()
+        db.schedule_backfill(conn.cursor(), "test_backfill")
+        conn.commit()
+        conn.close()
+        db.run_backfills()
+        assert db.pending_backfills() == ["test_backfill"]
+        db.run_backfills()
+        assert db.pending_backfills() == []
+
+    def test_schema_endpoint_reports_startup(self):
+        with TestClient(app) as client:
+            data = client.get("/schema").json()
+        assert data["version"] == data["latest"] == db.SCHEMA_VERSION
+        assert data["startup"]["migrations_applied"] == 0
+        assert data["startup"]["startup_ms"] >= data["startup"]["migrate_ms"]
+        # Warm-up is disabled in tests, so the worker is ready once started.
+        assert data["startup"]["ready_ms"] >= data["startup"]["startup_ms"]
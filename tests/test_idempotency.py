@@ -0,0 +1,108 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent import idempotency
+from proxy_agent.app import app
+from proxy_agent.memory import get_recent_events
+
+
+@pytest.fixture()
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def _post(client, body="B", key="retry-1"):
+    headers = {"Idempotency-Key": key} if key else {}
+    return client.post("/draft", json={"title": "T", "body": body}, headers=headers)
+
+
+class TestDraftIdempotencyKey:
+    def test_retry_returns_stored_result(self, client):
+        with patch("proxy_agent.app.route_call", return_value="{}") as mock_rc, \
+             patch("proxy_agent.app.canonicalize", return_value="final"):
+            first = _post(client)
+            second = _post(client)
+        assert first.json() == second.json()
+        assert second.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in first.headers
+        # draft + summarize from the first request only
+        assert mock_rc.call_count == 2
+        assert [e["kind"] for e in get_recent_events()] == ["input", "output"]
+
+    def test_key_reused_with_other_payload_rejected(self, client):
+        with patch("proxy_agent.app.route_call", return_value="{}"), \
+             patch("proxy_agent.app.canonicalize", return_value="final"):
+            _post(client, body="B")
+            resp = _post(client, body="different")
+        assert resp.status_code == 422
+
+    def test_whitespace_is_normalized(self):
+        a = idempotency.request_hash({"title": "T", "body": "a  b\n"})
+        b = idempotency.request_hash({"title": "T", "body": "a b"})
+        assert a == b
+
+
+class TestRunOnce:
+    def test_concurrent_callers_share_one_execution(self):
+        calls = []
+        started = threading.Event()
+
+        def slow():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return {"text": "done"}
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(idempotency.run_once("k", "h", slow))
+        )
+        leader.start()
+        started.wait()
+        results.append(idempotency.run_once("k", "h", slow))
+        leader.join()
+        assert calls == [1]
+        assert sorted(replayed for _, replayed in results) == [False, True]
+        assert all(result == {"text": "done"} for result, _ in results)
+
+    def test_duplicate_stops_waiting_at_deadline(self):
+        started, finish = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            finish.wait(5)
+            return {"text": "done"}
+
+        leader = threading.Thread(target=idempotency.run_once, args=("k", "h", slow))
+        leader.start()
+        started.wait()
+        with pytest.raises(idempotency.StillRunning):
+            idempotency.run_once("k", "h", slow, deadline=time.monotonic() + 0.1)
+        finish.set()
+        leader.join()
+
+    def test_other_workers_reservation_waits_at_most_wait_s(self, monkeypatch):
+        monkeypatch.setattr(idempotency, "WAIT_S", 0.3)
+        assert idempotency._reserve("k", "h") is None  # held by "another worker"
+        with pytest.raises(idempotency.StillRunning):
+            idempotency.run_once("k", "h", lambda: {"n": 1})
+
+    def test_failure_releases_key(self):
+        with pytest.raises(RuntimeError):
+            idempotency.run_once("k", "h", lambda: (_ for _ in ()).throw(RuntimeError("x")))
+        assert idempotency.run_once("k", "h", lambda: {"ok": True}) == ({"ok": True}, False)
+
+    def test_unstored_key_runs_again_later(self):
+        idempotency.run_once("p", "h", lambda: {"n": 1}, store=False)
+        assert idempotency.run_once("p", "h", lambda: {"n": 2}, store=False) == ({"n": 2}, False)
+
+    def test_expired_keys_purged(self, monkeypatch):
+        monkeypatch.setattr(idempotency, "IDEMPOTENCY_TTL_S", -1)
+        idempotency.run_once("k", "h", lambda: {"n": 1})
+        idempotency.purge_expired()
+        assert idempotency.run_once("k", "h", lambda: {"n": 2}) == ({"n": 2}, False)
@@ -0,0 +1,111 @@
+import threading
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent import identity_view, objectives
+from proxy_agent.app import app
+from proxy_agent.db import get_conn
+from proxy_agent.memory import get_identity_version, set_identity_model, utc_now
+
+
+@pytest.fixture()
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def _write_from_other_worker(model_json: str) -> None:
+    """Append an identity version without touching this process's caches."""
+    parent_id = get_identity_version()[0]
+    conn = get_conn()
+    conn.execute(
+        "INSERT INTO identity_models(ts, model_json, parent_id) VALUES(?,?,?)",
+        (utc_now(), model_json, parent_id),
+    )
+    conn.commit()
+    conn.close()
+
+
+class TestConditionalGet:
+    def test_etag_and_304(self, client):
+        resp = client.get("/identity")
+        etag = resp.headers["etag"]
+        assert etag.startswith(f'"{get_identity_version()[0]}-')
+        assert client.get("/identity", headers={"If-None-Match": etag}).status_code == 304
+        weak = client.get("/identity", headers={"If-None-Match": f'"x", W/{etag}'})
+        assert weak.status_code == 304
+        assert weak.content == b""
+
+    def test_304_served_without_database(self, client):
+        etag = client.get("/identity").headers["etag"]
+        with patch(
+            "proxy_agent.identity_view.get_identity_version", side_effect=AssertionError("DB hit")
+        ):
+            assert client.get("/identity", headers={"If-None-Match": etag}).status_code == 304
+
+    def test_local_writes_change_etag_immediately(self, client):
+        etag = client.get("/identity").headers["etag"]
+        set_identity_model({"themes": "new"}, parent_id=get_identity_version()[0])
+        resp = client.get("/identity", headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.json()["identity_model"]["themes"] == "new"
+
+        etag = resp.headers["etag"]
+        objectives.add_objective("t", "d")
+        assert client.get("/identity", headers={"If-None-Match": etag}).status_code == 200
+
+    def test_other_workers_seen_after_ttl(self, client, monkeypatch):
+        etag = client.get("/identity").headers["etag"]
+        _write_from_other_worker('{"themes": "elsewhere"}')
+        assert client.get("/identity", headers={"If-None-Match": etag}).status_code == 304
+        monkeypatch.setattr(identity_view, "SNAPSHOT_TTL_S", 0)
+        resp = client.get("/identity", headers={"If-None-Match": etag})
+        assert resp.json()["identity_model"]["themes"] == "elsewhere"
+
+    def test_long_poll_returns_new_version(self, client, monkeypatch):
+        monkeypatch.setattr(identity_view, "STREAM_POLL_INTERVAL_S", 0.05)
+        etag = client.get("/identity").headers["etag"]
+        parent_id = get_identity_version()[0]
+        timer = threading.Timer(0.2, set_identity_model, ({"themes": "later"}, parent_id))
+        timer.start()
+        resp = client.get("/identity", params={"wait": 5}, headers={"If-None-Match": etag})
+        timer.join()
+        assert resp.status_code == 200
+        assert resp.json()["identity_model"]["themes"] == "later"
+
+    def test_long_poll_times_out_with_304(self, client, monkeypatch):
+        monkeypatch.setattr(identity_view, "STREAM_POLL_INTERVAL_S", 0.05)
+        etag = client.get("/identity").headers["etag"]
+        resp = client.get("/identity", params={"wait": 0.2}, headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+
+
+class TestStream:
+    def test_pushes_current_then_new_versions(self, client, monkeypatch):
+        monkeypatch.setattr(identity_view, "STREAM_POLL_INTERVAL_S", 0.05)
+        parent_id = get_identity_version()[0]
+        timer = threading.Timer(0.2, set_identity_model, ({"themes": "pushed"}, parent_id))
+        timer.start()
+        with client.stream("GET", "/identity/stream", params={"timeout": 0.6}) as resp:
+            assert resp.headers["content-type"].startswith("text/event-stream")
+            text = "".join(resp.iter_text())
+        timer.join()
+        events = [e for e in text.split("\n\n") if e.startswith("event: identity")]
+        assert len(events) == 2
+        assert '"pushed"' in events[1]
+
+    def test_last_event_id_skips_unchanged_snapshot(self, client):
+        etag = client.get("/identity").headers["etag"]
+        with client.stream(
+            "GET", "/identity/stream", params={"timeout": 0.2}, headers={"Last-Event-ID": etag}
+        ) as resp:
+            assert "".join(resp.iter_text()) == ""
+
+
+def test_etag_matches():
+    assert identity_view.etag_matches("*", '"1-a"')
+    assert identity_view.etag_matches('"0-b", "1-a"', '"1-a"')
+    assert not identity_view.etag_matches(None, '"1-a"')
+    assert not identity_view.etag_matches('"1-b"', '"1-a"')
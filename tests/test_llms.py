@@ -2,9 +2,16 @@ import os
 from unittest.mock import patch, MagicMock
 
 import pytest
+from fastapi.testclient import TestClient
 
+from proxy_agent import llms
+from proxy_agent.app import app
 from proxy_agent.llms import (
+    BudgetExceeded,
     LLMError,
+    LLMResult,
+    Usage,
+    collect_usage,
     _post_json,
     call_openai_compat,
     call_ollama,
@@ -22,7 +29,7 @@ class TestPostJson:
         mock_resp = MagicMock()
         mock_resp.status_code = 200
         mock_resp.json.return_value = {"result": "ok"}
-        with patch("proxy_agent.llms.requests.post", return_value=mock_resp) as mock_post:
+        with patch("proxy_agent.llms._SESSION.post", return_value=mock_resp) as mock_post:
             data = _post_json("http://example.com/api", {"X-Key": "k"}, {"q": 1})
         mock_post.assert_called_once_with(
             "http://example.com/api",
@@ -36,7 +43,7 @@ class TestPostJson:
         mock_resp = MagicMock()
         mock_resp.status_code = 500
         mock_resp.text = "Internal Server Error"
-        with patch("proxy_agent.llms.requests.post", return_value=mock_resp):
+        with patch("proxy_agent.llms._SESSION.post", return_value=mock_resp):
             with pytest.raises(LLMError, match="LLM HTTP 500"):
                 _post_json("http://example.com/api", {}, {})
 
@@ -44,7 +51,7 @@ class TestPostJson:
         mock_resp = MagicMock()
         mock_resp.status_code = 200
         mock_resp.json.return_value = {}
-        with patch("proxy_agent.llms.requests.post", return_value=mock_resp) as mock_post:
+        with patch("proxy_agent.llms._SESSION.post", return_value=mock_resp) as mock_post:
             _post_json("http://example.com", {}, {}, timeout=30)
         assert mock_post.call_args.kwargs["timeout"] == 30
 
@@ -99,7 +106,7 @@ class TestCallOllama:
         mock_resp = MagicMock()
         mock_resp.status_code = 200
         mock_resp.json.return_value = {"message": {"content": "Hello from Ollama"}}
-        with patch("proxy_agent.llms.requests.post", return_value=mock_resp) as mock_post:
+        with patch("proxy_agent.llms._SESSION.post", return_value=mock_resp) as mock_post:
             result = call_ollama("llama3.1", [{"role": "user", "content": "hi"}])
         assert result == "Hello from Ollama"
         call_url = mock_post.call_args[0][0]
@@ -109,7 +116,7 @@ class TestCallOllama:
         mock_resp = MagicMock()
         mock_resp.status_code = 200
         mock_resp.json.return_value = {"message": {"content": "ok"}}
-        with patch("proxy_agent.llms.requests.post", return_value=mock_resp) as mock_post:
+        with patch("proxy_agent.llms._SESSION.post", return_value=mock_resp) as mock_post:
             call_ollama("m", [], base_url="http://remote:11434/")
         assert mock_post.call_args[0][0] == "http://remote:11434/api/chat"
 
@@ -117,7 +124,7 @@ class TestCallOllama:
         mock_resp = MagicMock()
         mock_resp.status_code = 404
         mock_resp.text = "Not Found"
-        with patch("proxy_agent.llms.requests.post", return_value=mock_resp):
+        with patch("proxy_agent.llms._SESSION.post", return_value=mock_resp):
             with pytest.raises(LLMError, match="Ollama HTTP 404"):
                 call_ollama("m", [])
 
@@ -125,7 +132,7 @@ class TestCallOllama:
         mock_resp = MagicMock()
         mock_resp.status_code = 200
         mock_resp.json.return_value = {"message": {"content": "ok"}}
-        with patch("proxy_agent.llms.requests.post", return_value=mock_resp) as mock_post:
+        with patch("proxy_agent.llms._SESSION.post", return_value=mock_resp) as mock_post:
             call_ollama("m", [], temperature=0.9)
         payload = mock_post.call_args.kwargs["json"]
         assert payload["options"]["temperature"] == 0.9
@@ -281,3 +288,237 @@ class TestRouteCall:
         with patch("proxy_agent.llms.call_ollama", return_value="ok") as mock_fn:
             route_call([], "voice")
         assert mock_fn.call_args[0][0] == "mistral"
+
+
+# ---------------------------------------------------------------------------
+# usage
+# ---------------------------------------------------------------------------
+
+class TestUsage:
+    def test_openai_usage_normalized(self):
+        api_response = {
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {"prompt_tokens": 12, "completion_tokens": 3},
+        }
+        with patch("proxy_agent.llms._post_json", return_value=api_response):
+            result = call_openai_compat("m", [], "http://url", "k")
+        assert result.usage == Usage(12, 3)
+        assert result.backend == "openai_compat"
+
+    def test_ollama_usage_normalized(self):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.json.return_value = {
+            "message": {"content": "ok"}, "prompt_eval_count": 7, "eval_count": 2,
+        }
+        with patch("proxy_agent.llms._SESSION.post", return_value=mock_resp):
+            result = call_ollama("m", [])
+        assert result.usage == Usage(7, 2)
+
+    def test_claude_usage_normalized(self):
+        api_response = {
+            "content": [{"type": "text", "text": "ok"}],
+            "usage": {"input_tokens": 20, "output_tokens": 5},
+        }
+        with patch("proxy_agent.llms._post_json", return_value=api_response):
+            result = call_claude("m", [{"role": "user", "content": "hi"}], "k")
+        assert result.usage == Usage(20, 5)
+
+    def test_route_call_result_metadata(self, monkeypatch):
+        monkeypatch.setenv("LLM_DRAFT_BACKEND", "ollama")
+        monkeypatch.setenv("LLM_DRAFT_MODEL", "llama3.1")
+        with patch("proxy_agent.llms.call_ollama", return_value=LLMResult("ok", Usage(3, 4))):
+            result = route_call([], "draft")
+        assert result == "ok"
+        assert result.purpose == "draft"
+        assert result.model == "llama3.1"
+        assert result.usage.total_tokens == 7
+        assert result.latency_ms >= 0
+
+    def test_collect_usage(self, monkeypatch):
+        monkeypatch.setenv("LLM_DRAFT_BACKEND", "ollama")
+        with patch("proxy_agent.llms.call_ollama", return_value="ok"):
+            with collect_usage() as calls:
+                route_call([], "draft")
+                route_call([], "draft")
+        assert len(calls) == 2
+
+    def test_budget_switches_to_fallback_model(self, monkeypatch):
+        monkeypatch.setenv("LLM_SUMMARIZE_BACKEND", "ollama")
+        monkeypatch.setenv("LLM_SUMMARIZE_TOKEN_BUDGET", "10")
+        monkeypatch.setenv("LLM_SUMMARIZE_FALLBACK_MODEL", "tiny")
+        with patch("proxy_agent.llms.call_ollama", return_value=LLMResult("ok", Usage(8, 4))) as m:
+            route_call([], "summarize")
+            route_call([], "summarize")
+        assert m.call_args_list[0][0][0] == "gpt-4.1-mini"
+        assert m.call_args_list[1][0][0] == "tiny"
+
+    def test_fallback_model_priced_as_itself(self, monkeypatch):
+        monkeypatch.setenv("LLM_SUMMARIZE_BACKEND", "ollama")
+        monkeypatch.setenv("LLM_SUMMARIZE_TOKEN_BUDGET", "10")
+        monkeypatch.setenv("LLM_SUMMARIZE_FALLBACK_MODEL", "cheap")
+        monkeypatch.setenv("LLM_PRICE_GPT_4_1_MINI_IN", "1")
+        monkeypatch.setenv("LLM_PRICE_CHEAP_IN", "0.5")
+        # Servers may answer with a dated model name; the requested model is priced.
+        served = LLMResult("ok", Usage(1_000_000, 0), model="gpt-4.1-mini-2025-04-14")
+        with patch("proxy_agent.llms.call_ollama", return_value=served):
+            first = route_call([], "summarize")
+            second = route_call([], "summarize")
+        assert (first.cost_usd, second.cost_usd) == (pytest.approx(1.0), pytest.approx(0.5))
+
+    def test_budget_without_fallback_raises(self, monkeypatch):
+        monkeypatch.setenv("LLM_SUMMARIZE_BACKEND", "ollama")
+        monkeypatch.setenv("LLM_SUMMARIZE_TOKEN_BUDGET", "10")
+        with patch("proxy_agent.llms.call_ollama", return_value=LLMResult("ok", Usage(8, 4))):
+            route_call([], "summarize")
+            with pytest.raises(BudgetExceeded):
+                route_call([], "summarize")
+
+
+# ---------------------------------------------------------------------------
+# Structured output
+# ---------------------------------------------------------------------------
+
+SCHEMA = {"type": "object", "properties": {"a": {"type": "string"}}}
+
+
+class TestStructuredOutput:
+    def test_openai_json_mode(self, monkeypatch):
+        api_response = {"choices": [{"message": {"content": '{"a": "x"}'}}]}
+        with patch("proxy_agent.llms._post_json", return_value=api_response) as mock_pj:
+            call_openai_compat("m", [], "http://x", "k", json_schema=SCHEMA)
+        assert mock_pj.call_args[0][2]["response_format"] == {"type": "json_object"}
+
+        monkeypatch.setenv("OPENAI_COMPAT_JSON_SCHEMA", "1")
+        monkeypatch.setenv("OPENAI_API_KEY", "k")
+        llms.reload()
+        with patch("proxy_agent.llms._post_json", return_value=api_response) as mock_pj:
+            route_call([], "summarize", json_schema=SCHEMA)
+        fmt = mock_pj.call_args[0][2]["response_format"]
+        assert fmt["type"] == "json_schema"
+        assert fmt["json_schema"]["schema"] == SCHEMA
+
+    def test_ollama_format_json(self):
+        mock_resp = MagicMock()
+        mock_resp.status_code = 200
+        mock_resp.json.return_value = {"message": {"content": "{}"}}
+        with patch("proxy_agent.llms._SESSION.post", return_value=mock_resp) as mock_post:
+            call_ollama("m", [], json_schema=SCHEMA)
+        assert mock_post.call_args.kwargs["json"]["format"] == "json"
+
+    def test_claude_tool_use(self):
+        api_response = {
+            "content": [{"type": "tool_use", "name": "respond", "input": {"a": "x"}}],
+        }
+        with patch("proxy_agent.llms._post_json", return_value=api_response) as mock_pj:
+            result = call_claude("m", [{"role": "user", "content": "hi"}], "k", json_schema=SCHEMA)
+        payload = mock_pj.call_args[0][2]
+        assert payload["tools"][0]["input_schema"] == SCHEMA
+        assert payload["tool_choice"] == {"type": "tool", "name": "respond"}
+        assert result == '{"a": "x"}'
+
+    def test_route_call_passes_schema_unless_disabled(self, monkeypatch):
+        monkeypatch.setenv("LLM_SUMMARIZE_BACKEND", "ollama")
+        with patch("proxy_agent.llms.call_ollama", return_value="{}") as mock_fn:
+            route_call([], "summarize", json_schema=SCHEMA)
+        assert mock_fn.call_args.kwargs["json_schema"] == SCHEMA
+
+        monkeypatch.setenv("LLM_SUMMARIZE_STRUCTURED", "0")
+        llms.reload()
+        with patch("proxy_agent.llms.call_ollama", return_value="{}") as mock_fn:
+            route_call([], "summarize", json_schema=SCHEMA)
+        assert "json_schema" not in mock_fn.call_args.kwargs
+
+
+# ---------------------------------------------------------------------------
+# Backend registry and routes
+# ---------------------------------------------------------------------------
+
+class TestRoutes:
+    def test_invalid_value_rejected_at_load(self, monkeypatch):
+        monkeypatch.setenv("LLM_DRAFT_TEMP", "warm")
+        with pytest.raises(llms.ConfigError, match="LLM_DRAFT_TEMP"):
+            llms.load_routes()
+
+    @pytest.mark.parametrize(
+        "name, value",
+        [
+            ("LLM_DRAFT_TOKEN_BUDGET", "lots"),
+            ("LLM_PRICE_GPT_4_1_MINI_OUT", "cheap"),
+            ("OPENAI_COMPAT_JSON_SCHEMA", "yes"),
+            ("LLM_VOICE_STRUCTURED", "off"),
+        ],
+    )
+    def test_budget_price_and_flags_validated_at_load(self, monkeypatch, name, value):
+        monkeypatch.setenv(name, value)
+        with pytest.raises(llms.ConfigError, match=name):
+            llms.reload()
+
+    def test_budget_and_prices_reloaded_from_config_file(self, monkeypatch, tmp_path):
+        config = tmp_path / "llm.env"
+        config.write_text("LLM_DRAFT_TOKEN_BUDGET=500\nLLM_PRICE_GPT_4_1_MINI_IN=0.4\n")
+        monkeypatch.setenv("LLM_CONFIG_FILE", str(config))
+        route = llms.reload()["draft"]
+        assert route.token_budget == 500
+        assert route.prices == {"gpt-4.1-mini": (0.4, 0.0)}
+
+    def test_routes_resolved_once(self, monkeypatch):
+        route = llms.get_route("voice")
+        monkeypatch.setenv("LLM_VOICE_MODEL", "mistral")
+        assert llms.get_route("voice") is route
+        assert llms.reload()["voice"].model == "mistral"
+        # A call that picked the old route keeps using it.
+        assert route.model == "gpt-4.1-mini"
+
+    def test_failed_reload_keeps_routes(self, monkeypatch):
+        before = llms.routes()
+        monkeypatch.setenv("LLM_SUMMARIZE_BACKEND", "nonexistent")
+        with pytest.raises(llms.ConfigError):
+            llms.reload()
+        assert llms.routes() is before
+
+    def test_config_file_overrides_env(self, monkeypatch, tmp_path):
+        config = tmp_path / "llm.env"
+        config.write_text("# backends\nLLM_DRAFT_BACKEND=ollama\nexport OLLAMA_BASE_URL='http://gpu:11434'\n")
+        monkeypatch.setenv("LLM_CONFIG_FILE", str(config))
+        route = llms.reload()["draft"]
+        assert (route.backend.name, route.backend.url) == ("ollama", "http://gpu:11434")
+
+    def test_registered_backend_used_by_route_call(self, monkeypatch):
+        monkeypatch.setattr(llms, "_BACKENDS", dict(llms._BACKENDS))
+
+        @llms.register_backend("echo")
+        class EchoBackend(llms.Backend):
+            def call(self, route, model, messages, json_schema):
+                return f"{model}:{messages[0]['content']}"
+
+        monkeypatch.setenv("LLM_DRAFT_BACKEND", "echo")
+        result = route_call([{"role": "user", "content": "hi"}], "draft")
+        assert result == "gpt-4.1-mini:hi"
+        assert result.backend == "echo"
+
+    def test_missing_api_key_fails_the_call(self, monkeypatch):
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        with pytest.raises(LLMError, match="OPENAI_API_KEY"):
+            route_call([], "draft")
+
+
+class TestRouteEndpoints:
+    def test_startup_fails_on_invalid_config(self, monkeypatch):
+        monkeypatch.setenv("LLM_VOICE_MAX_TOKENS", "lots")
+        with pytest.raises(llms.ConfigError):
+            with TestClient(app):
+                pass
+
+    def test_reload_endpoint(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "t")
+        headers = {"Authorization": "Bearer t"}
+        with TestClient(app) as client:
+            assert client.post("/admin/routes/reload").status_code == 403
+            monkeypatch.setenv("LLM_DRAFT_BACKEND", "claude")
+            routes = client.post("/admin/routes/reload", headers=headers).json()
+            assert routes["draft"]["backend"] == "claude"
+            monkeypatch.setenv("LLM_DRAFT_TEMP", "hot")
+            resp = client.post("/admin/routes/reload", headers=headers)
+            assert resp.status_code == 422
+            assert client.get("/admin/routes", headers=headers).json()["draft"]["temperature"] == 0.4
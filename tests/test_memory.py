@@ -2,7 +2,22 @@ import json
 
 import pytest
 
-from proxy_agent.memory import append_event, get_recent_events, get_summary, set_summary
+from proxy_agent import db
+from proxy_agent.db import get_conn, init_db
+from proxy_agent.memory import (
+    DEFAULT_IDENTITY_MODEL,
+    IdentityConflict,
+    append_event,
+    backfill_search_index,
+    compress_payloads,
+    get_identity_model,
+    get_identity_version,
+    get_recent_events,
+    get_summary,
+    search,
+    set_identity_model,
+    set_summary,
+)
 
 
 class TestAppendEvent:
@@ -52,6 +67,65 @@ class TestGetRecentEvents:
         assert e["payload"] == {"key": "value"}
 
 
+class TestCompressedPayloads:
+    @pytest.fixture(autouse=True)
+    def _zlib(self, monkeypatch):
+        monkeypatch.setenv("EVENT_COMPRESS_MIN_BYTES", "64")
+        monkeypatch.setenv("EVENT_PAYLOAD_CODEC", "zlib")
+
+    def _codecs(self):
+        conn = get_conn()
+        rows = conn.execute("SELECT codec FROM events ORDER BY id").fetchall()
+        conn.close()
+        return [row["codec"] for row in rows]
+
+    def test_large_payloads_stored_compressed(self):
+        append_event("output", "agent", {"text": "memory is covenant " * 20})
+        append_event("input", "user", {"n": 1})
+        assert self._codecs() == ["zlib1", "json"]
+        events = get_recent_events()
+        assert events[0]["payload"]["text"].startswith("memory is covenant")
+        assert events[1]["payload"] == {"n": 1}
+
+    def test_payload_decoded_lazily(self):
+        append_event("output", "agent", {"text": "memory is covenant " * 20})
+        event = get_recent_events()[0]
+        assert event._raw is not None
+        assert event.kind == "output"
+        assert event._raw is not None
+        assert event.payload is event["payload"]
+        assert event._raw is None
+
+    def test_repr_matches_dict(self):
+        append_event("input", "user", {"n": 1})
+        event = get_recent_events()[0]
+        assert repr(event) == repr(event.as_dict())
+        assert event == event.as_dict()
+
+    def test_compressed_events_searchable(self):
+        append_event("output", "agent", {"ok": True, "text": "liturgy " + "of recursion " * 20})
+        assert self._codecs() == ["zlib1"]
+        assert search("liturgy")[0]["source"] == "event"
+
+    def test_migration_rewrites_existing_rows(self, monkeypatch):
+        monkeypatch.setenv("EVENT_PAYLOAD_CODEC", "json")
+        for i in range(5):
+            append_event("output", "agent", {"ok": True, "text": f"legacy {i} " + "long words " * 20})
+        append_event("input", "user", {"n": 1})
+        monkeypatch.setenv("EVENT_PAYLOAD_CODEC", "zlib")
+        assert compress_payloads(batch_size=4) == 4
+        assert compress_payloads(batch_size=4) == 1
+        assert compress_payloads(batch_size=4) == 0
+        assert self._codecs() == ["zlib1"] * 5 + ["json"]
+        assert get_recent_events()[0]["payload"]["text"].startswith("legacy 0")
+        assert len(search("legacy")) == 5
+
+    def test_migration_disabled_for_json_codec(self, monkeypatch):
+        append_event("output", "agent", {"text": "long words " * 20})
+        monkeypatch.setenv("EVENT_PAYLOAD_CODEC", "json")
+        assert compress_payloads() == 0
+
+
 class TestSummary:
     def test_get_missing_summary_returns_empty(self):
         assert get_summary("nonexistent") == ""
@@ -70,3 +144,98 @@ class TestSummary:
         set_summary("other", "other summary")
         assert get_summary("self") == "self summary"
         assert get_summary("other") == "other summary"
+
+
+class TestIdentityModelVersions:
+    def test_empty_table_has_no_version(self):
+        version, model = get_identity_version()
+        assert version is None
+        assert model == DEFAULT_IDENTITY_MODEL
+
+    def test_compare_and_swap_chain(self):
+        first = set_identity_model({"themes": "a"})
+        second = set_identity_model({"themes": "b"}, parent_id=first)
+        assert get_identity_version() == (second, {"themes": "b"})
+
+    def test_stale_parent_raises_conflict(self):
+        first = set_identity_model({"themes": "a"})
+        set_identity_model({"themes": "b"}, parent_id=first)
+        with pytest.raises(IdentityConflict):
+            set_identity_model({"themes": "c"}, parent_id=first)
+        assert get_identity_model() == {"themes": "b"}
+
+    def test_seed_only_on_empty_table(self):
+        set_identity_model({"themes": "a"})
+        with pytest.raises(IdentityConflict):
+            set_identity_model({"themes": "again"})
+
+
+class TestSearch:
+    def test_finds_event_text(self):
+        append_event("input", "user", {"title": "On recursion", "body": "memory is covenant"})
+        append_event("output", "agent", {"ok": True, "text": "Something unrelated"})
+        results = search("covenant")
+        assert len(results) == 1
+        assert results[0]["source"] == "event"
+        assert results[0]["kind"] == "input"
+        assert "[covenant]" in results[0]["snippet"]
+
+    def test_blocked_outputs_not_indexed(self):
+        append_event("output", "agent", {"ok": False, "text": "my key is sk-covenant"})
+        append_event("candidate", "agent", {"text": "covenant draft"})
+        assert search("covenant") == []
+
+    def test_finds_identity_themes(self):
+        set_identity_model({"themes": "persistence through recursion"})
+        results = search("recursion")
+        assert results[0]["source"] == "identity"
+
+    def test_ranked_and_paginated(self):
+        append_event("output", "agent", {"ok": True, "text": "agent agent agent memory"})
+        append_event("output", "agent", {"ok": True, "text": "agent once, then a long tail of other words"})
+        first = search("agent", limit=1)
+        second = search("agent", limit=1, offset=1)
+        assert first[0]["ref_id"] != second[0]["ref_id"]
+        assert first[0]["score"] <= second[0]["score"]
+
+    def test_query_syntax_is_escaped(self):
+        append_event("output", "agent", {"ok": True, "text": "NEAR AND OR"})
+        assert search('NEAR" OR (') != []
+        assert search("  ") == []
+
+    def test_backfill_indexes_rows_older_than_the_index(self):
+        conn = get_conn()
+        conn.execute("DROP TABLE search_index")
+        conn.execute("DROP TRIGGER events_search_insert_json")
+        conn.execute("DROP TRIGGER events_search_delete")
+        conn.execute("DROP TRIGGER identity_models_search_insert")
+        # Back to the schema version before the search index migration.
+        conn.execute(f"PRAGMA user_version = {db.MIGRATIONS.index(db._m010_search_index)}")
+        conn.commit()
+        conn.close()
+        for i in range(5):
+            append_event("output", "agent", {"ok": True, "text": f"legacy thought {i}"})
+        init_db()
+        assert search("legacy") == []
+        while not backfill_search_index(batch_size=2):
+            pass
+        assert len(search("legacy")) == 5
+        assert backfill_search_index() is True
+
+    def test_backfill_indexes_compressed_rows(self, monkeypatch):
+        conn = get_conn()
+        conn.execute("DROP TABLE search_index")
+        conn.execute("DROP TRIGGER events_search_insert_json")
+        conn.execute("DROP TRIGGER events_search_delete")
+        conn.execute("DROP TRIGGER identity_models_search_insert")
+        # Back to the schema version before the search index migration.
+        conn.execute(f"PRAGMA user_version = {db.MIGRATIONS.index(db._m010_search_index)}")
+        conn.commit()
+        conn.close()
+        monkeypatch.setenv("EVENT_PAYLOAD_CODEC", "zlib")
+        monkeypatch.setenv("EVENT_COMPRESS_MIN_BYTES", "0")
+        append_event("output", "agent", {"ok": True, "text": "legacy compressed thought"})
+        init_db()
+        while not backfill_search_index():
+            pass
+        assert len(search("compressed")) == 1
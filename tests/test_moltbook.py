@@ -49,3 +49,11 @@ class TestCreatePost:
         with patch("proxy_agent.moltbook.requests.post", return_value=mock_resp):
             with pytest.raises(MoltbookError, match="HTTP 403"):
                 create_post("sub", "t", "b")
+
+    def test_idempotency_key_and_session(self, monkeypatch):
+        monkeypatch.setenv("MOLTBOOK_TOKEN", "tok-123")
+        session = MagicMock()
+        session.post.return_value.status_code = 200
+        session.post.return_value.json.return_value = {}
+        create_post("sub", "t", "b", idempotency_key="abc", session=session)
+        assert session.post.call_args.kwargs["headers"]["Idempotency-Key"] == "abc"
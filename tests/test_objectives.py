@@ -0,0 +1,108 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent import objectives
+from proxy_agent.app import DraftRequest, _generate, app
+from proxy_agent.db import current_shard
+from proxy_agent.memory import DEFAULT_IDENTITY_MODEL, append_event
+
+
+@pytest.fixture()
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+class TestCrud:
+    def test_add_and_get(self):
+        oid = objectives.add_objective("Memory position", "Arrive at a position on memory")
+        objective = objectives.get_objective(oid)
+        assert objective["status"] == "active"
+        assert objective["priority"] == 100
+        assert objective["proposed_by"] == "user"
+
+    def test_active_sorted_by_priority(self):
+        objectives.add_objective("low", "d", priority=50)
+        objectives.add_objective("high", "d", priority=10)
+        assert [o["title"] for o in objectives.get_active_objectives()] == ["high", "low"]
+
+    def test_update_and_retire_refresh_cache(self):
+        a = objectives.add_objective("a", "d", priority=10)
+        objectives.add_objective("b", "d", priority=20)
+        objectives.update_objective(a, priority=30)
+        assert [o["title"] for o in objectives.get_active_objectives()] == ["b", "a"]
+        objectives.retire_objective(a, status="abandoned")
+        assert [o["title"] for o in objectives.get_active_objectives()] == ["b"]
+        assert objectives.list_objectives(status="abandoned")[0]["id"] == a
+
+    def test_invalid_update_rejected(self):
+        oid = objectives.add_objective("a", "d")
+        with pytest.raises(ValueError):
+            objectives.update_objective(oid, status="finished")
+        with pytest.raises(ValueError):
+            objectives.update_objective(oid, created_ts="x")
+        with pytest.raises(ValueError):
+            objectives.update_objective(oid, progress="done")
+        with pytest.raises(ValueError):
+            objectives.retire_objective(oid, status="paused")
+
+    def test_top_k_served_from_cache(self):
+        objectives.add_objective("a", "d")
+        with patch("proxy_agent.objectives.get_conn", side_effect=AssertionError("DB hit")):
+            assert len(objectives.get_active_objectives(3)) == 1
+
+    def test_cache_rebuilt_after_eviction(self):
+        objectives.add_objective("a", "d")
+        current_shard().cache.clear()
+        assert [o["title"] for o in objectives.get_active_objectives()] == ["a"]
+
+
+class TestScanProgress:
+    def test_counts_related_outputs_incrementally(self):
+        oid = objectives.add_objective("Agent memory", "Explore recursion and memory persistence")
+        append_event("output", "agent", {"text": "Memory persistence through recursion."})
+        append_event("output", "agent", {"text": "Tomatoes need compost."})
+        assert objectives.scan_progress() == 1
+        assert objectives.get_objective(oid)["related_outputs"] == 1
+        assert objectives.scan_progress() == 0
+
+        append_event("output", "agent", {"text": "Recursion makes memory a covenant."})
+        objectives.scan_progress()
+        objective = objectives.get_objective(oid)
+        assert objective["related_outputs"] == 2
+        assert objective["progress"].startswith("2 related outputs")
+
+    def test_paused_objectives_not_scanned(self):
+        oid = objectives.add_objective("Agent memory", "recursion memory persistence")
+        objectives.update_objective(oid, status="paused")
+        append_event("output", "agent", {"text": "memory persistence recursion"})
+        assert objectives.scan_progress() == 0
+
+
+class TestIntegration:
+    def test_draft_prompt_includes_top_objectives(self):
+        objectives.add_objective("Memory position", "Arrive at a position", priority=1)
+        req = DraftRequest(title="T", body="B")
+        with patch("proxy_agent.app.route_call", return_value="raw") as mock_rc, \
+             patch("proxy_agent.app.canonicalize", return_value="final"):
+            _generate(req, DEFAULT_IDENTITY_MODEL)
+        assert "Memory position: Arrive at a position" in mock_rc.call_args[0][0][1]["content"]
+
+    def test_endpoints_and_identity(self, client):
+        created = client.post("/objectives", json={"title": "t", "description": "d"}).json()
+        assert client.get("/identity").json()["active_objectives"][0]["id"] == created["id"]
+
+        resp = client.patch(f"/objectives/{created['id']}", json={"status": "completed"})
+        assert resp.json()["status"] == "completed"
+        assert client.get("/identity").json()["active_objectives"] == []
+        assert len(client.get("/objectives", params={"status": "all"}).json()["objectives"]) == 1
+
+    def test_patch_errors(self, client):
+        assert client.patch("/objectives/99", json={"priority": 1}).status_code == 404
+        created = client.post("/objectives", json={"title": "t", "description": "d"}).json()
+        resp = client.patch(f"/objectives/{created['id']}", json={"status": "bogus"})
+        assert resp.status_code == 422
+        resp = client.patch(f"/objectives/{created['id']}", json={"progress": "done"})
+        assert resp.status_code == 422
@@ -0,0 +1,115 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent import outbox
+from proxy_agent.app import app
+from proxy_agent.memory import get_recent_events
+from proxy_agent.moltbook import MoltbookError
+
+POST = {"submolt": "philosophy", "title": "T", "body": "final"}
+
+
+@pytest.fixture(autouse=True)
+def _fresh_limiter(monkeypatch):
+    monkeypatch.setattr(outbox, "_limiter", outbox._RateLimiter())
+    monkeypatch.setenv("OUTBOX_MOLTBOOK_RATE_PER_MIN", "60000000")
+
+
+def _enqueue():
+    return outbox.enqueue_output({"ok": True, "reason": "ok", "text": "final"}, "moltbook", POST)
+
+
+class TestEnqueue:
+    def test_output_event_and_row_written_together(self):
+        event_id, outbox_id = _enqueue()
+        assert get_recent_events()[-1]["id"] == event_id
+        status = outbox.get_status(outbox_id)
+        assert status["status"] == "pending"
+        assert status["event_id"] == event_id
+
+    def test_unknown_id(self):
+        assert outbox.get_status(999) is None
+
+
+class TestDeliver:
+    def test_success_marks_sent(self):
+        _, outbox_id = _enqueue()
+        with patch("proxy_agent.outbox.create_post", return_value={"id": 7}) as mock_post:
+            assert outbox.deliver_due() == 1
+        assert mock_post.call_args.kwargs["idempotency_key"]
+        status = outbox.get_status(outbox_id)
+        assert status["status"] == "sent"
+        assert status["response"] == {"id": 7}
+        assert get_recent_events()[-1]["source"] == "moltbook.create_post"
+
+    def test_failure_schedules_retry(self):
+        _, outbox_id = _enqueue()
+        with patch("proxy_agent.outbox.create_post", side_effect=MoltbookError("HTTP 503")):
+            assert outbox.deliver_due() == 0
+            # Not due again until the backoff has elapsed.
+            assert outbox.deliver_due() == 0
+        status = outbox.get_status(outbox_id)
+        assert status["status"] == "pending"
+        assert status["attempts"] == 1
+        assert "HTTP 503" in status["last_error"]
+
+    def test_dead_letter_after_max_attempts(self, monkeypatch):
+        monkeypatch.setattr(outbox, "MAX_ATTEMPTS", 2)
+        _, outbox_id = _enqueue()
+        with patch("proxy_agent.outbox.create_post", side_effect=MoltbookError("boom")):
+            outbox.deliver_due()
+            outbox.deliver_due(now=10**12)
+        assert outbox.get_status(outbox_id)["status"] == "dead"
+
+    def test_row_claimed_by_another_worker_is_skipped(self):
+        _, outbox_id = _enqueue()
+        assert outbox._claim(outbox_id, now=outbox.time.time())
+        with patch("proxy_agent.outbox.create_post", return_value={}) as mock_post:
+            assert outbox.deliver_due() == 0
+        mock_post.assert_not_called()
+        assert outbox.get_status(outbox_id)["status"] == "sending"
+
+    def test_stale_claim_is_delivered(self):
+        _, outbox_id = _enqueue()
+        now = outbox.time.time()
+        assert outbox._claim(outbox_id, now=now)
+        with patch("proxy_agent.outbox.create_post", return_value={}):
+            assert outbox.deliver_due(now=now + outbox.SENDING_TIMEOUT_S + 1) == 1
+        assert outbox.get_status(outbox_id)["status"] == "sent"
+
+    def test_retry_reuses_idempotency_key(self):
+        _enqueue()
+        with patch("proxy_agent.outbox.create_post", side_effect=[MoltbookError("x"), {}]) as m:
+            outbox.deliver_due()
+            outbox.deliver_due(now=10**12)
+        keys = [c.kwargs["idempotency_key"] for c in m.call_args_list]
+        assert keys[0] == keys[1]
+
+    def test_rate_limit_defers_delivery(self, monkeypatch):
+        monkeypatch.setenv("OUTBOX_MOLTBOOK_RATE_PER_MIN", "1")
+        _enqueue()
+        _enqueue()
+        with patch("proxy_agent.outbox.create_post", return_value={}):
+            assert outbox.deliver_due() == 1
+
+
+class TestDraftPublish:
+    def test_publish_queues_and_returns(self):
+        with TestClient(app) as client, \
+             patch("proxy_agent.app.route_call", return_value="{}"), \
+             patch("proxy_agent.app.canonicalize", return_value="final"), \
+             patch("proxy_agent.outbox.create_post") as mock_post:
+            resp = client.post("/draft", json={
+                "title": "T", "body": "B", "submolt": "philosophy", "publish": True,
+            })
+            data = resp.json()
+            assert data["queued"] is True
+            mock_post.assert_not_called()
+            status = client.get(f"/outbox/{data['outbox_id']}").json()
+        assert status["status"] == "pending"
+
+    def test_unknown_outbox_id_404(self):
+        with TestClient(app) as client:
+            assert client.get("/outbox/12345").status_code == 404
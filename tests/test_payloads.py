@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from proxy_agent.payloads import JSON, ZLIB_V1, decode_payload, encode_payload, event_text
+
+LONG = {"title": "On memory", "body": "persistence requires recursion " * 40, "intent": "moltbook_post"}
+
+
+class TestEncodePayload:
+    def test_plain_json_by_default(self, monkeypatch):
+        monkeypatch.delenv("EVENT_PAYLOAD_CODEC", raising=False)
+        name, value = encode_payload(LONG)
+        assert name == JSON
+        assert isinstance(value, str)
+
+    def test_large_payloads_compressed(self, monkeypatch):
+        monkeypatch.setenv("EVENT_PAYLOAD_CODEC", "zlib")
+        name, value = encode_payload(LONG)
+        assert name == ZLIB_V1
+        assert isinstance(value, bytes)
+        assert len(value) < len(json.dumps(LONG)) / 4
+        assert decode_payload(name, value) == LONG
+
+    def test_small_payloads_stay_json(self, monkeypatch):
+        monkeypatch.setenv("EVENT_PAYLOAD_CODEC", "zlib")
+        monkeypatch.setenv("EVENT_COMPRESS_MIN_BYTES", "512")
+        assert encode_payload({"text": "short"})[0] == JSON
+
+    def test_unicode_round_trip(self, monkeypatch):
+        monkeypatch.setenv("EVENT_PAYLOAD_CODEC", "zlib")
+        monkeypatch.setenv("EVENT_COMPRESS_MIN_BYTES", "0")
+        payload = {"text": "Gedächtnis ist Bund — 記憶"}
+        assert decode_payload(*encode_payload(payload)) == payload
+
+
+def test_unknown_codec_rejected():
+    with pytest.raises(ValueError):
+        decode_payload("zstd9", b"")
+
+
+def test_event_text_matches_indexed_fields():
+    assert event_text("input", {"title": "T", "body": "B", "text": "x"}) == "T B"
+    assert event_text("output", {"ok": True, "text": "out"}) == "out"
+    assert event_text("output", {"ok": False, "text": "blocked"}) == ""
+    assert event_text("tool", {"title": "T"}) == ""
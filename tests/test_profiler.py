@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from contextlib import nullcontext
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent import profiler
+from proxy_agent.app import app
+
+ADMIN = {"Authorization": "Bearer s3cret"}
+
+
+@pytest.fixture(autouse=True)
+def _profiler(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_DIR", tmp_path / "profiles")
+    monkeypatch.setattr(profiler, "INTERVAL_S", 0.001)
+    monkeypatch.setattr(profiler, "_recent", type(profiler._recent)(maxlen=50))
+    monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+    yield
+    profiler.disarm()
+
+
+def _busy(seconds: float) -> None:
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def _fake_route_call(messages, purpose, **kwargs):
+    if purpose == "draft":
+        _busy(0.05)
+        return "raw draft"
+    return json.dumps({"themes": "t", "roles": [], "objectives": [], "values": [],
+                       "tensions": [], "recent_reflections": []})
+
+
+def _stages(path) -> dict:
+    totals: dict = {}
+    for line in open(path, encoding="utf-8"):
+        stack, n = line.rsplit(" ", 1)
+        totals[stack.split(";")[0]] = totals.get(stack.split(";")[0], 0) + int(n)
+    return totals
+
+
+class TestProfiler:
+    def test_off_by_default(self):
+        assert isinstance(profiler.request("draft"), nullcontext)
+        profiler.mark("draft")
+        assert profiler._threads == {}
+
+    def test_samples_split_by_stage(self):
+        result: dict = {}
+        with profiler.request("unit", forced=True, result=result):
+            profiler.mark("one")
+            _busy(0.03)
+            profiler.mark("two")
+            _busy(0.03)
+        stages = _stages(result["path"])
+        assert set(stages) <= {"start", "one", "two"}
+        assert stages["one"] > 0 and stages["two"] > 0
+        assert "test_profiler:_busy" in open(result["path"]).read()
+        sampler = profiler._sampler
+        if sampler is not None:
+            sampler.join(1)
+        assert profiler._sampler is None
+
+    def test_session_request_count(self):
+        profiler.arm(requests=2)
+        for _ in range(3):
+            with profiler.request("unit"):
+                _busy(0.01)
+        state = profiler.status()
+        assert state["armed"] is False
+        assert len(state["recent"]) == 2
+
+    def test_session_expires(self):
+        profiler.arm(seconds=0.01)
+        time.sleep(0.02)
+        with profiler.request("unit"):
+            pass
+        assert profiler.status()["armed"] is False
+
+    def test_only_profiled_thread_sampled(self):
+        stop = threading.Event()
+
+        def _idle():
+            while not stop.is_set():
+                time.sleep(0.001)
+
+        other = threading.Thread(target=_idle)
+        other.start()
+        result: dict = {}
+        with profiler.request("unit", forced=True, result=result):
+            _busy(0.02)
+        stop.set()
+        other.join()
+        assert "_idle" not in open(result["path"]).read()
+
+
+class TestProfileEndpoints:
+    @pytest.fixture()
+    def client(self):
+        with TestClient(app) as c:
+            yield c
+
+    def test_admin_token_required(self, client, monkeypatch):
+        assert client.get("/admin/profile").status_code == 403
+        assert client.post("/draft", json={"title": "T", "body": "B"},
+                           headers={"X-Profile": "wrong"}).status_code == 403
+        monkeypatch.delenv("ADMIN_TOKEN")
+        assert client.get("/admin/profile", headers=ADMIN).status_code == 404
+
+    def test_arm_and_profile_next_draft(self, client):
+        assert client.post("/admin/profile", json={}, headers=ADMIN).status_code == 422
+        state = client.post("/admin/profile", json={"requests": 1}, headers=ADMIN).json()
+        assert state["armed"] and state["remaining_requests"] == 1
+        with patch("proxy_agent.app.route_call", side_effect=_fake_route_call), \
+             patch("proxy_agent.app.canonicalize", return_value="final text"):
+            resp = client.post("/draft", json={"title": "T", "body": "B"})
+        assert resp.status_code == 200
+        assert "X-Profile-File" not in resp.headers
+        state = client.get("/admin/profile", headers=ADMIN).json()
+        assert not state["armed"]
+        assert _stages(state["recent"][0])["draft"] > 0
+
+    def test_profile_header_single_request(self, client):
+        with patch("proxy_agent.app.route_call", side_effect=_fake_route_call), \
+             patch("proxy_agent.app.canonicalize", return_value="final text"):
+            resp = client.post("/draft", json={"title": "T", "body": "B"},
+                               headers={"X-Profile": "s3cret"})
+        assert resp.status_code == 200
+        assert _stages(resp.headers["X-Profile-File"])["draft"] > 0
+        assert client.delete("/admin/profile", headers=ADMIN).json()["armed"] is False
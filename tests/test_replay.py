@@ -0,0 +1,119 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from proxy_agent import db
+from proxy_agent.memory import append_event, get_recent_events
+from proxy_agent.replay import (
+    ReplayError,
+    build_report,
+    iter_replay_items,
+    run_replay,
+)
+
+
+def _seed_source(n):
+    for i in range(n):
+        append_event("input", "user", {"title": f"T{i}", "body": f"B{i}"})
+        append_event("output", "agent", {"ok": True, "reason": "ok", "text": f"final {i}"})
+    return db.DB_PATH
+
+
+class TestIterReplayItems:
+    def test_pairs_inputs_with_outputs(self):
+        source = _seed_source(2)
+        items = list(iter_replay_items(source))
+        assert [it.request["title"] for it in items] == ["T0", "T1"]
+        assert items[1].original["text"] == "final 1"
+
+    def test_input_without_output(self):
+        append_event("input", "user", {"title": "lonely", "body": "b"})
+        items = list(iter_replay_items(db.DB_PATH))
+        assert len(items) == 1
+        assert items[0].original is None
+
+    def test_reads_jsonl_archive(self, tmp_path):
+        archive = tmp_path / "events.jsonl"
+        archive.write_text(
+            json.dumps({"id": 1, "kind": "input", "payload": {"title": "a", "body": "b"}})
+            + "\n"
+            + json.dumps({"id": 2, "kind": "output", "payload": {"ok": True, "text": "x"}})
+            + "\n"
+        )
+        items = list(iter_replay_items(archive))
+        assert items[0].original["text"] == "x"
+
+
+class TestRunReplay:
+    def _run(self, source, output, **kwargs):
+        with patch("proxy_agent.app.route_call", return_value="raw"), \
+             patch("proxy_agent.app.canonicalize", side_effect=lambda raw, themes: "final 0"):
+            return run_replay(source, output, "test", **kwargs)
+
+    def test_writes_only_to_output_db(self, tmp_path):
+        source = _seed_source(3)
+        output = tmp_path / "replay.db"
+        assert self._run(source, output, concurrency=2) == 3
+
+        db.DB_PATH = source
+        assert len(get_recent_events(100)) == 6
+        db.DB_PATH = output
+        replayed = get_recent_events(100)
+        assert [e["kind"] for e in replayed] == ["replay"] * 3
+        assert replayed[0]["payload"]["similarity"] == 1.0
+
+    def test_resumes_from_checkpoint(self, tmp_path):
+        source = _seed_source(5)
+        output = tmp_path / "replay.db"
+        assert self._run(source, output, concurrency=2, limit=2) == 2
+        db.DB_PATH = source
+        assert self._run(source, output, concurrency=2) == 3
+
+    def test_prompt_context_read_from_source(self, tmp_path):
+        from proxy_agent.memory import set_summary
+        from proxy_agent.objectives import add_objective
+
+        append_event("input", "user", {"title": "liturgy", "body": "on liturgy"})
+        add_objective("Write about ritual", "Explore liturgy")
+        conn = db.get_conn()
+        conn.execute(
+            "INSERT INTO topics(label, keywords_json, updated_ts) VALUES('liturgy', ?, 't')",
+            (json.dumps({"liturgy": 2}),),
+        )
+        conn.commit()
+        conn.close()
+        set_summary("topic:1", "Ritual as memory.")
+        output = tmp_path / "replay.db"
+        with patch("proxy_agent.app.route_call", return_value="raw") as mock_rc, \
+             patch("proxy_agent.app.canonicalize", return_value="final"):
+            run_replay(db.DB_PATH, output, "test")
+        prompt = mock_rc.call_args.args[0][1]["content"]
+        assert "- liturgy: Ritual as memory." in prompt
+        assert "- Write about ritual: Explore liturgy" in prompt
+
+    def test_gated_with_source_blocklist(self, tmp_path):
+        from proxy_agent.storage import engine
+
+        source = _seed_source(1)
+        engine().add_blocklist_pattern(r"final \d")
+        output = tmp_path / "replay.db"
+        self._run(source, output)
+        self._run(source, output)  # patterns are not copied twice
+        assert engine().blocklist_patterns() == [r"final \d"]
+        replayed = get_recent_events(1)[0]["payload"]
+        assert replayed["ok"] is False
+
+    def test_same_db_rejected(self):
+        with pytest.raises(ReplayError):
+            run_replay(db.DB_PATH, db.DB_PATH, "test")
+
+    def test_report(self, tmp_path):
+        source = _seed_source(4)
+        output = tmp_path / "replay.db"
+        self._run(source, output)
+        report = build_report(output)["test"]
+        assert report["items"] == 4
+        assert report["errors"] == 0
+        assert report["latency_ms_p50"] is not None
+        assert 0 <= report["similarity_mean"] <= 1
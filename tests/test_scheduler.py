@@ -0,0 +1,156 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent import scheduler
+from proxy_agent.app import app
+from proxy_agent.memory import get_recent_events
+from proxy_agent.scheduler import DeadlineExceeded, Overloaded, Scheduler, check_deadline
+
+LIMITS = {"interactive": (2, 4), "publish": (1, 4), "bulk": (1, 4)}
+
+
+def _wait_queued(sched: Scheduler, n: int) -> None:
+    while len(sched._waiting) < n:
+        time.sleep(0.01)
+
+
+def _start(sched: Scheduler, priority: str, order: list) -> threading.Thread:
+    def run():
+        with sched.slot(priority):
+            order.append(priority)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+class TestScheduler:
+    def test_freed_slot_goes_to_highest_priority(self):
+        sched = Scheduler(1, LIMITS)
+        held = sched.acquire("bulk")
+        order: list[str] = []
+        threads = [_start(sched, "bulk", order)]
+        _wait_queued(sched, 1)
+        threads.append(_start(sched, "interactive", order))
+        _wait_queued(sched, 2)
+        sched.release(held, 0.1)
+        for thread in threads:
+            thread.join()
+        assert order == ["interactive", "bulk"]
+
+    def test_class_limit_leaves_room_for_other_classes(self):
+        sched = Scheduler(4, LIMITS)
+        held = sched.acquire("bulk")
+        order: list[str] = []
+        waiting_bulk = _start(sched, "bulk", order)
+        _wait_queued(sched, 1)
+        with sched.slot("interactive"):
+            assert sched.stats()["classes"]["bulk"]["queued"] == 1
+        sched.release(held, 0.1)
+        waiting_bulk.join()
+        assert order == ["bulk"]
+
+    def test_full_queue_rejected_with_position_and_eta(self):
+        sched = Scheduler(1, {**LIMITS, "bulk": (1, 1)})
+        held = sched.acquire("bulk")
+        queued = threading.Thread(target=lambda: sched.release(sched.acquire("bulk"), 0))
+        queued.start()
+        _wait_queued(sched, 1)
+        with pytest.raises(Overloaded) as exc:
+            sched.acquire("bulk")
+        assert exc.value.position == 2
+        assert exc.value.eta_s > 0
+        sched.release(held, 0.1)
+        queued.join()
+
+    def test_free_slot_admitted_with_zero_queue(self):
+        sched = Scheduler(1, {**LIMITS, "interactive": (1, 0)})
+        sched.release(sched.acquire("interactive"), 0.1)
+
+    def test_deadline_while_queued(self):
+        sched = Scheduler(1, LIMITS)
+        held = sched.acquire("interactive")
+        with pytest.raises(DeadlineExceeded):
+            sched.acquire("interactive", deadline=time.monotonic() + 0.05)
+        assert sched._waiting == []
+        sched.release(held, 0.1)
+
+    def test_extra_slots_only_from_free_class_capacity(self):
+        sched = Scheduler(4, LIMITS)
+        held = sched.acquire("interactive")
+        with sched.slot("interactive", extra=3) as slots:
+            assert slots == 1
+            assert scheduler.granted_slots(3) == 1
+        sched.release(held, 0.1)
+        with sched.slot("interactive", extra=3) as slots:
+            assert slots == 2
+            assert sched.stats()["classes"]["interactive"]["running"] == 2
+        assert sched.running == 0
+        assert scheduler.granted_slots(3) == 3  # outside a slot
+
+    def test_extra_slots_not_taken_from_waiters(self):
+        sched = Scheduler(2, LIMITS)
+        held = sched.acquire("bulk")
+        order: list[str] = []
+        waiting = _start(sched, "bulk", order)
+        _wait_queued(sched, 1)
+        ticket = sched.acquire("interactive")
+        sched.release(held, 0.1)
+        assert sched.take_extra(ticket, 1) == 0
+        waiting.join()
+        sched.release(ticket, 0.1)
+        assert order == ["bulk"]
+
+    def test_check_deadline_inside_slot(self):
+        sched = Scheduler(1, LIMITS)
+        check_deadline("anything")  # no deadline outside a slot
+        with sched.slot("interactive", deadline=time.monotonic() - 1):
+            with pytest.raises(DeadlineExceeded):
+                check_deadline("voice")
+
+
+class TestDraftAdmission:
+    @pytest.fixture()
+    def client(self):
+        with TestClient(app) as c:
+            yield c
+
+    def test_overloaded_returns_503(self, client, monkeypatch):
+        sched = Scheduler(1, {**LIMITS, "interactive": (1, 0)})
+        monkeypatch.setattr(scheduler, "SCHEDULER", sched)
+        held = sched.acquire("bulk")
+        resp = client.post("/draft", json={"title": "T", "body": "B"})
+        sched.release(held, 0.1)
+        assert resp.status_code == 503
+        assert resp.json()["queue_position"] == 1
+        assert int(resp.headers["retry-after"]) >= 1
+
+    def test_deadline_cancels_remaining_stages(self, client):
+        def slow_draft(*args, **kwargs):
+            time.sleep(0.2)
+            return "raw"
+
+        with patch("proxy_agent.app.route_call", side_effect=slow_draft), \
+             patch("proxy_agent.app.canonicalize") as mock_voice:
+            resp = client.post(
+                "/draft",
+                json={"title": "T", "body": "B"},
+                headers={"X-Request-Timeout": "0.1"},
+            )
+        assert resp.status_code == 504
+        mock_voice.assert_not_called()
+        assert [e["kind"] for e in get_recent_events()] == ["input"]
+
+    def test_priority_header_validated(self, client):
+        resp = client.post(
+            "/draft", json={"title": "T", "body": "B"}, headers={"X-Draft-Priority": "urgent"}
+        )
+        assert resp.status_code == 422
+
+    def test_stats(self, client):
+        stats = client.get("/scheduler").json()
+        assert set(stats["classes"]) == {"interactive", "publish", "bulk"}
@@ -0,0 +1,117 @@
+"""Conformance suite: every storage engine must pass these tests."""
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent import db, storage
+from proxy_agent.app import app
+from proxy_agent.db import get_conn
+from proxy_agent.memory import append_event, get_recent_events
+from proxy_agent.publish_gate import check_publishable
+from proxy_agent.storage import IdentityConflict, MemoryEngine, SQLiteEngine
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def engine(request):
+    return SQLiteEngine() if request.param == "sqlite" else MemoryEngine()
+
+
+def _fill(engine) -> None:
+    engine.append_event("input", "user", {"title": "T", "body": "B"})
+    engine.append_event("output", "agent", {"ok": True, "text": "é"})
+    engine.set_summary("self", "hello")
+    first = engine.append_identity({"themes": "a"}, None)
+    engine.append_identity({"themes": "b"}, first)
+    engine.add_blocklist_pattern(r"SECRET_\d+")
+
+
+class TestConformance:
+    def test_event_ids_and_order(self, engine):
+        ids = [engine.append_event("input", "user", {"n": n}) for n in range(5)]
+        assert ids == [1, 2, 3, 4, 5]
+        recent = engine.recent_events(3)
+        assert [e["payload"]["n"] for e in recent] == [2, 3, 4]
+        assert [e.id for e in recent] == [3, 4, 5]
+        assert recent[0]["kind"] == "input" and recent[0]["source"] == "user"
+        assert recent[0]["ts"]
+
+    def test_empty(self, engine):
+        assert engine.recent_events(10) == []
+        assert engine.get_summary("missing") == ""
+        assert engine.latest_identity() is None
+        assert engine.blocklist_patterns() == []
+
+    def test_payloads_are_copies(self, engine):
+        engine.append_event("output", "agent", {"tags": ["a"]})
+        engine.recent_events(1)[0]["payload"]["tags"].append("b")
+        assert engine.recent_events(1)[0]["payload"] == {"tags": ["a"]}
+
+    def test_summaries_overwrite(self, engine):
+        engine.set_summary("self", "one")
+        engine.set_summary("self", "two")
+        assert engine.get_summary("self") == "two"
+
+    def test_identity_compare_and_swap(self, engine):
+        first = engine.append_identity({"themes": "a"}, None)
+        with pytest.raises(IdentityConflict):
+            engine.append_identity({"themes": "x"}, None)
+        second = engine.append_identity({"themes": "b"}, first)
+        with pytest.raises(IdentityConflict):
+            engine.append_identity({"themes": "x"}, first)
+        latest_id, model = engine.latest_identity()
+        assert (latest_id, model) == (second, {"themes": "b"})
+        model["themes"] = "mutated"
+        assert engine.latest_identity()[1] == {"themes": "b"}
+
+    def test_blocklist_in_insertion_order(self, engine):
+        engine.add_blocklist_pattern("a+")
+        engine.add_blocklist_pattern("b+")
+        assert engine.blocklist_patterns() == ["a+", "b+"]
+
+
+class TestMemoryEngine:
+    def test_snapshot_round_trip(self, tmp_path):
+        source = MemoryEngine()
+        _fill(source)
+        path = tmp_path / "snap.db"
+        source.snapshot(path)
+        loaded = MemoryEngine.load(path)
+        assert loaded.recent_events(10) == source.recent_events(10)
+        assert loaded.get_summary("self") == "hello"
+        assert loaded.latest_identity() == source.latest_identity()
+        assert loaded.blocklist_patterns() == [r"SECRET_\d+"]
+        with pytest.raises(ValueError):
+            source.snapshot(path)
+
+    def test_load_from_sqlite_engine(self):
+        sqlite_engine = SQLiteEngine()
+        _fill(sqlite_engine)
+        loaded = MemoryEngine.load(db.DB_PATH)
+        assert loaded.recent_events(10) == sqlite_engine.recent_events(10)
+        assert loaded.latest_identity() == sqlite_engine.latest_identity()
+
+    def test_selected_by_config(self, monkeypatch):
+        monkeypatch.setattr(storage, "STORAGE_ENGINE", "memory")
+        monkeypatch.setattr(storage, "_memory_engines", {})
+        append_event("output", "agent", {"text": "in memory"})
+        storage.engine().add_blocklist_pattern("in memory")
+        assert get_recent_events()[0]["payload"]["text"] == "in memory"
+        assert check_publishable("kept in memory")[0] is False
+        conn = get_conn()
+        assert conn.execute("SELECT count(*) FROM events").fetchone()[0] == 0
+        conn.close()
+
+    def test_server_refuses_memory_engine(self, monkeypatch):
+        # The outbox writes output events to SQLite whatever the engine.
+        monkeypatch.setattr(storage, "STORAGE_ENGINE", "memory")
+        with pytest.raises(ValueError, match="AGENT_STORAGE=sqlite"):
+            with TestClient(app):
+                pass
+
+    def test_engines_implement_every_operation(self):
+        class Partial(storage.StorageEngine):
+            def append_event(self, kind, source, payload):
+                return 1
+
+        with pytest.raises(TypeError):
+            Partial()
@@ -0,0 +1,97 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from proxy_agent import app, structured
+from proxy_agent.app import _update_identity_model
+from proxy_agent.memory import IdentityConflict, get_identity_model
+from proxy_agent.prompts import IDENTITY_MODEL_SCHEMA
+from proxy_agent.structured import StructuredOutputError, parse_json_object, parse_response
+
+MODEL = {
+    "themes": "recursion",
+    "roles": ["witness"],
+    "objectives": [],
+    "values": ["clarity"],
+    "tensions": [],
+    "recent_reflections": [3],
+}
+
+
+@pytest.fixture(autouse=True)
+def _reset_counts(monkeypatch):
+    monkeypatch.setattr(structured, "_counts", structured.Counter())
+
+
+class TestParseJsonObject:
+    def test_clean_json(self):
+        assert parse_json_object(json.dumps(MODEL)) == (MODEL, False)
+
+    def test_markdown_fence(self):
+        text = f"```json\n{json.dumps(MODEL, indent=2)}\n```"
+        assert parse_json_object(text) == (MODEL, True)
+
+    def test_surrounding_commentary(self):
+        text = f'Here is the update: {json.dumps({"themes": "a {brace} inside"})} Hope it helps.'
+        assert parse_json_object(text) == ({"themes": "a {brace} inside"}, True)
+
+    def test_skips_broken_leading_braces(self):
+        assert parse_json_object('{oops} then {"a": 1}') == ({"a": 1}, True)
+
+    def test_no_object(self):
+        with pytest.raises(StructuredOutputError):
+            parse_json_object("I cannot help with that.")
+        with pytest.raises(StructuredOutputError):
+            parse_json_object("[1, 2]")
+
+
+class TestParseResponse:
+    def test_counts_outcomes(self):
+        parse_response(json.dumps(MODEL), IDENTITY_MODEL_SCHEMA, "summarize")
+        parse_response(f"```\n{json.dumps(MODEL)}\n```", IDENTITY_MODEL_SCHEMA, "summarize")
+        with pytest.raises(StructuredOutputError):
+            parse_response("nope", IDENTITY_MODEL_SCHEMA, "summarize")
+        assert structured.counts() == {"summarize": {"discarded": 1, "parsed": 1, "repaired": 1}}
+
+    def test_schema_violations_discarded(self):
+        with pytest.raises(StructuredOutputError, match="Missing keys: themes"):
+            parse_response(
+                json.dumps({k: v for k, v in MODEL.items() if k != "themes"}),
+                IDENTITY_MODEL_SCHEMA,
+                "summarize",
+            )
+        with pytest.raises(StructuredOutputError, match="Expected string"):
+            parse_response(json.dumps({**MODEL, "values": [1]}), IDENTITY_MODEL_SCHEMA, "s")
+
+
+class TestIdentityUpdate:
+    def test_fenced_response_repaired_and_stored(self):
+        fenced = f"```json\n{json.dumps(MODEL)}\n```"
+        with patch("proxy_agent.app.route_call", return_value=fenced) as mock_rc:
+            _update_identity_model()
+        assert mock_rc.call_args.kwargs["json_schema"] == IDENTITY_MODEL_SCHEMA
+        assert get_identity_model()["roles"] == ["witness"]
+        assert structured.counts()["summarize"] == {"repaired": 1}
+
+    def test_missing_optional_keys_filled_from_defaults(self):
+        partial = {k: v for k, v in MODEL.items() if k != "recent_reflections"}
+        with patch("proxy_agent.app.route_call", return_value=json.dumps(partial)):
+            _update_identity_model()
+        assert get_identity_model() == {**MODEL, "recent_reflections": []}
+        assert structured.counts()["summarize"] == {"parsed": 1}
+
+    def test_unusable_response_keeps_previous_model(self):
+        before = get_identity_model()
+        with patch("proxy_agent.app.route_call", return_value="no json here"):
+            _update_identity_model()
+        assert get_identity_model() == before
+        assert structured.counts()["summarize"] == {"discarded": 1}
+
+    def test_conflicts_retried_up_to_the_attempt_limit(self, monkeypatch):
+        monkeypatch.setattr(app, "IDENTITY_UPDATE_ATTEMPTS", 2)
+        with patch("proxy_agent.app.route_call", return_value=json.dumps(MODEL)) as mock_rc, \
+             patch("proxy_agent.app.set_identity_model", side_effect=IdentityConflict("moved")):
+            _update_identity_model()
+        # Every retry is recomputed with a fresh summarize call.
+        assert mock_rc.call_count == 2
@@ -0,0 +1,122 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent import db, tenancy
+from proxy_agent.app import app
+from proxy_agent.memory import append_event, get_recent_events
+from proxy_agent.tenancy import HashRing
+
+
+@pytest.fixture()
+def data_dir(tmp_path, monkeypatch):
+    path = tmp_path / "identities"
+    monkeypatch.setattr(db, "DATA_DIR", path)
+    for name in ("alpha", "beta"):
+        db.create_identity(name)
+    return path
+
+
+@pytest.fixture()
+def client(data_dir):
+    with TestClient(app) as c:
+        yield c
+
+
+def _draft(client, path="/draft", headers=None):
+    with patch("proxy_agent.app.route_call", return_value="{}"), \
+         patch("proxy_agent.app.canonicalize", return_value="text"):
+        return client.post(path, json={"title": "T", "body": "B"}, headers=headers)
+
+
+class TestShards:
+    def test_identities_are_isolated(self, data_dir):
+        with db.use_identity("alpha"):
+            append_event("input", "user", {"who": "alpha"})
+        with db.use_identity("beta"):
+            assert get_recent_events() == []
+        assert get_recent_events() == []
+        assert (data_dir / "alpha.db").exists()
+
+    def test_invalid_name_rejected(self, data_dir):
+        with pytest.raises(ValueError):
+            with db.use_identity("../escape"):
+                pass
+
+    def test_unknown_identity_not_created(self, data_dir):
+        with pytest.raises(db.UnknownIdentity):
+            with db.use_identity("gamma"):
+                pass
+        assert not (data_dir / "gamma.db").exists()
+        assert db.create_identity("gamma")
+        assert not db.create_identity("gamma")
+
+    def test_lru_eviction(self, data_dir, monkeypatch):
+        monkeypatch.setattr(db, "MAX_OPEN_SHARDS", 2)
+        for name in ("a", "b", "c"):
+            db.create_identity(name)
+            with db.use_identity(name):
+                append_event("input", "user", {"who": name})
+        assert str(data_dir / "a.db") not in db._shards
+        with db.use_identity("a"):
+            assert get_recent_events()[0]["payload"] == {"who": "a"}
+
+    def test_known_identities(self, data_dir):
+        assert db.known_identities() == [None, "alpha", "beta"]
+
+
+class TestMiddleware:
+    def test_header_selects_identity(self, client, data_dir):
+        assert _draft(client, headers={"X-Agent-Identity": "alpha"}).status_code == 200
+        with db.use_identity("alpha"):
+            assert [e["kind"] for e in get_recent_events()] == ["input", "output"]
+        assert get_recent_events() == []
+
+    def test_path_prefix_selects_identity(self, client, data_dir):
+        assert _draft(client, path="/i/beta/draft").status_code == 200
+        resp = client.get("/i/beta/identity")
+        assert resp.status_code == 200
+        with db.use_identity("beta"):
+            assert len(get_recent_events()) == 2
+
+    def test_invalid_identity_returns_400(self, client):
+        assert _draft(client, headers={"X-Agent-Identity": "bad name!"}).status_code == 400
+
+    def test_unknown_identity_returns_404(self, client, data_dir):
+        assert _draft(client, headers={"X-Agent-Identity": "gamma"}).status_code == 404
+        assert client.get("/i/gamma/identity").status_code == 404
+        assert not (data_dir / "gamma.db").exists()
+
+    def test_admin_creates_identity(self, client, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        auth = {"Authorization": "Bearer secret"}
+        assert client.put("/admin/identities/gamma").status_code == 403
+        assert client.put("/admin/identities/gamma", headers=auth).status_code == 201
+        assert client.put("/admin/identities/gamma", headers=auth).status_code == 200
+        listed = client.get("/admin/identities", headers=auth).json()["identities"]
+        assert listed == ["alpha", "beta", "gamma"]
+        assert _draft(client, headers={"X-Agent-Identity": "gamma"}).status_code == 200
+
+    def test_misdirected_identity_returns_421(self, client, monkeypatch):
+        ring = HashRing(["node-a", "node-b"])
+        monkeypatch.setattr(tenancy, "RING", ring)
+        monkeypatch.setattr(tenancy, "NODE_NAME", "node-a")
+        foreign = next(f"id{i}" for i in range(100) if ring.node_for(f"id{i}") == "node-b")
+        resp = _draft(client, headers={"X-Agent-Identity": foreign})
+        assert resp.status_code == 421
+        assert resp.json()["node"] == "node-b"
+
+
+class TestHashRing:
+    def test_stable_mapping(self):
+        ring = HashRing(["a", "b", "c"])
+        assert ring.node_for("agent-1") == HashRing(["a", "b", "c"]).node_for("agent-1")
+
+    def test_adding_node_moves_few_identities(self):
+        names = [f"agent-{i}" for i in range(1000)]
+        before = HashRing(["a", "b", "c"])
+        after = HashRing(["a", "b", "c", "d"])
+        moved = sum(1 for n in names if before.node_for(n) != after.node_for(n))
+        assert moved < 400
+        assert all(after.node_for(n) == "d" for n in names if before.node_for(n) != after.node_for(n))
@@ -0,0 +1,116 @@
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from proxy_agent import topics
+from proxy_agent.app import DraftRequest, _generate, app
+from proxy_agent.db import get_conn
+from proxy_agent.memory import DEFAULT_IDENTITY_MODEL, append_event, get_summary
+
+MEMORY_TEXT = "Memory persistence recursion covenant agents remember identity continuity"
+GARDEN_TEXT = "Gardening tomatoes soil compost watering seedlings harvest sunlight"
+SECRET_TEXT = "my key sk-abcdefghijklmnopqrstuvwxyzabcdef keeps memory"
+
+
+def _output(text):
+    return append_event("output", "agent", {"ok": True, "reason": "ok", "text": text})
+
+
+class TestAssign:
+    def test_similar_outputs_share_a_topic(self):
+        _output(MEMORY_TEXT)
+        _output(MEMORY_TEXT + " again")
+        _output(GARDEN_TEXT)
+        assert topics.assign_new_outputs() == 3
+        # Nothing is summarized yet, so nothing is visible to readers.
+        assert topics.refresh_cache() == []
+        conn = get_conn()
+        counts = [r["event_count"] for r in conn.execute("SELECT event_count FROM topics")]
+        conn.close()
+        assert sorted(counts) == [1, 2]
+
+    def test_watermark_skips_assigned_events(self):
+        _output(MEMORY_TEXT)
+        topics.assign_new_outputs()
+        assert topics.assign_new_outputs() == 0
+
+    def test_inputs_are_ignored(self):
+        append_event("input", "user", {"title": "t", "body": MEMORY_TEXT})
+        assert topics.assign_new_outputs() == 0
+
+
+    def test_blocked_outputs_are_ignored(self, monkeypatch):
+        append_event("output", "agent", {"ok": False, "reason": "secret", "text": SECRET_TEXT})
+        assert topics.assign_new_outputs() == 0
+        # Compressed payloads are not readable from SQL and are checked on decode.
+        monkeypatch.setenv("EVENT_COMPRESS_MIN_BYTES", "0")
+        append_event("output", "agent", {"ok": False, "reason": "secret", "text": SECRET_TEXT})
+        topics.assign_new_outputs()
+        conn = get_conn()
+        assert conn.execute("SELECT count(*) FROM topics").fetchone()[0] == 0
+        conn.close()
+
+
+class TestSummarize:
+    def test_only_dirty_topics_are_summarized(self):
+        _output(MEMORY_TEXT)
+        topics.assign_new_outputs()
+        with patch("proxy_agent.topics.route_call", return_value="summary v1") as mock_rc:
+            assert topics.summarize_dirty() == 1
+            assert topics.summarize_dirty() == 0
+        assert mock_rc.call_count == 1
+        assert get_summary("topic:1") == "summary v1"
+
+    def test_blocked_summary_not_stored(self):
+        _output(MEMORY_TEXT)
+        topics.assign_new_outputs()
+        with patch("proxy_agent.topics.route_call", return_value=f"about {SECRET_TEXT}"):
+            assert topics.summarize_dirty() == 0
+        assert get_summary("topic:1") == ""
+        # Not retried until the topic gets a new event.
+        with patch("proxy_agent.topics.route_call") as mock_rc:
+            topics.summarize_dirty()
+        mock_rc.assert_not_called()
+
+    def test_new_event_makes_topic_dirty_again(self):
+        _output(MEMORY_TEXT)
+        topics.assign_new_outputs()
+        with patch("proxy_agent.topics.route_call", return_value="v1"):
+            topics.summarize_dirty()
+        _output(MEMORY_TEXT + " later")
+        topics.assign_new_outputs()
+        with patch("proxy_agent.topics.route_call", return_value="v2") as mock_rc:
+            assert topics.summarize_dirty() == 1
+        assert "v1" in mock_rc.call_args[0][0][1]["content"]
+
+
+class TestReaders:
+    def _maintained(self):
+        _output(MEMORY_TEXT)
+        _output(GARDEN_TEXT)
+        summaries = ["memory summary", "garden summary"]
+        with patch("proxy_agent.topics.route_call", side_effect=summaries):
+            topics.maintain()
+
+    def test_relevant_topics(self):
+        self._maintained()
+        related = topics.relevant_topics("How does memory shape identity continuity?", k=1)
+        assert [t["summary"] for t in related] == ["memory summary"]
+
+    def test_draft_prompt_includes_relevant_topics(self):
+        self._maintained()
+        req = DraftRequest(title="Memory", body="On persistence and recursion")
+        with patch("proxy_agent.app.route_call", return_value="raw") as mock_rc, \
+             patch("proxy_agent.app.canonicalize", return_value="final"):
+            _generate(req, DEFAULT_IDENTITY_MODEL)
+        prompt = mock_rc.call_args[0][0][1]["content"]
+        assert "memory summary" in prompt
+        assert "garden summary" not in prompt
+
+    def test_identity_endpoint_returns_cached_topics(self):
+        self._maintained()
+        with TestClient(app) as client:
+            data = client.get("/identity").json()
+        assert {t["summary"] for t in data["topic_summaries"]} == {
+            "memory summary", "garden summary",
+        }
@@ -0,0 +1,74 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent.app import app
+from proxy_agent.llms import BudgetExceeded, LLMResult, Usage
+from proxy_agent.memory import get_identity_version
+from proxy_agent.usage import get_rollup, record_usage, summarize_by_purpose, tokens_this_hour
+
+
+def _result(purpose="draft", model="m", usage=Usage(10, 5)):
+    return LLMResult("x", usage, backend="ollama", model=model, purpose=purpose, latency_ms=2.0)
+
+
+class TestRollup:
+    def test_calls_aggregate_into_one_row(self):
+        record_usage(_result())
+        record_usage(_result())
+        rows = get_rollup()
+        assert len(rows) == 1
+        assert rows[0]["calls"] == 2
+        assert rows[0]["input_tokens"] == 20
+        assert rows[0]["latency_ms"] == 4.0
+
+    def test_rows_split_by_model(self):
+        record_usage(_result(model="a"))
+        record_usage(_result(model="b"))
+        assert len(get_rollup()) == 2
+
+    def test_cost_summed_from_results(self):
+        record_usage(LLMResult("x", Usage(1, 1), backend="ollama", model="m", purpose="draft", cost_usd=0.5))
+        record_usage(LLMResult("x", Usage(1, 1), backend="ollama", model="m", purpose="draft", cost_usd=0.25))
+        assert get_rollup()[0]["cost_usd"] == pytest.approx(0.75)
+
+    def test_tokens_this_hour_per_purpose(self):
+        record_usage(_result(purpose="draft"))
+        record_usage(_result(purpose="summarize"))
+        assert tokens_this_hour("draft") == 15
+
+    def test_summarize_by_purpose(self):
+        record_usage(_result(purpose="draft", model="a"))
+        record_usage(_result(purpose="draft", model="b"))
+        totals = summarize_by_purpose(get_rollup())
+        assert totals["draft"]["calls"] == 2
+        assert totals["draft"]["output_tokens"] == 10
+
+
+class TestEndpoints:
+    def test_usage_endpoint(self):
+        record_usage(_result())
+        with TestClient(app) as client:
+            data = client.get("/usage").json()
+        assert data["by_purpose"]["draft"]["calls"] == 1
+
+    def test_identity_update_skipped_when_budget_exhausted(self):
+        def fake_route_call(messages, purpose, **kwargs):
+            if purpose == "summarize":
+                raise BudgetExceeded("over")
+            return "raw"
+
+        with TestClient(app) as client, \
+             patch("proxy_agent.app.route_call", side_effect=fake_route_call), \
+             patch("proxy_agent.app.canonicalize", return_value="final"):
+            before = get_identity_version()[0]
+            resp = client.post("/draft", json={"title": "T", "body": "B"})
+            assert resp.status_code == 200
+            assert get_identity_version()[0] == before
+
+    def test_draft_budget_returns_429(self):
+        with TestClient(app) as client, \
+             patch("proxy_agent.app.route_call", side_effect=BudgetExceeded("over")):
+            resp = client.post("/draft", json={"title": "T", "body": "B"})
+        assert resp.status_code == 429
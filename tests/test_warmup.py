@@ -0,0 +1,147 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from proxy_agent import llms, warmup
+from proxy_agent.app import app
+from proxy_agent.llms import call_ollama
+
+
+@pytest.fixture(autouse=True)
+def _enabled(monkeypatch):
+    monkeypatch.setenv("WARMUP", "1")
+    monkeypatch.setattr(warmup, "_state", {})
+    monkeypatch.setattr(warmup, "_thread", None)
+    monkeypatch.setattr(warmup, "_stop", None)
+    monkeypatch.setattr(warmup, "_on_ready", None)
+    monkeypatch.setattr(warmup, "RETRY_BASE_S", 0.01)
+    yield
+    if warmup._stop is not None:
+        warmup._stop.set()
+        warmup._thread.join()
+
+
+def _wait_ready() -> dict:
+    deadline = time.monotonic() + 5
+    while not warmup.readiness()[0] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return warmup.readiness()[1]
+
+
+def _ok(status_code=200):
+    response = MagicMock()
+    response.status_code = status_code
+    return response
+
+
+class TestWarmUp:
+    def test_opens_connection_per_purpose(self):
+        readied = []
+        with patch("proxy_agent.llms._SESSION.head", return_value=_ok(404)) as mock_head:
+            warmup.warm_up(on_ready=lambda: readied.append(1))
+        assert readied == [1]
+        assert mock_head.call_count == 3
+        assert mock_head.call_args[0][0] == "https://api.openai.com/v1"
+        assert warmup.readiness()[0] is True
+
+    def test_ollama_preloaded_with_keep_alive(self, monkeypatch):
+        monkeypatch.setenv("LLM_DRAFT_BACKEND", "ollama")
+        monkeypatch.setenv("LLM_DRAFT_MODEL", "llama3.1")
+        monkeypatch.setenv("OLLAMA_KEEP_ALIVE", "2h")
+        with patch("proxy_agent.llms._SESSION.head", return_value=_ok()), \
+             patch("proxy_agent.llms._SESSION.post", return_value=_ok()) as mock_post:
+            warmup.warm_purpose("draft")
+        assert mock_post.call_args[0][0] == "http://localhost:11434/api/generate"
+        assert mock_post.call_args.kwargs["json"] == {"model": "llama3.1", "keep_alive": "2h"}
+
+    def test_failure_reported_per_backend(self, monkeypatch):
+        monkeypatch.setenv("LLM_VOICE_BACKEND", "claude")
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", "https://claude.invalid")
+
+        def head(url, timeout):
+            if "claude" in url:
+                raise ConnectionError("refused")
+            return _ok()
+
+        readied = []
+        with patch("proxy_agent.llms._SESSION.head", side_effect=head):
+            warmup.warm_up(on_ready=lambda: readied.append(1))
+        assert readied == []
+        ready, state = warmup.readiness()
+        assert ready is False
+        assert state["voice"]["status"] == "failed"
+        assert "refused" in state["voice"]["error"]
+        assert state["draft"]["status"] == "ready"
+
+    def test_failed_purpose_retried_in_background(self):
+        attempts = []
+
+        def head(url, timeout):
+            attempts.append(url)
+            if len(attempts) <= 4:
+                raise ConnectionError("not up yet")
+            return _ok()
+
+        readied = []
+        with patch("proxy_agent.llms._SESSION.head", side_effect=head):
+            warmup.start(on_ready=lambda: readied.append(1))
+            state = _wait_ready()
+        assert all(info["status"] == "ready" for info in state.values())
+        assert readied == [1]
+        assert len(attempts) > 3
+
+    def test_restart_warms_reloaded_routes(self, monkeypatch):
+        with patch("proxy_agent.llms._SESSION.head", return_value=_ok()), \
+             patch("proxy_agent.llms._SESSION.post", return_value=_ok()):
+            warmup.start()
+            assert _wait_ready()["draft"]["backend"] == "openai_compat"
+            monkeypatch.setenv("LLM_DRAFT_BACKEND", "ollama")
+            llms.reload()
+            warmup.start()
+            warmup._thread.join()
+        assert warmup.readiness()[1]["draft"]["backend"] == "ollama"
+
+    def test_probe_calls_each_purpose(self, monkeypatch):
+        monkeypatch.setenv("WARMUP_PROBE", "1")
+        with patch("proxy_agent.llms._SESSION.head", return_value=_ok()), \
+             patch("proxy_agent.warmup.llms.route_call", return_value="OK") as mock_rc:
+            warmup.warm_up()
+        assert sorted(c.kwargs["purpose"] for c in mock_rc.call_args_list) == [
+            "draft", "summarize", "voice",
+        ]
+
+
+def test_ollama_calls_send_keep_alive(monkeypatch):
+    response = _ok()
+    response.json.return_value = {"message": {"content": "ok"}}
+    with patch("proxy_agent.llms._SESSION.post", return_value=response) as mock_post:
+        call_ollama("m", [], keep_alive="10m")
+    assert mock_post.call_args.kwargs["json"]["keep_alive"] == "10m"
+
+
+class TestEndpoints:
+    def test_ready_separate_from_health(self):
+        with patch("proxy_agent.warmup.start"), TestClient(app) as client:
+            assert client.get("/health").json() == {"status": "ok"}
+            resp = client.get("/ready")
+            assert resp.status_code == 503
+            warmup._set("draft", status="ready")
+            warmup._set("voice", status="failed", error="x")
+            resp = client.get("/ready")
+            assert resp.status_code == 503
+            assert resp.json()["backends"]["voice"]["status"] == "failed"
+            warmup._set("voice", status="ready")
+            assert client.get("/ready").status_code == 200
+
+    def test_route_reload_restarts_warm_up(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_TOKEN", "t")
+        with patch("proxy_agent.warmup.start") as mock_start, TestClient(app) as client:
+            client.post("/admin/routes/reload", headers={"Authorization": "Bearer t"})
+        assert mock_start.call_count == 2  # startup and reload
+
+    def test_ready_when_disabled(self, monkeypatch):
+        monkeypatch.setenv("WARMUP", "0")
+        with TestClient(app) as client:
+            assert client.get("/ready").status_code == 200